@@ -1,5 +1,14 @@
 #
 from .aioblescan import *
+from .offload import DecodePipeline, decode_chunk
+from .multiscanner import MultiScanner
+from .dispatch import Signature, Dispatcher, ad_structures
+from .state import DeviceTable
+from .cache import DecodeCache
+from .metrics import Metrics, Histogram
+from .profiling import StageProfiler
+from .capture import BTSNOOP, PCAP, CaptureRecord, CaptureWriter, read_capture
+from .capture import ReplayTransport, replay, CaptureIndex
 from . import plugins
 
-__version__ = "0.2.8s"
+__version__ = "0.2.14"
@@ -22,6 +22,7 @@
 # WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
 # IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
 import sys
+import signal
 import asyncio
 import argparse
 import re
@@ -36,6 +37,7 @@ from aioblescan.plugins import Tilt
 # global
 opts = None
 decoders = []
+dispatcher = None
 
 
 def check_mac(val):
@@ -47,9 +49,25 @@ def check_mac(val):
     raise argparse.ArgumentTypeError("%s is not a MAC address" % val)
 
 
+def show_result(leader, xx):
+    # Some results, Eddystone UID for instance, hold bytes
+    xx = json.dumps(xx, default=lambda x: x.hex() if isinstance(x, bytes) else str(x))
+    if opts.leader:
+        print(f"{leader} {xx}")
+    else:
+        print(f"{xx}")
+
+
 def my_process(data):
     global opts
 
+    if dispatcher is not None and not (opts.mac or opts.raw):
+        # Only decode what one of the decoders may want
+        found = dispatcher.decode(data)
+        if found:
+            show_result(decoders[found[0]][0], found[1])
+        return
+
     ev = aiobs.HCI_Event()
     xx = ev.decode(data)
     if opts.mac:
@@ -65,18 +83,43 @@ def my_process(data):
     if opts.raw:
         print("Raw data: {}".format(ev.raw_data))
     if decoders:
-        for leader, decoder in decoders:
-            xx = decoder.decode(ev)
-            if xx:
-                if opts.leader:
-                    print(f"{leader} {json.dumps(xx)}")
-                else:
-                    print(f"{json.dumps(xx)}")
-                break
+        with ev.indexed():
+            for leader, decoder in decoders:
+                xx = decoder.decode(ev)
+                if xx:
+                    show_result(leader, xx)
+                    break
     else:
         ev.show(0)
 
 
+async def fill_accept_list(btctrl, macs):
+    """Only let the given devices get past the controller.
+
+    Their address type is not known, so they are added as both public and random.
+
+        :param btctrl: The requester
+        :type btctrl: BLEScanRequester
+        :param macs: The MAC addresses, possibly repeated
+        :type macs: list
+        :returns: What went wrong, or None
+        :rtype: str
+    """
+    await btctrl.clear_accept_list()
+    for mac in dict.fromkeys(macs):
+        for addr_type in (0, 1):
+            try:
+                ev = await btctrl.add_to_accept_list(mac, addr_type)
+            except asyncio.TimeoutError:
+                return "No answer adding {} to the accept list".format(mac)
+            status = ev.retrieve("resp code")[0].val[0]
+            if status:
+                return "Could not add {} to the accept list, error 0x{:02x}".format(
+                    mac, status
+                )
+    return None
+
+
 async def amain(args=None):
     global opts
 
@@ -94,6 +137,22 @@ async def amain(args=None):
     )
     # Attach your processing
     btctrl.process = my_process
+    if (decoders or opts.mac) and not opts.raw:
+        # Only advertising reports can be shown, the rest is not even decoded
+        for category in (aiobs.COMMAND_COMPLETE, aiobs.DISCONNECT, aiobs.VENDOR):
+            btctrl.routes[category] = None
+        btctrl.routes[aiobs.OTHER] = None
+    if opts.metrics_port:
+        metrics = aiobs.Metrics()
+        metrics.attach(btctrl)
+        if dispatcher is not None:
+            dispatcher.metrics = metrics
+        await metrics.serve(port=opts.metrics_port)
+    if opts.profile is not None:
+        profiler = aiobs.StageProfiler(every=opts.profile)
+        profiler.enable(btctrl, [decoder for leader, decoder in decoders])
+        if hasattr(signal, "SIGUSR1"):
+            event_loop.add_signal_handler(signal.SIGUSR1, profiler.on_report)
     if opts.advertise:
         command = aiobs.HCI_Cmd_LE_Advertise(enable=False)
         await btctrl.send_command(command)
@@ -111,8 +170,19 @@ async def amain(args=None):
         await btctrl.send_command(command)
         command = aiobs.HCI_Cmd_LE_Advertise(enable=True)
         await btctrl.send_command(command)
+    if opts.accept_list and opts.mac:
+        failed = await fill_accept_list(btctrl, opts.mac)
+        if failed:
+            # Scanning would silently miss the devices left out
+            print(failed)
+            conn.close()
+            return
     # Probe
-    await btctrl.send_scan_request()
+    await btctrl.send_scan_request(
+        accept_list=bool(opts.accept_list and opts.mac),
+        filter_dups=opts.filter_dups is not None,
+        dups_reset=opts.filter_dups or 0,
+    )
     try:
         while True:
             await asyncio.sleep(3600)
@@ -128,7 +198,7 @@ async def amain(args=None):
 
 
 def main():
-    global opts
+    global opts, dispatcher
 
     parser = argparse.ArgumentParser(description="Track BLE advertised packets")
     parser.add_argument(
@@ -145,6 +215,20 @@ def main():
         action="append",
         help="Look for these MAC addresses.",
     )
+    parser.add_argument(
+        "--accept-list",
+        action="store_true",
+        default=False,
+        help="Have the controller only report the --mac addresses.",
+    )
+    parser.add_argument(
+        "--filter-dups",
+        type=float,
+        nargs="?",
+        const=0,
+        metavar="SECONDS",
+        help="Have the controller report each device once, again every SECONDS.",
+    )
     parser.add_argument(
         "-r",
         "--ruuvi",
@@ -208,6 +292,20 @@ def main():
         default=False,
         help="Look only for Tilt hydrometer messages",
     )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Serve Prometheus metrics on this local port.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=int,
+        nargs="?",
+        const=0,
+        metavar="N",
+        help="Time the decoding stages. Print them every N packets, and on SIGUSR1.",
+    )
     parser.add_argument(
         "--skip-leader",
         action="store_false",
@@ -229,6 +327,8 @@ def main():
         decoders.append(("Temperature info", ThermoBeacon()))
     if opts.tilt:
         decoders.append(("Tilt", Tilt()))
+    if decoders:
+        dispatcher = aiobs.Dispatcher([decoder for leader, decoder in decoders])
     try:
         asyncio.run(amain())
     except:
@@ -0,0 +1,123 @@
+/*
+ * Optional compiled version of aioblescan.ad_scan, walking the AD structures of
+ * an advertising report.
+ *
+ * Copyright (c) 2017 François Wautier
+ *
+ * Permission is hereby granted, free of charge, to any person obtaining a copy
+ * of this software and associated documentation files (the "Software"), to deal
+ * in the Software without restriction, including without limitation the rights
+ * to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+ * of the Software, and to permit persons to whom the Software is furnished to do so,
+ * subject to the following conditions:
+ *
+ * The above copyright notice and this permission notice shall be included in all copies
+ * or substantial portions of the Software.
+ *
+ * THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+ * IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+ * FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+ * AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+ * WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+ * IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+static PyObject *
+index_error(void)
+{
+    PyErr_SetString(PyExc_IndexError, "index out of range");
+    return NULL;
+}
+
+/* Must give the same results, and errors, as _py_ad_scan in aioblescan.py */
+static PyObject *
+ad_scan(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    Py_ssize_t offset, remaining;
+    int empty = 0;
+    const unsigned char *data;
+    PyObject *ad = NULL, *item, *rssi, *result = NULL;
+
+    if (!PyArg_ParseTuple(args, "y*nn|p:ad_scan", &view, &offset, &remaining,
+                          &empty))
+        return NULL;
+    data = (const unsigned char *)view.buf;
+    ad = PyList_New(0);
+    if (ad == NULL)
+        goto done;
+    while (remaining > 0) {
+        Py_ssize_t sublen;
+
+        if (offset < 0 || offset >= view.len) {
+            index_error();
+            goto done;
+        }
+        sublen = data[offset];
+        if (sublen) {
+            if (offset + 1 >= view.len) {
+                index_error();
+                goto done;
+            }
+            item = Py_BuildValue("(inn)", data[offset + 1], offset + 2,
+                                 sublen - 1);
+        }
+        else if (empty) {
+            item = Py_BuildValue("(Onn)", Py_None, offset + 1, (Py_ssize_t)0);
+        }
+        else {
+            item = NULL;
+        }
+        if (item != NULL) {
+            int failed = PyList_Append(ad, item);
+            Py_DECREF(item);
+            if (failed)
+                goto done;
+        }
+        else if (PyErr_Occurred()) {
+            goto done;
+        }
+        offset += sublen + 1;
+        remaining -= sublen + 1;
+    }
+    if (offset >= 0 && offset < view.len) {
+        rssi = PyLong_FromLong((signed char)data[offset]);
+        if (rssi == NULL)
+            goto done;
+    }
+    else {
+        Py_INCREF(Py_None);
+        rssi = Py_None;
+    }
+    result = Py_BuildValue("(OnN)", ad, offset, rssi);
+
+done:
+    Py_XDECREF(ad);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyMethodDef adscan_methods[] = {
+    {"ad_scan", ad_scan, METH_VARARGS,
+     "ad_scan(data, offset, remaining, empty=False)\n\n"
+     "Return (ad, offset, rssi) for the AD structures in data, see\n"
+     "aioblescan.ad_scan."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef adscan_module = {
+    PyModuleDef_HEAD_INIT,
+    "_adscan",
+    "Compiled helpers for aioblescan.",
+    -1,
+    adscan_methods
+};
+
+PyMODINIT_FUNC
+PyInit__adscan(void)
+{
+    return PyModule_Create(&adscan_module);
+}
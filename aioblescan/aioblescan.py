@@ -25,8 +25,11 @@
 # WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
 # IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
 
-import socket, platform, asyncio
-from struct import pack, unpack, calcsize
+import socket, platform, asyncio, time
+from collections import namedtuple, deque, OrderedDict
+from contextlib import contextmanager
+from types import MappingProxyType
+from struct import Struct, error, pack, unpack, unpack_from, calcsize
 
 
 # A little bit of HCI
@@ -36,8 +39,16 @@ HCI_SCO_DATA = 0x03
 HCI_EVENT = 0x04
 HCI_VENDOR = 0x05
 
+# Some HCI event codes
+HCI_EV_CMD_COMPLETE = 0x0E
+HCI_EV_CMD_STATUS = 0x0F
+HCI_EV_LE_META = 0x3E
+
 PRINT_INDENT = "    "
 
+# Names used in BitFieldByte for the bits that carry no information
+_UNUSED_BITS = ("Undef", "Reserv")
+
 CMD_SCAN_REQUEST = 0x200C  # mixing the OGF in with that HCI shift
 
 #
@@ -61,10 +72,25 @@ class MACAddr:
 
     """
 
+    __slots__ = ("name", "_raw", "_val")
+
     def __init__(self, name, mac="00:00:00:00:00:00"):
         self.name = name
         self.val = mac.lower()
 
+    @property
+    def val(self):
+        # The string is only built, once, when the value is first read.
+        if self._val is None:
+            self._val = self._raw[::-1].hex(":")
+            self._raw = None
+        return self._val
+
+    @val.setter
+    def val(self, mac):
+        self._val = mac
+        self._raw = None
+
     def encode(self):
         """Encode the MAC address to a byte array.
 
@@ -80,12 +106,15 @@ class MACAddr:
         string representation. This will be assigned to the attribute "val". It then returns
         the data stream minus the bytes consumed
 
+        The string representation is only built when "val" is first read.
+
             :param data: The data stream containing the value to decode at its head
             :type data: bytes
             :returns: The datastream minus the bytes consumed
             :rtype: bytes
         """
-        self.val = ":".join("%02x" % x for x in reversed(data[:6]))
+        self._raw = bytes(data[:6])
+        self._val = None
         return data[6:]
 
     def __len__(self):
@@ -108,6 +137,8 @@ class Bool:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name, val=True):
         self.name = name
         self.val = val
@@ -139,6 +170,8 @@ class Byte:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name, val=b"\0"):
         self.name = name
         self.val = val
@@ -148,7 +181,7 @@ class Byte:
         return val
 
     def decode(self, data):
-        self.val = unpack("<c", data[:1])[0]
+        self.val = unpack_from("<c", data)[0]
         return data[1:]
 
     def __len__(self):
@@ -178,6 +211,8 @@ class EnumByte:
 
     """
 
+    __slots__ = ("name", "val", "loval")
+
     def __init__(self, name, val=0, loval={0: "Undef"}):
         self.name = name
         self.val = val
@@ -188,7 +223,7 @@ class EnumByte:
         return val
 
     def decode(self, data):
-        self.val = unpack(">B", data[:1])[0]
+        self.val = unpack_from(">B", data)[0]
         return data[1:]
 
     @property
@@ -223,17 +258,21 @@ class BitFieldByte:
 
     """
 
+    __slots__ = ("name", "_val", "loval", "_bits")
+
     def __init__(self, name, val=0, loval=["Undef"] * 8):
         self.name = name
         self._val = val
         self.loval = loval
+        self._bits = None
 
     def encode(self):
         val = pack(">B", self._val)
         return val
 
     def decode(self, data):
-        self._val = unpack(">B", data[:1])[0]
+        self._val = unpack_from(">B", data)[0]
+        self._bits = None
         return data[1:]
 
     def __len__(self):
@@ -241,19 +280,22 @@ class BitFieldByte:
 
     @property
     def val(self):
-        resu = {}
-        mybit = 1 << (len(self.loval) - 1)
-        for x in self.loval:
-            if x not in ["Undef", "Reserv"]:
-                resu[x] = (self._val & mybit) > 0
-            mybit = mybit >> 1
-        return resu
+        # Built when first read, then cached until the next decode
+        if self._bits is None:
+            resu = {}
+            mybit = 1 << (len(self.loval) - 1)
+            for x in self.loval:
+                if x not in _UNUSED_BITS:
+                    resu[x] = (self._val & mybit) > 0
+                mybit = mybit >> 1
+            self._bits = resu
+        return self._bits
 
     def show(self, depth=0):
         print("{}{}:".format(PRINT_INDENT * depth, self.name))
         mybit = 1 << (len(self.loval) - 1)
         for x in self.loval:
-            if x not in ["Undef", "Reserv"]:
+            if x not in _UNUSED_BITS:
                 print(
                     "{}{}: {}".format(
                         PRINT_INDENT * (depth + 1),
@@ -276,6 +318,8 @@ class IntByte:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name, val=0):
         self.name = name
         self.val = val
@@ -285,7 +329,7 @@ class IntByte:
         return val
 
     def decode(self, data):
-        self.val = unpack(">b", data[:1])[0]
+        self.val = unpack_from(">b", data)[0]
         return data[1:]
 
     def __len__(self):
@@ -308,6 +352,8 @@ class UIntByte:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name, val=0):
         self.name = name
         self.val = val
@@ -317,7 +363,7 @@ class UIntByte:
         return val
 
     def decode(self, data):
-        self.val = unpack(">B", data[:1])[0]
+        self.val = unpack_from(">B", data)[0]
         return data[1:]
 
     def __len__(self):
@@ -342,6 +388,8 @@ class ShortInt:
 
     """
 
+    __slots__ = ("name", "val", "endian")
+
     def __init__(self, name, val=0, endian="big"):
         self.name = name
         self.val = val
@@ -356,9 +404,9 @@ class ShortInt:
 
     def decode(self, data):
         if self.endian == "big":
-            self.val = unpack(">h", data[:2])[0]
+            self.val = unpack_from(">h", data)[0]
         else:
-            self.val = unpack("<h", data[:2])[0]
+            self.val = unpack_from("<h", data)[0]
         return data[2:]
 
     def __len__(self):
@@ -383,6 +431,8 @@ class UShortInt:
 
     """
 
+    __slots__ = ("name", "val", "endian")
+
     def __init__(self, name, val=0, endian="big"):
         self.name = name
         self.val = val
@@ -397,9 +447,9 @@ class UShortInt:
 
     def decode(self, data):
         if self.endian == "big":
-            self.val = unpack(">H", data[:2])[0]
+            self.val = unpack_from(">H", data)[0]
         else:
-            self.val = unpack("<H", data[:2])[0]
+            self.val = unpack_from("<H", data)[0]
         return data[2:]
 
     def __len__(self):
@@ -424,6 +474,8 @@ class LongInt:
 
     """
 
+    __slots__ = ("name", "val", "endian")
+
     def __init__(self, name, val=0, endian="big"):
         self.name = name
         self.val = val
@@ -438,9 +490,9 @@ class LongInt:
 
     def decode(self, data):
         if self.endian == "big":
-            self.val = unpack(">l", data[:4])[0]
+            self.val = unpack_from(">l", data)[0]
         else:
-            self.val = unpack("<l", data[:4])[0]
+            self.val = unpack_from("<l", data)[0]
         return data[4:]
 
     def __len__(self):
@@ -465,6 +517,8 @@ class ULongInt:
 
     """
 
+    __slots__ = ("name", "val", "endian")
+
     def __init__(self, name, val=0, endian="big"):
         self.name = name
         self.val = val
@@ -479,9 +533,9 @@ class ULongInt:
 
     def decode(self, data):
         if self.endian == "big":
-            self.val = unpack(">L", data[:4])[0]
+            self.val = unpack_from(">L", data)[0]
         else:
-            self.val = unpack("<L", data[:4])[0]
+            self.val = unpack_from("<L", data)[0]
         return data[4:]
 
     def __len__(self):
@@ -506,6 +560,8 @@ class OgfOcf:
 
     """
 
+    __slots__ = ("name", "ogf", "ocf")
+
     def __init__(self, name, ogf=b"\x00", ocf=b"\x00"):
         self.name = name
         self.ogf = ogf
@@ -516,7 +572,7 @@ class OgfOcf:
         return val
 
     def decode(self, data):
-        val = unpack("<H", data[: len(self)])[0]
+        val = unpack_from("<H", data)[0]
         self.ogf = val >> 10
         self.ocf = int(val - (self.ogf << 10)).to_bytes(1, "big")
         self.ogf = int(self.ogf).to_bytes(1, "big")
@@ -542,6 +598,8 @@ class Itself:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name):
         self.name = name
         self.val = b""
@@ -577,6 +635,8 @@ class String:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name):
         self.name = name
         self.val = ""
@@ -611,6 +671,8 @@ class NBytes:
 
     """
 
+    __slots__ = ("name", "length", "val")
+
     def __init__(self, name, length=2):
         self.name = name
         self.length = length
@@ -620,7 +682,7 @@ class NBytes:
         return pack(">%ds" % self.length, self.val)
 
     def decode(self, data):
-        self.val = unpack(">%ds" % self.length, data[: self.length])[0][::-1]
+        self.val = unpack_from(">%ds" % self.length, data)[0][::-1]
         return data[self.length :]
 
     def __len__(self):
@@ -652,6 +714,8 @@ class NBytes_List:
 
     """
 
+    __slots__ = ("name", "length", "lonbytes")
+
     def __init__(self, name, nbytes=2):
         # Bytes should be one of 2, 4 or 16
         self.name = name
@@ -691,6 +755,8 @@ class Float88:
 
     """
 
+    __slots__ = ("name", "val")
+
     def __init__(self, name):
         self.name = name
         self.val = 0.0
@@ -700,7 +766,7 @@ class Float88:
         return val
 
     def decode(self, data):
-        self.val = unpack(">h", data[:2])[0] / 256.0
+        self.val = unpack_from(">h", data)[0] / 256.0
         return data[2:]
 
     def __len__(self):
@@ -756,7 +822,7 @@ class Packet:
 
     def decode(self, data):
         try:
-            if unpack(self.fmt, data[: calcsize(self.fmt)])[0] == self.header:
+            if unpack_from(self.fmt, data)[0] == self.header:
                 self.raw_data = data
                 return data[calcsize(self.fmt) :]
         except:
@@ -766,20 +832,31 @@ class Packet:
     def retrieve(self, aclass):
         """Look for a specifc class/name in the packet"""
         resu = []
-        for x in self.payload:
-            try:
-                if isinstance(aclass, str):
-                    if x.name == aclass:
-                        resu.append(x)
-                else:
-                    if isinstance(x, aclass):
-                        resu.append(x)
-
-                resu += x.retrieve(aclass)
-            except:
-                pass
+        if isinstance(aclass, str):
+            for x in self.walk():
+                if getattr(x, "name", None) == aclass:
+                    resu.append(x)
+        else:
+            for x in self.walk():
+                if isinstance(x, aclass):
+                    resu.append(x)
         return resu
 
+    def walk(self):
+        """Iterate over all the fields and sub-packets in the payload, depth first"""
+        for x in getattr(self, "payload", ()):
+            yield x
+            if isinstance(x, Packet):
+                yield from x.walk()
+
+    def invalidate_index(self):
+        """Drop any index built for retrieve.
+
+        Indexed packets notice when a payload grows or shrinks. Code replacing a
+        field in place, during an indexed pass, should call this.
+        """
+        pass
+
 
 #
 # Commands
@@ -1260,6 +1337,76 @@ class HCI_Cmd_LE_Set_Extended_Scan_Params(HCI_Command):
             i += 1
 
 
+ACCEPT_LIST_ADDR_TYPES = MappingProxyType({0: "Public", 1: "Random", 0xFF: "Anonymous"})
+
+
+class HCI_Cmd_LE_Read_Accept_List_Size(HCI_Command):
+    """Class representing an HCI command to read how many devices the controller's
+    accept list (white list) can hold.
+    """
+
+    def __init__(self):
+        super().__init__(b"\x08", b"\x0f")
+
+
+class HCI_Cmd_LE_Clear_Accept_List(HCI_Command):
+    """Class representing an HCI command to remove all the devices from the
+    controller's accept list (white list).
+
+    It must not be sent while scanning uses the accept list.
+    """
+
+    def __init__(self):
+        super().__init__(b"\x08", b"\x10")
+
+
+class HCI_Cmd_LE_Add_Device_To_Accept_List(HCI_Command):
+    """Class representing an HCI command to add a device to the controller's accept
+    list (white list).
+
+    When scanning with a filter policy of 1 or 3, only the devices in the accept list
+    are reported. It must not be sent while scanning uses the accept list.
+
+        :param mac: The MAC address of the device
+        :type mac: str
+        :param addr_type: Type of address 0 => Public (default)
+                                          1 => Random
+                                          0xFF => Anonymous advertisements
+        :type addr_type: int
+        :returns: HCI_Cmd_LE_Add_Device_To_Accept_List instance.
+        :rtype: HCI_Cmd_LE_Add_Device_To_Accept_List
+
+    """
+
+    def __init__(self, mac="00:00:00:00:00:00", addr_type=0):
+        super().__init__(b"\x08", b"\x11")
+        self.payload.append(EnumByte("address type", addr_type, ACCEPT_LIST_ADDR_TYPES))
+        self.payload.append(MACAddr("address", mac))
+
+
+class HCI_Cmd_LE_Remove_Device_From_Accept_List(HCI_Command):
+    """Class representing an HCI command to remove a device from the controller's
+    accept list (white list).
+
+    It must not be sent while scanning uses the accept list.
+
+        :param mac: The MAC address of the device
+        :type mac: str
+        :param addr_type: Type of address 0 => Public (default)
+                                          1 => Random
+                                          0xFF => Anonymous advertisements
+        :type addr_type: int
+        :returns: HCI_Cmd_LE_Remove_Device_From_Accept_List instance.
+        :rtype: HCI_Cmd_LE_Remove_Device_From_Accept_List
+
+    """
+
+    def __init__(self, mac="00:00:00:00:00:00", addr_type=0):
+        super().__init__(b"\x08", b"\x12")
+        self.payload.append(EnumByte("address type", addr_type, ACCEPT_LIST_ADDR_TYPES))
+        self.payload.append(MACAddr("address", mac))
+
+
 class HCI_Cmd_Reset(HCI_Command):
     """Class representing an HCI command to reset the adapater.
 
@@ -1279,25 +1426,102 @@ class HCI_Cmd_Reset(HCI_Command):
 
 
 class HCI_Event(Packet):
+    """Class representing an HCI event packet.
+
+    Within "with event.indexed():" retrieve looks fields up by name, or by class,
+    in an index of the decoded event instead of walking it. The index is dropped
+    when the block ends, so that a kept event does not carry it.
+    """
+
     def __init__(self, code=0, payload=[]):
         super().__init__(HCI_EVENT)
         self.payload.append(Byte("code"))
         self.payload.append(UIntByte("length"))
+        self._index = None
+
+    def retrieve(self, aclass):
+        """Look for a specifc class/name in the packet"""
+        index = self._index
+        if index is None:
+            return super().retrieve(aclass)
+        byname, byclass, fields, sizes = index
+        for payload, size in sizes:
+            if len(payload) != size:
+                # Modified since indexed
+                self._build_index()
+                byname, byclass, fields, sizes = self._index
+                break
+        if isinstance(aclass, str):
+            return list(byname.get(aclass, ()))
+        resu = byclass.get(aclass)
+        if resu is None:
+            resu = byclass[aclass] = [x for x in fields if isinstance(x, aclass)]
+        return list(resu)
+
+    @contextmanager
+    def indexed(self):
+        """Index the event for retrieve, until the end of the with block.
+
+        Meant to wrap a pass of the plugins over a decoded event. Nested blocks
+        share the outer index.
+        """
+        if self._index is not None:
+            yield self
+            return
+        self._build_index()
+        try:
+            yield self
+        finally:
+            self._index = None
+
+    def _build_index(self):
+        fields = list(self.walk())
+        byname = {}
+        for x in fields:
+            name = getattr(x, "name", None)
+            if name is not None:
+                byname.setdefault(name, []).append(x)
+        sizes = [(self.payload, len(self.payload))]
+        for x in fields:
+            payload = getattr(x, "payload", None)
+            if isinstance(x, Packet) and isinstance(payload, list):
+                sizes.append((payload, len(payload)))
+        self._index = (byname, {}, fields, sizes)
+
+    def invalidate_index(self):
+        if self._index is not None:
+            self._build_index()
 
     def decode(self, data):
+        """Decode an HCI event.
+
+        A memoryview, or bytearray, is copied into bytes first: the fields slice
+        their values out of the bytes.
+
+            :param data: The raw HCI packet
+            :type data: bytes/memoryview
+            :returns: The datastream minus the bytes consumed, or None if this is not an HCI event
+            :rtype: bytes
+        """
+        if not isinstance(data, bytes):
+            data = bytes(data)
         data = super().decode(data)
         if data is None:
             return None
 
+        self._index = None
         for x in self.payload:
-            x.decode(data[: len(x)])
-            data = data[len(x) :]
+            data = x.decode(data)
         code = self.payload[0]
         length = self.payload[1].val
         if code.val == b"\x0e":
             ev = HCI_CC_Event()
             data = ev.decode(data)
             self.payload.append(ev)
+        elif code.val == b"\x0f":
+            ev = HCI_CS_Event()
+            data = ev.decode(data)
+            self.payload.append(ev)
         elif code.val == b"\x3e":
             ev = HCI_LE_Meta_Event()
             data = ev.decode(data)
@@ -1331,6 +1555,23 @@ class HCI_CC_Event(Packet):
             x.show(depth + 1)
 
 
+class HCI_CS_Event(Packet):
+    """Command Status event"""
+
+    def __init__(self):
+        self.name = "Command Status"
+        self.payload = [UIntByte("status"), UIntByte("allow pkt"), OgfOcf("cmd")]
+
+    def decode(self, data):
+        for x in self.payload:
+            data = x.decode(data)
+        return data
+
+    def show(self, depth=0):
+        for x in self.payload:
+            x.show(depth + 1)
+
+
 class HCI_LE_Meta_Event(Packet):
     def __init__(self):
         self.name = "LE Meta"
@@ -1357,30 +1598,48 @@ class HCI_LE_Meta_Event(Packet):
             x.show(depth + 1)
 
 
+# Lookup tables shared by every decoded report
+ADV_EVENT_TYPES = MappingProxyType(
+    {0: "generic adv", 3: "no connection adv", 4: "scan rsp"}
+)
+ADV_ADDR_TYPES = MappingProxyType({0: "public", 1: "random"})
+
+
 class HCI_LEM_Adv_Report(Packet):
+    """Class representing a legacy LE Advertising Report
+
+    The advertising data is also kept, undecoded, in ad_data.
+    """
+
     def __init__(self):
         self.name = "Adv Report"
         self.payload = [
-            EnumByte(
-                "ev type", 0, {0: "generic adv", 3: "no connection adv", 4: "scan rsp"}
-            ),
-            EnumByte("addr type", 0, {0: "public", 1: "random"}),
+            EnumByte("ev type", 0, ADV_EVENT_TYPES),
+            EnumByte("addr type", 0, ADV_ADDR_TYPES),
             MACAddr("peer"),
             UIntByte("length"),
         ]
+        self.ad_data = b""
 
     def decode(self, data):
         for x in self.payload:
             data = x.decode(data)
         packet_len = self.payload[3].val  # get adv_report->length field
+        self.ad_data = data[:packet_len]
         # Now we have a sequence of len, type data with possibly a RSSI byte at the end
-        while packet_len > 0:
-            ad = AD_Structure()
-            data = ad.decode(data)
-            self.payload.append(ad)
-            packet_len = packet_len - ad.length
-            if ad.length == 0:  # sanity check to avoid infinity loop
-                packet_len = 0
+        if _c_ad_scan is None:
+            while packet_len > 0:
+                ad = AD_Structure()
+                data = ad.decode(data)
+                self.payload.append(ad)
+                packet_len = packet_len - ad.length
+        else:
+            found, end, rssi = _c_ad_scan(data, 0, packet_len, True)
+            for ad_type, start, length in found:
+                ad = AD_Structure()
+                ad._decode_at(data, ad_type, start, length)
+                self.payload.append(ad)
+            data = data[end:]
         if data:
             myinfo = IntByte("rssi")
             data = myinfo.decode(data)
@@ -1393,95 +1652,245 @@ class HCI_LEM_Adv_Report(Packet):
             x.show(depth + 1)
 
 
+#
+# Fast path for legacy advertising reports
+#
+
+AdvRecord = namedtuple("AdvRecord", ["ev_type", "addr_type", "mac", "rssi", "ad"])
+AdvRecord.__doc__ = """Flat record of a legacy LE Advertising Report.
+
+    ad is a list of (ad_type, offset, length) tuples, offset being the index of the
+    AD data, past its type byte, in the buffer that was decoded. rssi is None when
+    the report carries none.
+"""
+
+_ADV_EVENT_HDR = Struct("<BBxBB")  # packet type, event code, subevent, count
+_ADV_FIRST_REPORT = Struct("<BBxBBBB6sB")  # the same, then the first _ADV_REPORT_HDR
+_ADV_REPORT_HDR = Struct("<BB6sB")  # ev type, addr type, peer, data length
+_ADV_RSSI = Struct("<b")
+_tuple_new = tuple.__new__
+
+
+def decode_adv_reports(data):
+    """Decode a legacy LE Advertising Report event into a list of AdvRecord.
+
+    This gives the same information as HCI_Event.decode followed by walking the
+    HCI_LEM_Adv_Report objects, but it creates no field object. AD structures
+    with a length of 0 carry no data and are not listed.
+
+        :param data: The raw HCI packet
+        :type data: bytes/memoryview
+        :returns: The list of reports, or None if this is not an LE Advertising Report event
+        :rtype: list
+    """
+    if len(data) < _ADV_FIRST_REPORT.size:
+        # No room for a report, this can only be an event without any
+        if len(data) < _ADV_EVENT_HDR.size:
+            return None
+        ptype, code, subevent, count = _ADV_EVENT_HDR.unpack_from(data)
+        if ptype != HCI_EVENT or code != 0x3E or subevent != 0x02:
+            return None
+        if count:
+            raise error("LE Advertising Report event too short")
+        return []
+    # This is called for every packet. Events hold a single report most of the
+    # time, so its header is read with that of the event, and the AD structures
+    # are walked here rather than with ad_scan: calling the compiled version
+    # costs as much as it saves on a few AD structures.
+    (
+        ptype,
+        code,
+        subevent,
+        count,
+        ev_type,
+        addr_type,
+        peer,
+        remaining,
+    ) = _ADV_FIRST_REPORT.unpack_from(data)
+    if ptype != HCI_EVENT or code != 0x3E or subevent != 0x02:
+        return None
+    records = []
+    offset = _ADV_FIRST_REPORT.size
+    end = len(data)
+    while count:
+        stop = offset + remaining
+        ad = []
+        while offset < stop:
+            sublen = data[offset]
+            if sublen:
+                ad.append((data[offset + 1], offset + 2, sublen - 1))
+            offset += sublen + 1
+        rssi = None
+        if offset < end:
+            rssi = data[offset]
+            if rssi > 127:
+                rssi -= 256
+            offset += 1
+        mac = peer[::-1].hex(":")
+        # Quicker than the AdvRecord constructor
+        records.append(_tuple_new(AdvRecord, (ev_type, addr_type, mac, rssi, ad)))
+        count -= 1
+        if count:
+            ev_type, addr_type, peer, remaining = _ADV_REPORT_HDR.unpack_from(
+                data, offset
+            )
+            offset += _ADV_REPORT_HDR.size
+    return records
+
+
+def _py_ad_scan(data, offset, remaining, empty=False):
+    """Walk the AD structures of an advertising report.
+
+    This is used as ad_scan when the compiled version, from _adscan.c, was not
+    built. Both give the same results.
+
+        :param data: The raw HCI packet
+        :type data: bytes/memoryview
+        :param offset: Index of the first AD structure in data
+        :type offset: int
+        :param remaining: Length of the advertising data
+        :type remaining: int
+        :param empty: Also list the AD structures of length 0, as (None, offset, 0)
+        :type empty: bool
+        :returns: The (ad_type, offset, length) of each AD structure, as in
+                  AdvRecord.ad, the index past them, and the signed byte found
+                  there, the RSSI, or None if there is no more data
+        :rtype: tuple
+    """
+    ad = []
+    while remaining > 0:
+        sublen = data[offset]
+        if sublen:
+            ad.append((data[offset + 1], offset + 2, sublen - 1))
+        elif empty:
+            ad.append((None, offset + 1, 0))
+        offset += sublen + 1
+        remaining -= sublen + 1
+    rssi = None
+    if offset < len(data):
+        rssi = _ADV_RSSI.unpack_from(data, offset)[0]
+    return ad, offset, rssi
+
+
+try:
+    from ._adscan import ad_scan as _c_ad_scan
+except ImportError:
+    _c_ad_scan = None
+ad_scan = _c_ad_scan or _py_ad_scan
+
+
+EXT_ADV_EVENT_TYPES = (
+    "Connectable",
+    "Scannable",
+    "Directed",
+    "Scan Response",
+    "Legacy",
+    "Incomplete/more",
+    "Incomplete/truncated",
+    "RFU",
+)
+EXT_ADV_ADDR_TYPES = MappingProxyType(
+    {
+        0: "public device",
+        1: "random device",
+        2: "public identity",
+        3: "random identity",
+        0xFF: "anonymous",
+    }
+)
+EXT_ADV_PRIMARY_PHYS = MappingProxyType({1: "LE 1M", 3: "LE Coded"})
+EXT_ADV_SECONDARY_PHYS = MappingProxyType(
+    {0: "N/A", 1: "LE 1M", 2: "LE 2M", 3: "LE Coded"}
+)
+EXT_ADV_SIDS = MappingProxyType(
+    dict([(x, "0x%02X" % x) for x in range(16)] + [(0xFF, "N/A")])
+)
+EXT_ADV_DIRECT_ADDR_TYPES = MappingProxyType(
+    {
+        0: "public device",
+        1: "random device",
+        2: "public identity",
+        3: "random identity",
+        0xFE: "random device",
+    }
+)
+
+
+# Extended advertising data status, bits 5-6 of the event type
+EXT_ADV_COMPLETE = 0
+EXT_ADV_INCOMPLETE = 1
+EXT_ADV_TRUNCATED = 2
+
+# Maximum length of extended advertising data
+MAX_EXT_ADV_DATA = 1650
+
+
 class HCI_LEM_Ext_Adv_Report(Packet):
+    """Class representing an LE Extended Advertising Report.
+
+    The advertising data is kept, undecoded, in ad_data. When the data is
+    complete it is also decoded into AD_Structure. When it is a fragment of a
+    longer advertisement (see ExtAdvReassembler) it is kept as a single
+    "Adv Data Fragment" field.
+    """
+
     def __init__(self):
         self.name = "Ext Adv Report"
+        self.ad_data = b""
         self.payload = [
-            BitFieldByte(
-                "ev type",
-                0,
-                [
-                    "Connectable",
-                    "Scannable",
-                    "Directed",
-                    "Scan Response",
-                    "Legacy",
-                    "Incomplete/more",
-                    "Incomplete/truncated",
-                    "RFU",
-                ],
-            ),
+            BitFieldByte("ev type", 0, EXT_ADV_EVENT_TYPES),
             UIntByte("unused"),
-            EnumByte(
-                "addr type",
-                0,
-                {
-                    0: "public device",
-                    1: "random device",
-                    2: "public identity",
-                    3: "random identity",
-                    0xFF: "anonymous",
-                },
-            ),
+            EnumByte("addr type", 0, EXT_ADV_ADDR_TYPES),
             MACAddr("peer"),
-            EnumByte("primary phy", 1, {1: "LE 1M", 3: "LE Coded"}),
-            EnumByte(
-                "secondary phy", 0, {0: "N/A", 1: "LE 1M", 2: "LE 2M", 3: "LE Coded"}
-            ),
-            EnumByte(
-                "adv sid",
-                255,
-                {
-                    0: "0x00",
-                    1: "0x01",
-                    2: "0x02",
-                    3: "0x03",
-                    4: "0x04",
-                    5: "0x05",
-                    6: "0x06",
-                    7: "0x07",
-                    8: "0x08",
-                    9: "0x09",
-                    10: "0x0A",
-                    11: "0x0B",
-                    12: "0x0C",
-                    13: "0x0D",
-                    14: "0x0E",
-                    15: "0x0F",
-                    0xFF: "N/A",
-                },
-            ),
+            EnumByte("primary phy", 1, EXT_ADV_PRIMARY_PHYS),
+            EnumByte("secondary phy", 0, EXT_ADV_SECONDARY_PHYS),
+            EnumByte("adv sid", 255, EXT_ADV_SIDS),
             IntByte("tx power"),
             IntByte("rssi"),
             UShortInt("adv interval", endian="little"),
-            EnumByte(
-                "direct addr type",
-                0,
-                {
-                    0: "public device",
-                    1: "random device",
-                    2: "public identity",
-                    3: "random identity",
-                    0xFE: "random device",
-                },
-            ),
+            EnumByte("direct addr type", 0, EXT_ADV_DIRECT_ADDR_TYPES),
             MACAddr("direct addr"),
             UIntByte("data len"),
         ]
 
+    @property
+    def data_status(self):
+        """One of EXT_ADV_COMPLETE, EXT_ADV_INCOMPLETE or EXT_ADV_TRUNCATED"""
+        return (self.payload[0]._val >> 5) & 0x03
+
     def decode(self, data):
 
         for x in self.payload:
             data = x.decode(data)
 
-        datalength = self.payload[-1].val
-        while datalength > 0:
+        datalength = self.payload[12].val
+        self.ad_data = data[:datalength]
+        if self.data_status == EXT_ADV_COMPLETE:
+            self.decode_ad(self.ad_data)
+        else:
+            fragment = Itself("Adv Data Fragment")
+            fragment.decode(self.ad_data)
+            self.payload.append(fragment)
+        return data[datalength:]
+
+    def decode_ad(self, data):
+        """Decode the AD structures in data and add them to the payload.
+
+        The last fragment of a longer advertisement does not start with an AD
+        structure. If the data cannot be decoded, what is left of it is added as
+        an "Adv Data Fragment" field.
+        """
+        while data:
             ad = AD_Structure()
-            data = ad.decode(data)
+            try:
+                rest = ad.decode(data)
+            except error:
+                fragment = Itself("Adv Data Fragment")
+                fragment.decode(data)
+                self.payload.append(fragment)
+                break
             self.payload.append(ad)
-
-            datalength -= len(ad)
-        return data
+            data = rest
 
     def show(self, depth=0):
         print("{}{}:".format(PRINT_INDENT * depth, self.name))
@@ -1489,46 +1898,47 @@ class HCI_LEM_Ext_Adv_Report(Packet):
             x.show(depth + 1)
 
 
+EIR_TYPES = MappingProxyType(
+    {
+        0x01: "flags",
+        0x02: "incomplete_list_16_bit_svc_uuids",
+        0x03: "complete_list_16_bit_svc_uuids",
+        0x04: "incomplete_list_32_bit_svc_uuids",
+        0x05: "complete_list_32_bit_svc_uuids",
+        0x06: "incomplete_list_128_bit_svc_uuids",
+        0x07: "complete_list_128_bit_svc_uuids",
+        0x08: "shortened_local_name",
+        0x09: "complete_local_name",
+        0x0A: "tx_power_level",
+        0x0D: "class_of_device",
+        0x0E: "simple_pairing_hash",
+        0x0F: "simple_pairing_rand",
+        0x10: "sec_mgr_tk",
+        0x11: "sec_mgr_oob_flags",
+        0x12: "slave_conn_intvl_range",
+        0x17: "pub_target_addr",
+        0x18: "rand_target_addr",
+        0x19: "appearance",
+        0x1A: "adv_intvl",
+        0x1B: "le_addr",
+        0x1C: "le_role",
+        0x14: "list_16_bit_svc_sollication_uuids",
+        0x1F: "list_32_bit_svc_sollication_uuids",
+        0x15: "list_128_bit_svc_sollication_uuids",
+        0x16: "svc_data_16_bit_uuid",
+        0x20: "svc_data_32_bit_uuid",
+        0x21: "svc_data_128_bit_uuid",
+        0x22: "sec_conn_confirm",
+        0x23: "sec_conn_rand",
+        0x24: "uri",
+        0xFF: "mfg_specific_data",
+    }
+)
+
+
 class EIR_Hdr(Packet):
     def __init__(self):
-        self.type = EnumByte(
-            "type",
-            0,
-            {
-                0x01: "flags",
-                0x02: "incomplete_list_16_bit_svc_uuids",
-                0x03: "complete_list_16_bit_svc_uuids",
-                0x04: "incomplete_list_32_bit_svc_uuids",
-                0x05: "complete_list_32_bit_svc_uuids",
-                0x06: "incomplete_list_128_bit_svc_uuids",
-                0x07: "complete_list_128_bit_svc_uuids",
-                0x08: "shortened_local_name",
-                0x09: "complete_local_name",
-                0x0A: "tx_power_level",
-                0x0D: "class_of_device",
-                0x0E: "simple_pairing_hash",
-                0x0F: "simple_pairing_rand",
-                0x10: "sec_mgr_tk",
-                0x11: "sec_mgr_oob_flags",
-                0x12: "slave_conn_intvl_range",
-                0x17: "pub_target_addr",
-                0x18: "rand_target_addr",
-                0x19: "appearance",
-                0x1A: "adv_intvl",
-                0x1B: "le_addr",
-                0x1C: "le_role",
-                0x14: "list_16_bit_svc_sollication_uuids",
-                0x1F: "list_32_bit_svc_sollication_uuids",
-                0x15: "list_128_bit_svc_sollication_uuids",
-                0x16: "svc_data_16_bit_uuid",
-                0x20: "svc_data_32_bit_uuid",
-                0x21: "svc_data_128_bit_uuid",
-                0x22: "sec_conn_confirm",
-                0x23: "sec_conn_rand",
-                0x24: "uri",
-                0xFF: "mfg_specific_data",
-            },
-        )
+        self.type = EnumByte("type", 0, EIR_TYPES)
 
     def decode(self, data):
         return self.type.decode(data)
@@ -1588,71 +1998,36 @@ class AD_Structure(Packet):
     def decode(self, data):
         length = UIntByte("sublen")
         data = length.decode(data)
-        self.length = len(length) + length.val
-        self.payload = []
         if length.val == 0:
+            self._decode_at(data, None, 0, 0)
             return data
+        self._decode_at(data, unpack_from(">B", data)[0], 1, length.val - 1)
+        return data[length.val :]
+
+    def _decode_at(self, data, ad_type, start, length):
+        # Decode the AD structure at start in data, as found by ad_scan
+        self.payload = []
+        if ad_type is None:
+            self.length = 1
+            return
+        self.length = length + 2
 
         type = EIR_Hdr()
-        data = type.decode(data)
+        type.type.val = ad_type
 
-        val = None
-        if type.val == 0x01:
-            val = BitFieldByte(
-                "flags",
-                0,
-                [
-                    "Undef",
-                    "Undef",
-                    "Simul LE - BR/EDR (Host)",
-                    "Simul LE - BR/EDR (Control.)",
-                    "BR/EDR Not Supported",
-                    "LE General Disc.",
-                    "LE Limited Disc.",
-                ],
-            )
-        elif type.val == 0x02:
-            val = NBytes_List("Incomplete uuids", 2)
-        elif type.val == 0x03:
-            val = NBytes_List("Complete uuids", 2)
-        elif type.val == 0x04:
-            val = NBytes_List("Incomplete uuids", 4)
-        elif type.val == 0x05:
-            val = NBytes_List("Complete uuids", 4)
-        elif type.val == 0x06:
-            val = NBytes_List("Incomplete uuids", 16)
-        elif type.val == 0x07:
-            val = NBytes_List("Complete uuids", 16)
-        elif type.val == 0x08:
-            val = String("Short Name")
-        elif type.val == 0x09:
-            val = String("Complete Name")
-        elif type.val == 0x14:
-            val = NBytes_List("Service Solicitation uuid", 2)
-        elif type.val == 0x15:
-            val = NBytes_List("Service Solicitation uuid", 16)
-        elif type.val == 0x16:
-            val = Adv_Data("Advertised Data", 2)
-        elif type.val == 0x1F:
-            val = NBytes_List("Service Solicitation uuid", 4)
-        elif type.val == 0x20:
-            val = Adv_Data("Advertised Data", 4)
-        elif type.val == 0x21:
-            val = Adv_Data("Advertised Data", 16)
-        elif type.val == 0xFF:
-            val = ManufacturerSpecificData()
-        else:
+        field = AD_TYPE_FIELDS.get(ad_type)
+        if field is None:
             val = Itself("Payload for %s" % type.strval)
+        else:
+            val = field[0](*field[1])
 
         # Some data type may consume all input data, therefore an copy
         # is passed instead.
-        val.decode(data[: length.val - len(type)])
+        val.decode(data[start : start + length])
 
         self.payload.append(type)
         self.payload.append(val)
 
-        return data[length.val - len(type) :]
-
     def show(self, depth=0):
         for x in self.payload:
             x.show(depth + 1)
@@ -1678,11 +2053,322 @@ class ManufacturerSpecificData(Packet):
             x.show(depth + 1)
 
 
+AD_FLAGS = (
+    "Undef",
+    "Undef",
+    "Simul LE - BR/EDR (Host)",
+    "Simul LE - BR/EDR (Control.)",
+    "BR/EDR Not Supported",
+    "LE General Disc.",
+    "LE Limited Disc.",
+)
+
+# How AD_Structure decodes the data for each AD type: field class and its arguments
+AD_TYPE_FIELDS = MappingProxyType(
+    {
+        0x01: (BitFieldByte, ("flags", 0, AD_FLAGS)),
+        0x02: (NBytes_List, ("Incomplete uuids", 2)),
+        0x03: (NBytes_List, ("Complete uuids", 2)),
+        0x04: (NBytes_List, ("Incomplete uuids", 4)),
+        0x05: (NBytes_List, ("Complete uuids", 4)),
+        0x06: (NBytes_List, ("Incomplete uuids", 16)),
+        0x07: (NBytes_List, ("Complete uuids", 16)),
+        0x08: (String, ("Short Name",)),
+        0x09: (String, ("Complete Name",)),
+        0x14: (NBytes_List, ("Service Solicitation uuid", 2)),
+        0x15: (NBytes_List, ("Service Solicitation uuid", 16)),
+        0x16: (Adv_Data, ("Advertised Data", 2)),
+        0x1F: (NBytes_List, ("Service Solicitation uuid", 4)),
+        0x20: (Adv_Data, ("Advertised Data", 4)),
+        0x21: (Adv_Data, ("Advertised Data", 16)),
+        0xFF: (ManufacturerSpecificData, ()),
+    }
+)
+
+
 #
 # The defs are over. Now the realstuffs
 #
 
 
+class ExtAdvReassembler:
+    """Class reassembling extended advertisements split over several reports.
+
+    An extended advertisement longer than one HCI event is received as a chain of
+    HCI_LEM_Ext_Adv_Report with the same peer and advertising SID, all but the last
+    marked as incomplete. The data of each chain is gathered in a preallocated
+    buffer of MAX_EXT_ADV_DATA bytes. When the last fragment arrives a single report,
+    with all the AD structures, is returned.
+
+    Set it as the reassembler of a BLEScanRequester to reassemble the reports given
+    to process_batch and reports(). The raw packets given to process are not.
+
+    At most max_chains chains are buffered at a time, the oldest one is dropped to
+    make room for a new one. Chains not updated for timeout seconds are dropped.
+    Dropped chains are counted in evicted.
+
+        :param timeout: Time, in seconds, after which an incomplete chain is dropped. Default 2
+        :type timeout: float
+        :param max_chains: Maximum number of chains buffered at once. Default 64
+        :type max_chains: int
+        :returns: ExtAdvReassembler instance.
+        :rtype: ExtAdvReassembler
+
+    """
+
+    def __init__(self, timeout=2.0, max_chains=64):
+        self.timeout = timeout
+        self.max_chains = max_chains
+        self.evicted = 0
+        # (peer, sid) -> [buffer, length, last update], oldest update first
+        self._chains = OrderedDict()
+        self._buffers = []
+
+    def __len__(self):
+        return len(self._chains)
+
+    def feed(self, report, now=None):
+        """Process a report.
+
+            :param report: An extended advertising report
+            :type report: HCI_LEM_Ext_Adv_Report
+            :param now: The current time.monotonic(). Default now.
+            :type now: float
+            :returns: A report with complete data, or None if more fragments are expected
+            :rtype: HCI_LEM_Ext_Adv_Report
+        """
+        status = report.data_status
+        if status == EXT_ADV_COMPLETE and not self._chains:
+            return report
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        key = (report.payload[3].val, report.payload[6].val)
+        chain = self._chains.get(key)
+        if chain is None:
+            if status == EXT_ADV_COMPLETE:
+                return report
+            if status == EXT_ADV_TRUNCATED:
+                return self._assemble(report, report.ad_data)
+            chain = self._start(key)
+        data = report.ad_data
+        buf, length = chain[0], chain[1]
+        if length + len(data) > MAX_EXT_ADV_DATA:
+            self._drop(key)
+            return None
+        buf[length : length + len(data)] = data
+        chain[1] = length + len(data)
+        chain[2] = now
+        self._chains.move_to_end(key)
+        if status == EXT_ADV_INCOMPLETE:
+            return None
+        result = self._assemble(report, memoryview(buf)[: chain[1]])
+        self._release(key)
+        return result
+
+    def _assemble(self, report, data):
+        result = HCI_LEM_Ext_Adv_Report()
+        result.payload = report.payload[:12]
+        result.payload.append(UIntByte("data len", len(data)))
+        result.ad_data = bytes(data)
+        result.decode_ad(result.ad_data)
+        return result
+
+    def _start(self, key):
+        if len(self._chains) >= self.max_chains:
+            self._drop(next(iter(self._chains)))
+        buf = self._buffers.pop() if self._buffers else bytearray(MAX_EXT_ADV_DATA)
+        chain = self._chains[key] = [buf, 0, 0]
+        return chain
+
+    def _release(self, key):
+        self._buffers.append(self._chains.pop(key)[0])
+
+    def _drop(self, key):
+        self._release(key)
+        self.evicted += 1
+
+    def _expire(self, now):
+        while self._chains:
+            key, chain = next(iter(self._chains.items()))
+            if now - chain[2] < self.timeout:
+                break
+            self._drop(key)
+
+
+def adv_reports(packet):
+    """Decode an LE Advertising Report or LE Extended Advertising Report event.
+
+    Other packets are recognised from their first bytes and are not decoded.
+
+        :param packet: The raw HCI packet
+        :type packet: bytes/memoryview
+        :returns: The list of HCI_LEM_Adv_Report or HCI_LEM_Ext_Adv_Report in the event, or None
+        :rtype: list
+    """
+    if len(packet) < 4 or packet[0] != HCI_EVENT or packet[1] != 0x3E:
+        return None
+    if packet[3] not in (0x02, 0x0D):
+        return None
+    ev = HCI_Event()
+    ev.decode(packet)
+    return ev.payload[2].payload[1].payload
+
+
+# Packet categories, see packet_category
+ADV_REPORT = "adv report"
+COMMAND_COMPLETE = "command complete"
+DISCONNECT = "disconnect"
+VENDOR = "vendor"
+OTHER = "other"
+
+HCI_EV_DISCONNECT = 0x05
+HCI_EV_VENDOR = 0xFF
+_ADV_SUBEVENTS = frozenset((0x02, 0x0B, 0x0D))
+_LE_META = object()
+# Categories not in BLEScanRequester.routes
+_UNROUTED = object()
+# Category of each HCI event code
+_EVENT_CATEGORIES = [OTHER] * 256
+_EVENT_CATEGORIES[HCI_EV_CMD_COMPLETE] = COMMAND_COMPLETE
+_EVENT_CATEGORIES[HCI_EV_CMD_STATUS] = COMMAND_COMPLETE
+_EVENT_CATEGORIES[HCI_EV_DISCONNECT] = DISCONNECT
+_EVENT_CATEGORIES[HCI_EV_VENDOR] = VENDOR
+_EVENT_CATEGORIES[HCI_EV_LE_META] = _LE_META
+
+
+def packet_category(packet):
+    """Classify a packet from its type, event code and subevent, without decoding it.
+
+        :param packet: The raw HCI packet
+        :type packet: bytes/memoryview
+        :returns: ADV_REPORT, COMMAND_COMPLETE (also Command Status), DISCONNECT,
+                  VENDOR or OTHER
+        :rtype: str
+    """
+    if len(packet) < 2:
+        return OTHER
+    if packet[0] != HCI_EVENT:
+        return VENDOR if packet[0] == HCI_VENDOR else OTHER
+    category = _EVENT_CATEGORIES[packet[1]]
+    if category is _LE_META:
+        if len(packet) > 3 and packet[3] in _ADV_SUBEVENTS:
+            return ADV_REPORT
+        return OTHER
+    return category
+
+
+def report_key(report):
+    """Return what identifies the content of an advertising report.
+
+    That is the peer address, and the advertising data, so that the same
+    advertisement received with another RSSI, or by another adapter, has the same
+    key.
+
+        :param report: The report
+        :type report: HCI_LEM_Adv_Report/HCI_LEM_Ext_Adv_Report
+        :returns: (peer MAC address, advertising data)
+        :rtype: tuple
+    """
+    peer = report.payload[3 if isinstance(report, HCI_LEM_Ext_Adv_Report) else 2]
+    return peer.val, bytes(report.ad_data)
+
+
+def report_source(report):
+    """Return what identifies the advertiser of a report.
+
+    A device alternates several advertisements: advertising data and scan
+    response, or one per advertising set. Each has its own source: the peer
+    address, with the event type of a legacy report, or with the event properties
+    (without the data status) and the advertising SID of an extended report.
+
+        :param report: The report
+        :type report: HCI_LEM_Adv_Report/HCI_LEM_Ext_Adv_Report
+        :returns: (peer MAC address, event type), or (peer MAC address, event properties, SID)
+        :rtype: tuple
+    """
+    if isinstance(report, HCI_LEM_Ext_Adv_Report):
+        payload = report.payload
+        return payload[3].val, payload[0]._val & 0x1F, payload[6].val
+    return report.payload[2].val, report.payload[0].val
+
+
+def decode_reports(packets):
+    """Decode a sequence of HCI packets and collect their advertising reports.
+
+        :param packets: The raw HCI packets
+        :type packets: iterable
+        :returns: The HCI_LEM_Adv_Report and HCI_LEM_Ext_Adv_Report, in the order received
+        :rtype: list
+    """
+    reports = []
+    for packet in packets:
+        found = adv_reports(packet)
+        if found:
+            reports.extend(found)
+    return reports
+
+
+# Linux values, for Pythons built without Bluetooth support
+SOL_HCI = getattr(socket, "SOL_HCI", 0)
+HCI_FILTER = getattr(socket, "HCI_FILTER", 2)
+
+
+def hci_filter(ptypes=(HCI_EVENT,), events=(), opcode=0):
+    """Build a Linux HCI socket filter.
+
+        :param ptypes: The packet types to let through. Default HCI_EVENT only
+        :type ptypes: iterable
+        :param events: The event codes to let through
+        :type events: iterable
+        :param opcode: If not 0, only Command Complete/Status events for this opcode pass
+        :type opcode: int
+        :returns: The filter, as expected by setsockopt
+        :rtype: bytes
+    """
+    type_mask = 0
+    for ptype in ptypes:
+        type_mask |= 1 << (ptype & 0x1F)
+    event_mask = [0, 0]
+    for event in events:
+        event &= 0x3F
+        event_mask[event >> 5] |= 1 << (event & 0x1F)
+    return pack("IIIH2x", type_mask, event_mask[0], event_mask[1], opcode)
+
+
+def hci_filter_match(flt, packet):
+    """Tell whether a packet goes through an HCI socket filter.
+
+    This follows the checks done by the Linux kernel.
+
+        :param flt: A filter from hci_filter
+        :type flt: bytes
+        :param packet: The HCI packet, starting with its packet type
+        :type packet: bytes
+        :returns: True if the packet would be received
+        :rtype: bool
+    """
+    type_mask, mask_lo, mask_hi, opcode = unpack("IIIH2x", flt)
+    if not type_mask & (1 << (packet[0] & 0x1F)):
+        return False
+    if packet[0] != HCI_EVENT:
+        return True
+    event = packet[1] & 0x3F
+    if not (mask_lo | mask_hi << 32) & (1 << event):
+        return False
+    if opcode:
+        if event == HCI_EV_CMD_COMPLETE:
+            return unpack_from("<H", packet, 4)[0] == opcode
+        if event == HCI_EV_CMD_STATUS:
+            return unpack_from("<H", packet, 5)[0] == opcode
+    return True
+
+
+def set_hci_filter(sock, flt):
+    """Install a filter, from hci_filter, on a Linux HCI socket."""
+    sock.setsockopt(SOL_HCI, HCI_FILTER, flt)
+
+
 def create_bt_socket(interface=None):
     exceptions = []
     sock = None
@@ -1770,9 +2456,152 @@ def create_bt_socket(interface=None):
 
 ###########
 
+# What a ReportQueue does when full
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+PAUSE = "pause"
+
+
+class ReportQueue:
+    """Class representing a bounded queue of decoded reports, read with "async for".
+
+    When the queue is full, depending on overflow, either the oldest or the newest
+    report is dropped, or reading from the transport is paused until the queue is
+    down to half its size. With several PAUSE queues, reading resumes once none of
+    them is full. Dropped reports are counted in dropped.
+
+    Created with BLEScanRequester.reports.
+
+        :param requester: The requester feeding the queue
+        :type requester: BLEScanRequester
+        :param maxsize: Maximum number of reports queued. Default 1024
+        :type maxsize: int
+        :param overflow: One of DROP_OLDEST (default), DROP_NEWEST or PAUSE
+        :type overflow: str
+        :returns: ReportQueue instance.
+        :rtype: ReportQueue
+
+    """
+
+    def __init__(self, requester, maxsize=1024, overflow=DROP_OLDEST):
+        if overflow not in (DROP_OLDEST, DROP_NEWEST, PAUSE):
+            raise ValueError("Unknown overflow policy {!r}".format(overflow))
+        self.requester = requester
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = deque()
+        self._waiter = None
+        self._paused = False
+        self._closed = False
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, reports):
+        """Add reports to the queue"""
+        queue = self._queue
+        for report in reports:
+            if len(queue) >= self.maxsize:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    continue
+                elif self.overflow == DROP_OLDEST:
+                    queue.popleft()
+                    self.dropped += 1
+                elif not self._paused:
+                    # Whatever was already read is still queued
+                    self.requester._pause_reading()
+                    self._paused = True
+            queue.append(report)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def close(self):
+        """Stop receiving reports. Iteration ends once the queued reports are read"""
+        if self._closed:
+            return
+        self._closed = True
+        if self in self.requester._report_queues:
+            self.requester._report_queues.remove(self)
+            self.requester._dropped_reports += self.dropped
+        self._resume()
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _resume(self):
+        if self._paused:
+            self._paused = False
+            self.requester._resume_reading()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._queue:
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        report = self._queue.popleft()
+        if self._paused and len(self._queue) <= self.maxsize // 2:
+            self._resume()
+        return report
+
 
 class BLEScanRequester(asyncio.Protocol):
-    """Protocol handling the requests"""
+    """Protocol handling the requests
+
+    Once initialised, each packet received is handed to process.
+
+    If process_batch is set, advertising report events are instead collected for
+    up to batch_delay seconds, or until batch_size of them have been received,
+    then decoded in one pass. process_batch is called with the list of decoded
+    HCI_LEM_Adv_Report/HCI_LEM_Ext_Adv_Report. Other packets still go to process.
+    Packets that fail to decode are counted in decode_errors. So are packets too
+    short to be an event, which are dropped.
+
+    Decoded reports can also be read with "async for report in requester.reports()",
+    see ReportQueue.
+
+    If pipeline is set, to a DecodePipeline, the packets are only timestamped and
+    queued, they are decoded in a pool of processes.
+
+    If recorder is set, to a CaptureWriter, the packets received and the commands
+    sent are recorded. It is closed when the connection is lost.
+
+    If metrics is set, to a Metrics, the packets received, the decoding time and the
+    time spent in the callbacks are measured. See Metrics.attach.
+
+    The controller can do part of the filtering: see send_scan_request, and the
+    accept list methods, to only receive the devices of interest, and each of them
+    only once in a while.
+
+    If state_table is set, to a DeviceTable, only the reports whose data changed,
+    or whose heartbeat is due, are delivered. This applies to the reports given to
+    process_batch and to reports(), not to the packets given to process.
+
+    If reassembler is set to an ExtAdvReassembler, fragmented extended advertisements
+    are only delivered once complete, to process_batch and to reports(). process,
+    which gets the raw packets, still gets each fragment on its own.
+
+    Commands sent with execute are flow controlled, and their answer is returned.
+
+    Packets can be routed, by category, without being decoded: see packet_category.
+    routes maps a category to the handler called with the raw packets of that
+    category, instead of them going through the path above, or to None to drop
+    them. For instance, routes[COMMAND_COMPLETE] = None keeps Command Complete and
+    Command Status events away from process.
+
+    If kernel_filter is True, once initialised, a Linux socket filter is installed so
+    that only the events in filter_events (by default LE Meta events) wake up the
+    process. While commands are waiting for their Command Complete/Status event,
+    those events are let through too. An answer lost on the way only lets them
+    through until command_timeout seconds after the last command sent.
+    """
 
     def __init__(self):
         self._supported_commands = None
@@ -1783,6 +2612,36 @@ class BLEScanRequester(asyncio.Protocol):
         self.smac = None
         self.sip = None
         self.process = self.default_process
+        self.process_batch = None
+        self.batch_size = 64
+        self.batch_delay = 0.01
+        self.decode_errors = 0
+        self.reassembler = None
+        self.kernel_filter = False
+        self.filter_events = {HCI_EV_LE_META}
+        self._filter_events = None
+        self._pending_commands = 0
+        self._pending_timer = None
+        self._batch = []
+        self._batch_timer = None
+        self._report_queues = []
+        # How many report queues asked for reading to be paused
+        self._pauses = 0
+        # Reports dropped by the report queues since closed
+        self._dropped_reports = 0
+        self.pipeline = None
+        self.recorder = None
+        self.state_table = None
+        self.metrics = None
+        self._dups_task = None
+        self.routes = {}
+        self.command_timeout = 2.0
+        # The controller's Num_HCI_Command_Packets, updated by each answer
+        self._credits = 1
+        # (opcode, command, future) waiting for a credit, and opcode -> futures of
+        # the commands sent, waiting for their answer
+        self._commands = deque()
+        self._executing = {}
 
     def _use_ext_scan(self):
         # Bluetooth Core Specification Vol 2, Part E, Section 6.27
@@ -1794,34 +2653,119 @@ class BLEScanRequester(asyncio.Protocol):
         self.transport = transport
 
         command = HCI_Cmd_Read_Local_Supported_Commands()
-        self.transport.write(command.encode())
+        self._write(command.encode())
 
     def connection_lost(self, exc):
+        self._cancel_dups_reset()
+        if self._pending_timer is not None:
+            self._pending_timer.cancel()
+            self._pending_timer = None
+        self._fail_commands(ConnectionError("Connection lost"))
+        if self._batch:
+            self._flush_batch()
+        for queue in list(self._report_queues):
+            queue.close()
+        if self.pipeline is not None:
+            self.pipeline.close()
+        if self.recorder is not None:
+            self.recorder.close()
         super().connection_lost(exc)
 
-    async def send_scan_request(self, isactivescan=False):
-        """Sending LE scan request"""
+    def _pause_reading(self):
+        self._pauses += 1
+        if self._pauses == 1:
+            self.transport.pause_reading()
+
+    def _resume_reading(self):
+        # The transport is shared, it is only resumed once no queue is full
+        self._pauses -= 1
+        if not self._pauses and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+    def reports(self, maxsize=1024, overflow=DROP_OLDEST):
+        """Return an asynchronous iterator over the decoded advertising reports.
+
+        While it is open, advertising report events are decoded as they are
+        received, and not handed to process.
+
+            :param maxsize: Maximum number of reports queued. Default 1024
+            :type maxsize: int
+            :param overflow: One of DROP_OLDEST (default), DROP_NEWEST or PAUSE
+            :type overflow: str
+            :returns: The queue of HCI_LEM_Adv_Report/HCI_LEM_Ext_Adv_Report
+            :rtype: ReportQueue
+        """
+        queue = ReportQueue(self, maxsize, overflow)
+        self._report_queues.append(queue)
+        return queue
+
+    async def send_scan_request(
+        self, isactivescan=False, accept_list=False, filter_dups=False, dups_reset=0
+    ):
+        """Sending LE scan request
+
+        With filter_dups, the controller reports each device once, until scanning
+        is enabled again. If dups_reset is set, scanning is disabled and enabled
+        again every dups_reset seconds, so that the devices are reported again.
+
+            :param isactivescan: Request scan responses. Default False
+            :type isactivescan: bool
+            :param accept_list: Only report devices in the accept list. Default False
+            :type accept_list: bool
+            :param filter_dups: Let the controller filter duplicates. Default False
+            :type filter_dups: bool
+            :param dups_reset: Seconds between duplicate filter resets. Default 0, never
+            :type dups_reset: float
+        """
         await self._initialized.wait()
 
+        nfilter = 1 if accept_list else 0
         if self._use_ext_scan():
             sparam = [int(isactivescan)] * 8
-            command = HCI_Cmd_LE_Set_Extended_Scan_Params(scan_type=sparam)
+            command = HCI_Cmd_LE_Set_Extended_Scan_Params(
+                nfilter=nfilter, scan_type=sparam
+            )
             self._send_command_no_wait(command)
 
-            command = HCI_Cmd_LE_Set_Extended_Scan_Enable(True, 0)
-            return self._send_command_no_wait(command)
+            command = HCI_Cmd_LE_Set_Extended_Scan_Enable(True, int(filter_dups))
         else:
             sparam = int(isactivescan)
-            command = HCI_Cmd_LE_Set_Scan_Params(scan_type=sparam)
+            command = HCI_Cmd_LE_Set_Scan_Params(scan_type=sparam, nfilter=nfilter)
             self._send_command_no_wait(command)
 
-            command = HCI_Cmd_LE_Scan_Enable(True, False)
-            return self._send_command_no_wait(command)
+            command = HCI_Cmd_LE_Scan_Enable(True, filter_dups)
+        self._cancel_dups_reset()
+        if filter_dups and dups_reset:
+            self._dups_task = asyncio.ensure_future(
+                self._reset_dups(command, dups_reset)
+            )
+        return self._send_command_no_wait(command)
+
+    async def _reset_dups(self, enable, dups_reset):
+        # The controller forgets the devices it reported when scanning is enabled
+        if self._use_ext_scan():
+            disable = HCI_Cmd_LE_Set_Extended_Scan_Enable(False, 0)
+        else:
+            disable = HCI_Cmd_LE_Scan_Enable(False, False)
+        while True:
+            await asyncio.sleep(dups_reset)
+            try:
+                await self.execute(disable)
+                await self.execute(enable)
+            except asyncio.TimeoutError:
+                # Tried again at the next reset
+                pass
+
+    def _cancel_dups_reset(self):
+        if self._dups_task is not None:
+            self._dups_task.cancel()
+            self._dups_task = None
 
     async def stop_scan_request(self):
         """Sending LE scan request"""
         await self._initialized.wait()
 
+        self._cancel_dups_reset()
         if self._use_ext_scan():
             command = HCI_Cmd_LE_Set_Extended_Scan_Enable(False, 0)
         else:
@@ -1829,15 +2773,177 @@ class BLEScanRequester(asyncio.Protocol):
 
         return self._send_command_no_wait(command)
 
+    async def clear_accept_list(self):
+        """Remove all the devices from the controller's accept list.
+
+        The accept list must not be changed while scanning with accept_list. The
+        command is sent with execute.
+
+            :returns: The Command Complete event
+            :rtype: HCI_Event
+        """
+        return await self.execute(HCI_Cmd_LE_Clear_Accept_List())
+
+    async def add_to_accept_list(self, mac, addr_type=0):
+        """Add a device to the controller's accept list.
+
+        The command is sent with execute.
+
+            :param mac: The MAC address of the device
+            :type mac: str
+            :param addr_type: 0 => Public (default), 1 => Random
+            :type addr_type: int
+            :returns: The Command Complete event
+            :rtype: HCI_Event
+        """
+        command = HCI_Cmd_LE_Add_Device_To_Accept_List(mac, addr_type)
+        return await self.execute(command)
+
+    async def remove_from_accept_list(self, mac, addr_type=0):
+        """Remove a device from the controller's accept list.
+
+        The command is sent with execute.
+
+            :param mac: The MAC address of the device
+            :type mac: str
+            :param addr_type: 0 => Public (default), 1 => Random
+            :type addr_type: int
+            :returns: The Command Complete event
+            :rtype: HCI_Event
+        """
+        command = HCI_Cmd_LE_Remove_Device_From_Accept_List(mac, addr_type)
+        return await self.execute(command)
+
     def _send_command_no_wait(self, command):
-        return self.transport.write(command.encode())
+        if self.kernel_filter:
+            self._pending_commands += 1
+            self._update_kernel_filter()
+            if self._pending_timer is not None:
+                self._pending_timer.cancel()
+            self._pending_timer = asyncio.get_running_loop().call_later(
+                self.command_timeout, self._pending_expired
+            )
+        return self._write(command.encode())
+
+    def _pending_expired(self):
+        # No answer for command_timeout seconds after the last command: those still
+        # counted were lost, stop letting Command Complete/Status events through
+        self._pending_timer = None
+        if self._pending_commands:
+            self._pending_commands = 0
+            self._update_kernel_filter()
+
+    def _write(self, data):
+        # Everything sent to the controller goes through here, to be recorded
+        if self.recorder is not None:
+            self.recorder.write(data, received=False)
+        return self.transport.write(data)
+
+    def _update_kernel_filter(self):
+        events = set(self.filter_events)
+        if self._pending_commands:
+            events |= {HCI_EV_CMD_COMPLETE, HCI_EV_CMD_STATUS}
+        if events != self._filter_events:
+            sock = self.transport.get_extra_info("socket")
+            set_hci_filter(sock, hci_filter((HCI_EVENT,), events))
+            self._filter_events = events
 
     async def send_command(self, command):
-        """Sending an arbitrary command"""
+        """Sending an arbitrary command, without waiting for the answer. See execute"""
         await self._initialized.wait()
         return self._send_command_no_wait(command)
 
+    async def execute(self, command, timeout=None):
+        """Send a command, and return its Command Complete or Command Status event.
+
+        Commands are only sent when the controller can accept them, as told by the
+        "allow pkt" (Num_HCI_Command_Packets) of its last Command Complete/Status
+        event. The others are queued, and sent in order.
+
+        If there is no answer in time, the command is forgotten, and
+        asyncio.TimeoutError is raised.
+
+            :param command: The command to send
+            :type command: HCI_Command
+            :param timeout: Seconds to wait for the answer. Default command_timeout
+            :type timeout: float
+            :returns: The decoded event, with a HCI_CC_Event or HCI_CS_Event
+            :rtype: HCI_Event
+        """
+        await self._initialized.wait()
+        if timeout is None:
+            timeout = self.command_timeout
+        opcode = unpack("<H", command.cmd.encode())[0]
+        future = asyncio.get_running_loop().create_future()
+        entry = (opcode, command, future)
+        self._commands.append(entry)
+        self._send_commands()
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future.cancelled():
+                self._forget_command(entry)
+
+    def _send_commands(self):
+        while self._commands and self._credits > 0:
+            opcode, command, future = self._commands.popleft()
+            self._credits -= 1
+            self._executing.setdefault(opcode, deque()).append(future)
+            self._send_command_no_wait(command)
+
+    def _command_answered(self, packet):
+        if packet[1] == HCI_EV_CMD_COMPLETE:
+            if len(packet) < 6:
+                return
+            credits, opcode = packet[3], packet[4] | packet[5] << 8
+        else:
+            if len(packet) < 7:
+                return
+            credits, opcode = packet[4], packet[5] | packet[6] << 8
+        self._credits = credits
+        waiting = self._executing.get(opcode)
+        if waiting:
+            future = waiting.popleft()
+            if not waiting:
+                del self._executing[opcode]
+            ev = HCI_Event()
+            ev.decode(packet)
+            future.set_result(ev)
+        self._send_commands()
+
+    def _forget_command(self, entry):
+        opcode, command, future = entry
+        if entry in self._commands:
+            self._commands.remove(entry)
+            return
+        waiting = self._executing.get(opcode)
+        if waiting and future in waiting:
+            waiting.remove(future)
+            if not waiting:
+                del self._executing[opcode]
+            # Sent, but never answered: do not wait for the credit it holds
+            self._credits += 1
+            self._send_commands()
+
+    def _fail_commands(self, exc):
+        futures = [future for opcode, command, future in self._commands]
+        for waiting in self._executing.values():
+            futures.extend(waiting)
+        self._commands.clear()
+        self._executing.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(exc)
+
     def data_received(self, packet):
+        if self.recorder is not None:
+            self.recorder.write(packet)
+        if self.metrics is not None:
+            self.metrics.packet(packet)
+        if len(packet) < 2:
+            # Not even an event code, there is nothing to do with it
+            self.decode_errors += 1
+            return
         if self._uninitialized:
             ev = HCI_Event()
             extra_data = ev.decode(packet)
@@ -1852,7 +2958,83 @@ class BLEScanRequester(asyncio.Protocol):
                     self._handle_cc_le_read_local_supported_features(resp)
 
                 return
-        self.process(packet)
+        if (
+            packet[1] in (HCI_EV_CMD_COMPLETE, HCI_EV_CMD_STATUS)
+            and packet[0] == HCI_EVENT
+        ):
+            self._command_answered(packet)
+            if self._pending_commands:
+                self._pending_commands -= 1
+                self._update_kernel_filter()
+        if self.routes:
+            handler = self.routes.get(packet_category(packet), _UNROUTED)
+            if handler is not _UNROUTED:
+                if handler is not None:
+                    self._callback(handler, packet)
+                return
+        if self.pipeline is not None:
+            self.pipeline.feed(packet)
+            return
+        if self.process_batch is not None:
+            self._batch.append(packet)
+            if len(self._batch) >= self.batch_size:
+                self._flush_batch()
+            elif self._batch_timer is None:
+                self._batch_timer = asyncio.get_running_loop().call_later(
+                    self.batch_delay, self._flush_batch
+                )
+            return
+        if self._report_queues:
+            self._handle_packets([packet])
+            return
+        self._callback(self.process, packet)
+
+    def _callback(self, callback, arg):
+        if self.metrics is None:
+            return callback(arg)
+        start = time.perf_counter()
+        callback(arg)
+        self.metrics.callback_time.observe(time.perf_counter() - start)
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        self._handle_packets(batch)
+
+    def _handle_packets(self, packets):
+        # Decode the advertising reports and deliver them, other packets go to process
+        reports = []
+        metrics = self.metrics
+        for packet in packets:
+            try:
+                if metrics is None:
+                    found = adv_reports(packet)
+                else:
+                    start = time.perf_counter()
+                    found = adv_reports(packet)
+                    metrics.decode_time.observe(time.perf_counter() - start)
+            except (error, IndexError, ValueError):
+                self.decode_errors += 1
+                continue
+            if found is None:
+                self._callback(self.process, packet)
+            elif self.reassembler is None:
+                reports.extend(found)
+            else:
+                for report in found:
+                    if isinstance(report, HCI_LEM_Ext_Adv_Report):
+                        report = self.reassembler.feed(report)
+                    if report is not None:
+                        reports.append(report)
+        if reports and self.state_table is not None:
+            reports = self.state_table.filter(reports)
+        if reports:
+            if self.process_batch is not None:
+                self._callback(self.process_batch, reports)
+            for queue in self._report_queues:
+                queue.put(reports)
 
     def _handle_cc_read_local_supported_commands(self, resp):
         if resp.val[0] == 0:
@@ -1861,7 +3043,7 @@ class BLEScanRequester(asyncio.Protocol):
             self._supported_commands = [0] * 64
 
         command = HCI_Cmd_LE_Read_Local_Supported_Features()
-        self.transport.write(command.encode())
+        self._write(command.encode())
 
     def _handle_cc_le_read_local_supported_features(self, resp):
         if resp.val[0] == 0:
@@ -1869,6 +3051,10 @@ class BLEScanRequester(asyncio.Protocol):
         else:
             self._le_features = [0] * 8
 
+        if self.kernel_filter and platform.system() == "Linux":
+            self._update_kernel_filter()
+        else:
+            self.kernel_filter = False
         self._initialized.set()
         self._uninitialized = False
 
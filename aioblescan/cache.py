@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with reusing decoded advertisements that are repeated with
+# only the RSSI changing
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import sys
+from collections import OrderedDict
+from .aioblescan import HCI_EVENT, HCI_EV_LE_META, IntByte
+
+
+class DecodeCache:
+    """Class keeping decoded advertising reports, to reuse them when repeated.
+
+    Only events holding a single legacy advertising report are cached. They are
+    keyed by the report bytes without the trailing RSSI: type, peer address and
+    advertising data. When the same report comes again, a copy of the cached
+    event is returned, with its own RSSI field set to the new one. The rest of
+    the event is shared, it should not be modified.
+
+    The cache holds at most max_entries events, and at most max_bytes of memory.
+    Each entry is charged the memory used by its event, its value and its key, as
+    measured when it is cached. The least recently used events are evicted first.
+
+        :param max_entries: Maximum number of cached events. Default 1024
+        :type max_entries: int
+        :param max_bytes: Maximum memory used. Default 4 MiB
+        :type max_bytes: int
+        :returns: DecodeCache instance.
+        :rtype: DecodeCache
+
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=4 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (event, value, size)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(data):
+        """Return the key of a packet, or None if it cannot be cached.
+
+            :param data: The raw HCI packet
+            :type data: bytes/memoryview
+            :returns: The report without its RSSI
+            :rtype: bytes
+        """
+        if len(data) < 15 or data[0] != HCI_EVENT or data[1] != HCI_EV_LE_META:
+            return None
+        # A single LE Advertising Report, with its RSSI, in the whole packet
+        if data[3] != 0x02 or data[4] != 1 or len(data) != 3 + data[2]:
+            return None
+        if len(data) != 15 + data[13]:
+            return None
+        return bytes(data[5:-1])
+
+    def get(self, key, data):
+        """Return the cached (event, value) for key, with the RSSI of data.
+
+        The event is a copy of the cached one, sharing all its fields but the
+        RSSI, so holders of the events returned earlier keep their RSSI.
+
+            :param key: The key, from DecodeCache.key
+            :type key: bytes
+            :param data: The raw HCI packet
+            :type data: bytes/memoryview
+            :returns: The event and the value stored with it, or None
+            :rtype: tuple
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return _with_rssi(entry[0], data), entry[1]
+
+    def put(self, key, ev, value=None):
+        """Cache a decoded event, and a value, for instance a plugin result"""
+        report = ev.payload[2].payload[1].payload[0]
+        if not isinstance(report.payload[-1], IntByte):
+            return
+        if key in self._entries:
+            self._remove(key)
+        size = _size((ev, value, key))
+        self._entries[key] = (ev, value, size)
+        self.size += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.size > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+
+def _with_rssi(ev, data):
+    # Copy the event, and the packets down to the report, with a new RSSI field
+    rssi = IntByte("rssi")
+    rssi.decode(data[-1:])
+    ev = _copy(ev)
+    meta = _copy(ev.payload[2])
+    reports = _copy(meta.payload[1])
+    report = _copy(reports.payload[0])
+    report.payload = report.payload[:-1] + [rssi]
+    reports.payload = [report]
+    meta.payload = [meta.payload[0], reports] + meta.payload[2:]
+    ev.payload = ev.payload[:2] + [meta] + ev.payload[3:]
+    ev.raw_data = bytes(data)
+    return ev
+
+
+def _copy(packet):
+    # Shallow copy, copy.copy is several times slower
+    result = object.__new__(type(packet))
+    result.__dict__.update(packet.__dict__)
+    return result
+
+
+# Kept for each entry of the OrderedDict, besides the entry itself
+_ENTRY_OVERHEAD = 100
+
+
+def _size(obj):
+    """Return an estimate of the memory used by obj and what it refers to.
+
+    Lists, tuples, dictionaries and aioblescan objects are followed. The field
+    names and lookup tables, shared by all the events, and small integers are
+    not counted.
+    """
+    total = _ENTRY_OVERHEAD
+    seen = set()
+    stack = [obj]
+    while stack:
+        x = stack.pop()
+        if x is None or isinstance(x, (bool, type)) or id(x) in seen:
+            continue
+        if isinstance(x, int) and -5 <= x <= 256:
+            continue
+        seen.add(id(x))
+        total += sys.getsizeof(x)
+        if isinstance(x, (list, tuple)):
+            stack.extend(x)
+        elif isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif type(x).__module__.startswith("aioblescan"):
+            attrs = getattr(x, "__dict__", None)
+            if attrs is not None:
+                total += sys.getsizeof(attrs)
+            attrs = dict(attrs or ())
+            for cls in type(x).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    attrs[slot] = getattr(x, slot, None)
+            attrs.pop("name", None)
+            attrs.pop("loval", None)
+            stack.extend(attrs.values())
+    return total
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with recording HCI packets to, and replaying them from,
+# btsnoop or pcap capture files
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import asyncio
+import mmap
+import time
+from array import array
+from collections import namedtuple
+from struct import Struct, unpack_from
+from .aioblescan import HCI_COMMAND, HCI_EVENT, HCI_EV_CMD_COMPLETE, HCI_EV_LE_META
+from .aioblescan import HCI_Event
+
+try:
+    import numpy as np
+except ImportError:  # Only needed by CaptureIndex
+    np = None
+
+BTSNOOP = "btsnoop"
+PCAP = "pcap"
+
+# btsnoop, big endian. Only the HCI UART (H4) datalink is handled
+BTSNOOP_MAGIC = b"btsnoop\x00"
+BTSNOOP_H4 = 1002
+_BTSNOOP_HDR = Struct(">8sII")  # magic, version, datalink
+_BTSNOOP_REC = Struct(">IIIIq")  # orig len, incl len, flags, drops, timestamp
+# Microseconds from year 0 to the Unix epoch, as used by Wireshark and BlueZ
+_BTSNOOP_EPOCH = 0x00DCDDB30F2F8000
+
+# pcap, written little endian
+PCAP_MAGIC = 0xA1B2C3D4
+DLT_BLUETOOTH_HCI_H4 = 187
+DLT_BLUETOOTH_HCI_H4_WITH_PHDR = 201
+_PCAP_HDR = Struct("<IHHiIII")  # magic, major, minor, zone, sigfigs, snaplen, dlt
+_PCAP_REC = Struct("<IIII")  # seconds, microseconds, incl len, orig len
+
+CaptureRecord = namedtuple("CaptureRecord", ["timestamp", "packet", "received"])
+CaptureRecord.__doc__ = """A packet read from a capture file.
+
+    timestamp is in seconds since the epoch, packet is the H4 packet, starting with
+    its packet type, and received is False for packets sent to the controller.
+"""
+
+
+class CaptureWriter:
+    """Class writing HCI packets to a btsnoop or pcap file.
+
+    Records are gathered in memory and written buffer_size bytes at a time.
+    Set it as the recorder of a BLEScanRequester to record what it receives, and
+    the commands it sends.
+
+        :param file: The file name, or a binary file object
+        :type file: str/file
+        :param fmt: BTSNOOP (default) or PCAP
+        :type fmt: str
+        :param buffer_size: How many bytes to gather before writing. Default 65536
+        :type buffer_size: int
+        :returns: CaptureWriter instance.
+        :rtype: CaptureWriter
+
+    """
+
+    def __init__(self, file, fmt=BTSNOOP, buffer_size=65536):
+        if fmt not in (BTSNOOP, PCAP):
+            raise ValueError("Unknown capture format {!r}".format(fmt))
+        if isinstance(file, str):
+            self._file = open(file, "wb")
+            self._owned = True
+        else:
+            self._file = file
+            self._owned = False
+        self.fmt = fmt
+        self.buffer_size = buffer_size
+        self.count = 0
+        if fmt == BTSNOOP:
+            self._buffer = bytearray(_BTSNOOP_HDR.pack(BTSNOOP_MAGIC, 1, BTSNOOP_H4))
+        else:
+            self._buffer = bytearray(
+                _PCAP_HDR.pack(PCAP_MAGIC, 2, 4, 0, 0, 65535, DLT_BLUETOOTH_HCI_H4)
+            )
+
+    def write(self, packet, timestamp=None, received=True):
+        """Add a packet to the capture.
+
+        :param packet: The H4 packet
+        :type packet: bytes
+        :param timestamp: Seconds since the epoch. Default now
+        :type timestamp: float
+        :param received: False for a packet sent to the controller. Default True
+        :type received: bool
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        length = len(packet)
+        if self.fmt == BTSNOOP:
+            flags = int(received)
+            if packet[0] in (HCI_COMMAND, HCI_EVENT):
+                flags |= 2
+            usec = _BTSNOOP_EPOCH + round(timestamp * 1e6)
+            self._buffer += _BTSNOOP_REC.pack(length, length, flags, 0, usec)
+        else:
+            sec, usec = divmod(round(timestamp * 1e6), 1000000)
+            self._buffer += _PCAP_REC.pack(sec, usec, length, length)
+        self._buffer += packet
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write what was gathered"""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_capture(file):
+    """Read the packets of a btsnoop or pcap file.
+
+        :param file: The file name, or a binary file object
+        :type file: str/file
+        :returns: A generator of CaptureRecord
+        :rtype: generator
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            yield from read_capture(f)
+        return
+    header = file.read(_BTSNOOP_HDR.size)
+    if header[:8] == BTSNOOP_MAGIC:
+        _, version, datalink = _BTSNOOP_HDR.unpack(header)
+        if datalink != BTSNOOP_H4:
+            raise ValueError("Unsupported btsnoop datalink {}".format(datalink))
+        yield from _read_btsnoop(file)
+        return
+    header += file.read(_PCAP_HDR.size - len(header))
+    if len(header) == _PCAP_HDR.size:
+        for endian in "<>":
+            fields = Struct(endian + _PCAP_HDR.format[1:]).unpack(header)
+            if fields[0] == PCAP_MAGIC:
+                yield from _read_pcap(file, endian, fields[6])
+                return
+    raise ValueError("Not a btsnoop or pcap file")
+
+
+def _read_btsnoop(file):
+    while True:
+        header = file.read(_BTSNOOP_REC.size)
+        if len(header) < _BTSNOOP_REC.size:
+            return
+        _, length, flags, _, usec = _BTSNOOP_REC.unpack(header)
+        packet = file.read(length)
+        if len(packet) < length:
+            return
+        yield CaptureRecord((usec - _BTSNOOP_EPOCH) / 1e6, packet, bool(flags & 1))
+
+
+def _read_pcap(file, endian, dlt):
+    if dlt not in (DLT_BLUETOOTH_HCI_H4, DLT_BLUETOOTH_HCI_H4_WITH_PHDR):
+        raise ValueError("Unsupported pcap link type {}".format(dlt))
+    record = Struct(endian + _PCAP_REC.format[1:])
+    while True:
+        header = file.read(record.size)
+        if len(header) < record.size:
+            return
+        sec, usec, length, _ = record.unpack(header)
+        packet = file.read(length)
+        if len(packet) < length:
+            return
+        if dlt == DLT_BLUETOOTH_HCI_H4_WITH_PHDR:
+            # 4 bytes, big endian, direction: 0 sent, 1 received
+            received = bool(packet[3] & 1)
+            packet = packet[4:]
+        else:
+            received = packet[:1] != bytes([HCI_COMMAND])
+        yield CaptureRecord(sec + usec / 1e6, packet, received)
+
+
+class ReplayTransport(asyncio.Transport):
+    """Class feeding the packets of a capture to a protocol, as a socket would.
+
+    There is no controller behind it, every command written to it is answered
+    with a Command Complete event with status "Unknown HCI Command", so that a
+    BLEScanRequester initialises itself. Started with replay.
+    """
+
+    def __init__(self, protocol):
+        super().__init__()
+        self.protocol = protocol
+        self.written = []
+        self._reading = asyncio.Event()
+        self._reading.set()
+        self._closing = False
+
+    def write(self, data):
+        self.written.append(data)
+        if data[0] == HCI_COMMAND:
+            body = b"\x01" + bytes(data[1:3]) + b"\x01"
+            packet = bytes([HCI_EVENT, HCI_EV_CMD_COMPLETE, len(body)]) + body
+            asyncio.get_running_loop().call_soon(self.protocol.data_received, packet)
+
+    def pause_reading(self):
+        self._reading.clear()
+
+    def resume_reading(self):
+        self._reading.set()
+
+    def is_reading(self):
+        return self._reading.is_set()
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        self._closing = True
+        self._reading.set()
+
+
+async def replay(protocol, records, realtime=False, speed=1.0):
+    """Feed the received packets of a capture to a protocol.
+
+    The protocol is connected to a ReplayTransport, and connection_lost is called
+    once all packets were fed.
+
+        :param protocol: The protocol, usually a BLEScanRequester
+        :type protocol: asyncio.Protocol
+        :param records: The packets, as from read_capture
+        :type records: iterable
+        :param realtime: Feed the packets at the pace they were captured. Default False
+        :type realtime: bool
+        :param speed: With realtime, how much faster than captured. Default 1.0
+        :type speed: float
+        :returns: The number of packets fed
+        :rtype: int
+    """
+    loop = asyncio.get_running_loop()
+    transport = ReplayTransport(protocol)
+    protocol.connection_made(transport)
+    initialized = getattr(protocol, "_initialized", None)
+    if initialized is not None:
+        await initialized.wait()
+    count = 0
+    start = first = None
+    try:
+        for timestamp, packet, received in records:
+            if transport.is_closing():
+                break
+            if not received:
+                continue
+            if realtime:
+                if first is None:
+                    start, first = loop.time(), timestamp
+                delay = start + (timestamp - first) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif count % 64 == 0:
+                # Let the consumers run
+                await asyncio.sleep(0)
+            if not transport.is_reading():
+                await transport._reading.wait()
+            protocol.data_received(packet)
+            count += 1
+    finally:
+        transport.close()
+        protocol.connection_lost(None)
+    return count
+
+
+class CaptureIndex:
+    """Class indexing a btsnoop or pcap file, mapped in memory, with NumPy.
+
+    Opening the file walks the records once, to find where they are. What is
+    indexed is then read from all records at once, into arrays of the same
+    length as the capture:
+
+        timestamp: seconds since the epoch (float64)
+        received: False for packets sent to the controller (bool)
+        ptype: The H4 packet type (uint8)
+        event: The HCI event code, 0 if not an event (uint8)
+        subevent: The LE Meta subevent code, 0 if not an LE Meta event (uint8)
+        mac: The peer of the first advertising report, 0 if none (uint64)
+
+    MAC addresses are compared as integers, see mac_to_int. select finds the
+    records matching some criteria, and decode decodes only those. NumPy must be
+    installed.
+
+        :param file: The file name
+        :type file: str
+        :returns: CaptureIndex instance.
+        :rtype: CaptureIndex
+
+    """
+
+    def __init__(self, file):
+        if np is None:
+            raise ImportError("CaptureIndex requires numpy")
+        with open(file, "rb") as f:
+            if f.seek(0, 2):
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._map = b""
+        self._walk()
+        buf = np.frombuffer(self._map, dtype=np.uint8)
+        offset, length = self.offset, self.length
+        self.timestamp = self._timestamps(buf)
+        self.ptype = self._gather(buf, offset, 1, length > 0)[:, 0]
+        is_event = (self.ptype == HCI_EVENT) & (length > 1)
+        self.event = self._gather(buf, offset + 1, 1, is_event)[:, 0]
+        is_meta = (self.event == HCI_EV_LE_META) & (length > 3)
+        self.subevent = self._gather(buf, offset + 3, 1, is_meta)[:, 0]
+        # Legacy reports have a 1 byte event type, extended ones 2 bytes
+        peer = np.where(self.subevent == 0x0D, 8, 7)
+        has_peer = ((self.subevent == 0x02) | (self.subevent == 0x0D)) & (
+            length >= peer + 6
+        )
+        mac = np.zeros((len(offset), 8), dtype=np.uint8)
+        mac[:, :6] = self._gather(buf, offset + peer, 6, has_peer)
+        self.mac = mac.view("<u8")[:, 0]
+
+    def _walk(self):
+        data = self._map
+        size = len(data)
+        offsets = array("q")
+        lengths = array("q")
+        if data[:8] == BTSNOOP_MAGIC:
+            if unpack_from(">I", data, 12)[0] != BTSNOOP_H4:
+                raise ValueError("Unsupported btsnoop datalink")
+            self.fmt, endian, pos, header, skip = BTSNOOP, ">", 16, 24, 0
+            self._length_at = 4
+        else:
+            self.fmt, pos, header = PCAP, _PCAP_HDR.size, _PCAP_REC.size
+            for endian in "<>":
+                if size >= pos and unpack_from(endian + "I", data)[0] == PCAP_MAGIC:
+                    break
+            else:
+                raise ValueError("Not a btsnoop or pcap file")
+            dlt = unpack_from(endian + "I", data, 20)[0]
+            if dlt not in (DLT_BLUETOOTH_HCI_H4, DLT_BLUETOOTH_HCI_H4_WITH_PHDR):
+                raise ValueError("Unsupported pcap link type {}".format(dlt))
+            skip = 4 if dlt == DLT_BLUETOOTH_HCI_H4_WITH_PHDR else 0
+            self._length_at = 8
+        incl = Struct(endian + "I")
+        while pos + header <= size:
+            length = incl.unpack_from(data, pos + self._length_at)[0]
+            if pos + header + length > size:
+                break
+            offsets.append(pos)
+            lengths.append(length)
+            pos += header + length
+        self._endian = endian
+        self._skip = skip
+        self.record = np.array(offsets, dtype=np.int64)
+        self.offset = self.record + header + skip
+        self.length = np.maximum(np.array(lengths, dtype=np.int64) - skip, 0)
+
+    @staticmethod
+    def _gather(buf, offset, width, mask):
+        # The width bytes at each offset, zero where mask is False
+        idx = offset[:, None] + np.arange(width)
+        idx[~mask] = 0
+        result = buf[idx]
+        result[~mask] = 0
+        return result
+
+    def _timestamps(self, buf):
+        every = np.ones(len(self.record), dtype=bool)
+        if self.fmt == BTSNOOP:
+            usec = self._gather(buf, self.record + 16, 8, every).view(">i8")[:, 0]
+            flags = self._gather(buf, self.record + 11, 1, every)[:, 0]
+            self.received = (flags & 1).astype(bool)
+            return (usec - _BTSNOOP_EPOCH) / 1e6
+        words = self._gather(buf, self.record, 8, every).view(self._endian + "u4")
+        if self._skip:
+            direction = self._gather(buf, self.record + _PCAP_REC.size + 3, 1, every)
+            self.received = (direction[:, 0] & 1).astype(bool)
+        else:
+            ptype = self._gather(buf, self.offset, 1, self.length > 0)[:, 0]
+            self.received = ptype != HCI_COMMAND
+        return words[:, 0] + words[:, 1] / 1e6
+
+    def __len__(self):
+        return len(self.offset)
+
+    def packet(self, idx):
+        """Return the packet of a record, without copying it"""
+        start = int(self.offset[idx])
+        return memoryview(self._map)[start : start + int(self.length[idx])]
+
+    @staticmethod
+    def mac_to_int(mac):
+        """Convert a MAC address, like "a4:c1:38:40:52:38", as indexed in mac"""
+        return int(mac.replace(":", ""), 16)
+
+    def select(self, macs=None, since=None, until=None, subevents=None):
+        """Find the received records matching all the given criteria.
+
+            :param macs: The MAC addresses of the peers
+            :type macs: list
+            :param since: The earliest timestamp
+            :type since: float
+            :param until: The latest timestamp
+            :type until: float
+            :param subevents: The LE Meta subevent codes
+            :type subevents: list
+            :returns: The indices of the records
+            :rtype: numpy.ndarray
+        """
+        mask = self.received.copy()
+        if macs is not None:
+            wanted = [x if isinstance(x, int) else self.mac_to_int(x) for x in macs]
+            mask &= np.isin(self.mac, np.array(wanted, dtype=np.uint64))
+        if since is not None:
+            mask &= self.timestamp >= since
+        if until is not None:
+            mask &= self.timestamp <= until
+        if subevents is not None:
+            mask &= np.isin(self.subevent, subevents)
+        return np.flatnonzero(mask)
+
+    def decode(self, selection=None):
+        """Decode the selected records with HCI_Event.
+
+            :param selection: Indices of records, as from select. Default all
+            :type selection: list
+            :returns: A generator of (timestamp, HCI_Event)
+            :rtype: generator
+        """
+        if selection is None:
+            selection = range(len(self))
+        for idx in selection:
+            ev = HCI_Event()
+            ev.decode(bytes(self.packet(idx)))
+            yield float(self.timestamp[idx]), ev
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with handing advertising reports only to the plugins that
+# may decode them
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import time
+from collections import namedtuple
+from struct import error
+from .aioblescan import HCI_EVENT, HCI_EV_LE_META, HCI_Event
+from .aioblescan import HCI_LEM_Adv_Report, HCI_LEM_Ext_Adv_Report, report_source
+
+Signature = namedtuple("Signature", ["ad_type", "prefix", "offset"], defaults=(0,))
+Signature.__doc__ = """What an advertisement must contain for a plugin to decode it.
+
+    An AD structure of type ad_type whose data, past the type byte, holds prefix at
+    offset. For instance Signature(0xFF, b"\\x99\\x04") for the manufacturer specific
+    data of company 0x0499, or Signature(0x16, b"\\x1a\\x18") for service data of
+    UUID 0x181A.
+"""
+
+
+def ad_structures(data):
+    """List the AD structures of the advertising reports of an HCI packet.
+
+    Both legacy and extended advertising reports are handled, without decoding
+    them into an HCI_Event.
+
+        :param data: The raw HCI packet
+        :type data: bytes/memoryview
+        :returns: (ad_type, offset, length) as in AdvRecord.ad, or None if not a report
+        :rtype: list
+    """
+    if len(data) < 5 or data[0] != HCI_EVENT or data[1] != HCI_EV_LE_META:
+        return None
+    if data[3] == 0x02:
+        # 8 bytes from event type to peer address, then the data length. The
+        # data is followed by the RSSI.
+        header, trailer = 8, 1
+    elif data[3] == 0x0D:
+        # 23 bytes from event type to direct address, then the data length
+        header, trailer = 23, 0
+    else:
+        return None
+    result = []
+    offset = 5
+    for _ in range(data[4]):
+        start = offset + header + 1
+        end = start + data[offset + header]
+        offset = start
+        while offset + 1 < end:
+            length = data[offset]
+            if length:
+                result.append((data[offset + 1], offset + 2, length - 1))
+            offset += 1 + length
+        offset = end + trailer
+    return result
+
+
+class Dispatcher:
+    """Class handing advertising reports only to the plugins that may decode them.
+
+    Each decoder may list, in its signatures attribute, the Signature of the
+    advertisements it decodes. Packets are first checked against all those
+    signatures, without being decoded. Only when some match is the packet decoded
+    into an HCI_Event, and handed to the matching decoders, in order, until one
+    of them returns a result. Decoders without signatures are always tried.
+
+    Checking the signatures costs a few µs per packet. When the first decoder
+    would decode a packet anyway, as EddyStone for Eddystone frames when it comes
+    first, this is a little slower than trying every decoder in turn. Packets no
+    decoder wants, usually most of them, are not decoded at all.
+
+    With a DecodeCache, a repeated advertisement is not decoded again. A result
+    that is a dictionary is reused, with its "rssi" updated. Other results are
+    computed again from the cached event.
+
+    With a DeviceTable, the result of an event holding a single advertising
+    report is kept for its advertiser, the report_source of the report, with
+    DeviceTable.set_result.
+
+        :param decoders: The plugin decoders
+        :type decoders: list
+        :param cache: Where to keep decoded advertisements. Default None
+        :type cache: DecodeCache
+        :param metrics: Where to measure decoding and plugins. Default None
+        :type metrics: Metrics
+        :param state_table: Where to keep the results of each device. Default None
+        :type state_table: DeviceTable
+        :returns: Dispatcher instance.
+        :rtype: Dispatcher
+
+    """
+
+    def __init__(self, decoders, cache=None, metrics=None, state_table=None):
+        self.decoders = list(decoders)
+        self.cache = cache
+        self.metrics = metrics
+        self.state_table = state_table
+        self.skipped = 0
+        # ad_type -> {(start, end): {prefix: decoder indices}}, so that the data of
+        # an AD structure is sliced once for all the prefixes at the same place
+        index = {}
+        self._always = []
+        for idx, decoder in enumerate(self.decoders):
+            signatures = getattr(decoder, "signatures", None)
+            if not signatures:
+                self._always.append(idx)
+                continue
+            for sig in signatures:
+                prefix = bytes(sig.prefix)
+                where = (sig.offset, sig.offset + len(prefix))
+                places = index.setdefault(sig.ad_type, {})
+                places.setdefault(where, {}).setdefault(prefix, []).append(idx)
+        self._index = {
+            ad_type: tuple((start, end, prefixes) for (start, end), prefixes in x.items())
+            for ad_type, x in index.items()
+        }
+
+    def candidates(self, data):
+        """Return the indices, in order, of the decoders whose signature matches.
+
+            :param data: The raw HCI packet
+            :type data: bytes/memoryview
+            :returns: The decoder indices
+            :rtype: list
+        """
+        try:
+            found = ad_structures(data)
+        except (error, IndexError):
+            found = None
+        if found is None:
+            return list(self._always)
+        index = self._index
+        matched = self._always
+        for ad_type, offset, length in found:
+            places = index.get(ad_type)
+            if places is None:
+                continue
+            for start, end, prefixes in places:
+                if end <= length:
+                    hits = prefixes.get(bytes(data[offset + start : offset + end]))
+                    if hits is not None:
+                        matched = matched + hits
+        if len(matched) > 1:
+            return sorted(set(matched))
+        return list(matched)
+
+    def decode(self, data):
+        """Decode a packet with the first matching decoder that gives a result.
+
+            :param data: The raw HCI packet
+            :type data: bytes/memoryview
+            :returns: (decoder index, result), or None
+            :rtype: tuple
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(data)
+            if key is not None:
+                entry = self.cache.get(key, data)
+                if entry is not None:
+                    found = self._reuse(*entry)
+                    if found and self.state_table is not None:
+                        self._keep(entry[0], found[1])
+                    return found
+        candidates = self.candidates(data)
+        if not candidates:
+            self.skipped += 1
+            return None
+        ev = HCI_Event()
+        if self.metrics is not None:
+            start = time.perf_counter()
+            ev.decode(data)
+            self.metrics.decode_time.observe(time.perf_counter() - start)
+            found = self._first_result(ev, candidates, self._measured_call)
+        else:
+            ev.decode(data)
+            found = self._first_result(ev, candidates, self._call)
+        if key is not None:
+            self.cache.put(key, ev, found)
+        if found and self.state_table is not None:
+            self._keep(ev, found[1])
+        return found
+
+    def _keep(self, ev, result):
+        try:
+            reports = ev.payload[2].payload[1].payload
+        except (IndexError, AttributeError):
+            return
+        if len(reports) == 1 and isinstance(
+            reports[0], (HCI_LEM_Adv_Report, HCI_LEM_Ext_Adv_Report)
+        ):
+            self.state_table.set_result(report_source(reports[0]), result)
+
+    def _first_result(self, ev, candidates, call):
+        # The first candidate usually decodes the packet. Indexing the event only
+        # pays off when several plugins look at it.
+        idx = candidates[0]
+        result = call(idx, ev)
+        if result:
+            return idx, result
+        if len(candidates) > 1:
+            with ev.indexed():
+                for idx in candidates[1:]:
+                    result = call(idx, ev)
+                    if result:
+                        return idx, result
+        return None
+
+    def _call(self, idx, ev):
+        return self.decoders[idx].decode(ev)
+
+    def _measured_call(self, idx, ev):
+        decoder = self.decoders[idx]
+        start = time.perf_counter()
+        result = decoder.decode(ev)
+        elapsed = time.perf_counter() - start
+        self.metrics.plugin(type(decoder).__name__, elapsed, result)
+        return result
+
+    def _reuse(self, ev, found):
+        if found is None:
+            return None
+        idx, result = found
+        if isinstance(result, dict):
+            if "rssi" in result:
+                # Cached events hold a single legacy report, ending with its RSSI
+                rssi = ev.payload[2].payload[1].payload[0].payload[-1]
+                result = dict(result, rssi=rssi.val)
+            return idx, result
+        result = self.decoders[idx].decode(ev)
+        return (idx, result) if result else None
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with measuring how the scanning pipeline performs
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import asyncio
+from bisect import bisect_left
+from collections import Counter
+from .aioblescan import HCI_EVENT, HCI_EV_LE_META
+
+# Upper bounds, in seconds, of the time histograms buckets
+TIME_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 1e-2, 0.1)
+# LE Meta subevents holding a number of advertising reports
+_REPORT_SUBEVENTS = (0x02, 0x0B, 0x0D)
+
+
+class Histogram:
+    """Class counting observed values in buckets.
+
+        :param buckets: The upper bound of each bucket, in increasing order
+        :type buckets: tuple
+        :returns: Histogram instance.
+        :rtype: Histogram
+
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        # The last one counts what is above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {
+            "buckets": dict(zip(self.buckets + (float("inf"),), self.counts)),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+class Metrics:
+    """Class gathering counters and histograms about the scanning pipeline.
+
+    Attach it to a BLEScanRequester, and optionally a Dispatcher, to count:
+
+        packets received per HCI event code
+        advertising reports per LE Meta subevent
+        time spent decoding each packet
+        time spent, calls and results of each plugin
+        time spent in the process/process_batch callbacks
+        depth of the report queues, dropped reports and packets
+
+    snapshot returns all of it as a dictionary, prometheus as the Prometheus
+    text format, and serve makes that available over HTTP.
+
+        :returns: Metrics instance.
+        :rtype: Metrics
+
+    """
+
+    def __init__(self):
+        self.packets = Counter()
+        self.reports = Counter()
+        self.decode_time = Histogram()
+        self.callback_time = Histogram()
+        self.plugin_time = {}
+        self.plugin_calls = Counter()
+        self.plugin_hits = Counter()
+        self._requesters = []
+
+    def attach(self, requester):
+        """Measure a BLEScanRequester"""
+        requester.metrics = self
+        self._requesters.append(requester)
+
+    def packet(self, data):
+        """Count a received packet"""
+        if not data or data[0] != HCI_EVENT or len(data) < 2:
+            return
+        self.packets[data[1]] += 1
+        if data[1] == HCI_EV_LE_META and len(data) > 4:
+            subevent = data[3]
+            self.reports[subevent] += data[4] if subevent in _REPORT_SUBEVENTS else 1
+
+    def plugin(self, name, elapsed, hit):
+        """Count a call to a plugin decoder"""
+        histogram = self.plugin_time.get(name)
+        if histogram is None:
+            histogram = self.plugin_time[name] = Histogram()
+        histogram.observe(elapsed)
+        self.plugin_calls[name] += 1
+        if hit:
+            self.plugin_hits[name] += 1
+
+    def queue_depth(self):
+        """Return the number of reports and packets waiting to be handled"""
+        depth = 0
+        for requester in self._requesters:
+            depth += len(requester._batch)
+            for queue in requester._report_queues:
+                depth += len(getattr(queue, "_queue", ()))
+        return depth
+
+    def dropped(self):
+        """Return the number of reports and packets dropped.
+
+        This never goes down: what the report queues dropped is still counted
+        once they are closed.
+        """
+        dropped = 0
+        for requester in self._requesters:
+            dropped += requester.decode_errors + requester._dropped_reports
+            for queue in requester._report_queues:
+                dropped += getattr(queue, "dropped", 0)
+            if requester.pipeline is not None:
+                dropped += requester.pipeline.dropped + requester.pipeline.failed
+        return dropped
+
+    def snapshot(self):
+        """Return the current values of all the metrics.
+
+            :returns: The metrics
+            :rtype: dict
+        """
+        return {
+            "packets": dict(self.packets),
+            "reports": dict(self.reports),
+            "decode_time": self.decode_time.snapshot(),
+            "callback_time": self.callback_time.snapshot(),
+            "plugins": {
+                name: {
+                    "calls": self.plugin_calls[name],
+                    "hits": self.plugin_hits[name],
+                    "time": histogram.snapshot(),
+                }
+                for name, histogram in self.plugin_time.items()
+            },
+            "queue_depth": self.queue_depth(),
+            "dropped": self.dropped(),
+        }
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, helptext, samples):
+            lines.append("# HELP aioblescan_{} {}".format(name, helptext))
+            lines.append("# TYPE aioblescan_{} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("aioblescan_{}{} {}".format(name, labels, value))
+
+        def labels(**kwargs):
+            inside = ",".join('{}="{}"'.format(k, v) for k, v in kwargs.items())
+            return "{" + inside + "}" if inside else ""
+
+        def histogram(name, helptext, histograms):
+            samples = []
+            for extra, hist in histograms:
+                total = 0
+                for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                    total += count
+                    samples.append(("_bucket" + labels(**extra, le=bound), total))
+                samples.append(("_sum" + labels(**extra), hist.sum))
+                samples.append(("_count" + labels(**extra), hist.count))
+            metric(name, "histogram", helptext, samples)
+
+        metric(
+            "packets_total",
+            "counter",
+            "HCI events received, by event code.",
+            [
+                (labels(event="0x{:02x}".format(k)), v)
+                for k, v in self.packets.items()
+            ],
+        )
+        metric(
+            "reports_total",
+            "counter",
+            "Advertising reports received, by LE Meta subevent.",
+            [
+                (labels(subevent="0x{:02x}".format(k)), v)
+                for k, v in self.reports.items()
+            ],
+        )
+        histogram(
+            "decode_seconds", "Time decoding a packet.", [({}, self.decode_time)]
+        )
+        histogram(
+            "callback_seconds",
+            "Time spent in the process callbacks.",
+            [({}, self.callback_time)],
+        )
+        histogram(
+            "plugin_decode_seconds",
+            "Time spent in a plugin decoder.",
+            [({"plugin": k}, v) for k, v in self.plugin_time.items()],
+        )
+        metric(
+            "plugin_calls_total",
+            "counter",
+            "Packets handed to a plugin decoder.",
+            [(labels(plugin=k), v) for k, v in self.plugin_calls.items()],
+        )
+        metric(
+            "plugin_hits_total",
+            "counter",
+            "Packets a plugin decoded.",
+            [(labels(plugin=k), v) for k, v in self.plugin_hits.items()],
+        )
+        metric(
+            "queue_depth",
+            "gauge",
+            "Reports and packets waiting to be handled.",
+            [("", self.queue_depth())],
+        )
+        metric(
+            "dropped_total",
+            "counter",
+            "Reports and packets dropped, or that failed to decode.",
+            [("", self.dropped())],
+        )
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host="127.0.0.1", port=9464):
+        """Serve the metrics, in the Prometheus format, over HTTP.
+
+            :param host: The address to listen on. Default 127.0.0.1
+            :type host: str
+            :param port: The port to listen on. Default 9464
+            :type port: int
+            :returns: The server
+            :rtype: asyncio.Server
+        """
+        return await asyncio.start_server(self._handle_http, host, port)
+
+    async def _handle_http(self, reader, writer):
+        try:
+            # Whatever the request, the answer is the metrics
+            while (await reader.readline()).strip():
+                pass
+            body = self.prometheus().encode()
+            writer.write(
+                b"HTTP/1.0 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(body) + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with scanning with several Bluetooth adapters at once
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import asyncio
+import time
+from collections import deque, OrderedDict
+from .aioblescan import BLEScanRequester, create_bt_socket, report_key
+
+
+class _AdapterTap:
+    """Receive the reports of one requester, as its ReportQueue would."""
+
+    __slots__ = ("scanner", "adapter", "requester")
+
+    def __init__(self, scanner, adapter, requester):
+        self.scanner = scanner
+        self.adapter = adapter
+        self.requester = requester
+
+    def put(self, reports):
+        self.scanner._put(self.adapter, reports)
+
+    def close(self):
+        if self in self.requester._report_queues:
+            self.requester._report_queues.remove(self)
+        self.scanner._adapter_closed(self.adapter)
+
+
+class MultiScanner:
+    """Class scanning with several Bluetooth adapters in one event loop.
+
+    One BLEScanRequester runs on each adapter. Their decoded reports are merged
+    into one stream of (adapter, report), read with "async for":
+
+        scanner = MultiScanner([0, 1])
+        await scanner.start()
+        async for adapter, report in scanner:
+            ...
+
+    The same advertising data from the same device, received by another adapter
+    within window seconds, is dropped and counted in duplicates. When more than
+    maxsize reports are waiting to be read, the oldest are dropped and counted
+    in dropped.
+
+        :param interfaces: The adapters, as in create_bt_socket. Default [0]
+        :type interfaces: list
+        :param window: The de-duplication window, in seconds, 0 to disable. Default 1.0
+        :type window: float
+        :param maxsize: Maximum number of reports queued. Default 1024
+        :type maxsize: int
+        :param requester: The requester class. Default BLEScanRequester
+        :type requester: class
+        :returns: MultiScanner instance.
+        :rtype: MultiScanner
+
+    """
+
+    def __init__(
+        self, interfaces=(0,), window=1.0, maxsize=1024, requester=BLEScanRequester
+    ):
+        self.interfaces = list(interfaces)
+        self.window = window
+        self.maxsize = maxsize
+        self.requester = requester
+        self.requesters = {}
+        self.dropped = 0
+        self.duplicates = 0
+        self._seen = OrderedDict()
+        self._queue = deque()
+        self._waiter = None
+        self._open = set()
+
+    async def start(self, isactivescan=False):
+        """Open a socket on each adapter and start scanning"""
+        loop = asyncio.get_running_loop()
+        for interface in self.interfaces:
+            sock = create_bt_socket(interface)
+            # See __main__ on why the private method is needed
+            conn, btctrl = await loop._create_connection_transport(
+                sock, self.requester, None, None
+            )
+            self.add_requester(interface, btctrl)
+        for btctrl in self.requesters.values():
+            await btctrl.send_scan_request(isactivescan)
+
+    async def stop(self):
+        """Stop scanning and close the sockets.
+
+        Iteration ends once the queued reports are read.
+        """
+        for btctrl in list(self.requesters.values()):
+            if not btctrl.transport.is_closing():
+                await btctrl.stop_scan_request()
+                btctrl.transport.close()
+        for adapter in list(self._open):
+            self._adapter_closed(adapter)
+
+    def add_requester(self, adapter, btctrl):
+        """Merge the reports of a connected requester, tagged with adapter"""
+        self.requesters[adapter] = btctrl
+        self._open.add(adapter)
+        btctrl._report_queues.append(_AdapterTap(self, adapter, btctrl))
+
+    def _put(self, adapter, reports):
+        queue = self._queue
+        window = self.window
+        if window:
+            now = time.monotonic()
+            seen = self._seen
+            while seen:
+                key, (_, last) = next(iter(seen.items()))
+                if now - last <= window:
+                    break
+                del seen[key]
+        for report in reports:
+            if window:
+                key = report_key(report)
+                previous = seen.get(key)
+                if previous is not None and previous[0] != adapter:
+                    self.duplicates += 1
+                    continue
+                seen[key] = (adapter, now)
+                seen.move_to_end(key)
+            if len(queue) >= self.maxsize:
+                queue.popleft()
+                self.dropped += 1
+            queue.append((adapter, report))
+        self._wakeup()
+
+    def _adapter_closed(self, adapter):
+        self._open.discard(adapter)
+        if not self._open:
+            self._wakeup()
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._queue:
+            if not self._open:
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
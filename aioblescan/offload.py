@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with decoding advertised packets in a pool of processes
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from struct import error
+from .aioblescan import HCI_Event
+
+# The decoders of a worker process, set once when the process starts
+_worker_decoders = []
+
+
+def _init_worker(decoders):
+    global _worker_decoders
+    _worker_decoders = decoders
+
+
+def decode_chunk(chunk, decoders=None, failures=None):
+    """Decode a chunk of packets and run the decoders on them.
+
+    As in the command line tool, each packet is tried against each decoder in
+    turn, and the first result is kept. Packets no decoder recognises, or that
+    fail to decode, give no result. A packet making a decoder raise an exception
+    gives no result either, and the other decoders are not tried.
+
+        :param chunk: The (timestamp, packet) to decode
+        :type chunk: list
+        :param decoders: The plugin decoders. Default, those of the worker process
+        :type decoders: list
+        :param failures: Where to append (timestamp, index of the decoder) when one raises
+        :type failures: list
+        :returns: A list of (timestamp, index of the decoder, result)
+        :rtype: list
+    """
+    if decoders is None:
+        decoders = _worker_decoders
+    results = []
+    for timestamp, packet in chunk:
+        ev = HCI_Event()
+        try:
+            ev.decode(packet)
+        except (error, IndexError, ValueError):
+            continue
+        with ev.indexed():
+            for idx, decoder in enumerate(decoders):
+                try:
+                    result = decoder.decode(ev)
+                except Exception:
+                    if failures is not None:
+                        failures.append((timestamp, idx))
+                    break
+                if result:
+                    results.append((timestamp, idx, result))
+                    break
+    return results
+
+
+def _decode_in_worker(chunk):
+    # The results, and how many packets made a decoder fail
+    failures = []
+    results = decode_chunk(chunk, failures=failures)
+    return results, len(failures)
+
+
+class DecodePipeline:
+    """Class decoding advertised packets in a pool of processes.
+
+    Packets given to feed are timestamped and gathered in chunks of chunk_size
+    packets, or of whatever was received in chunk_delay seconds. Each chunk is
+    decoded, with decode_chunk, in one of the worker processes. The results are
+    read, in the order the packets were received, with "async for":
+
+        async for timestamp, idx, result in pipeline:
+            ...
+
+    When more than max_chunks chunks are waiting to be decoded, new chunks are
+    dropped and counted in dropped. Packets making a decoder raise an exception
+    give no result, and are counted in failed once their chunk is read.
+
+    To use it with a BLEScanRequester, set its pipeline attribute.
+
+        :param decoders: The plugin decoders, they must be picklable
+        :type decoders: list
+        :param workers: The number of worker processes. Default, the number of CPUs
+        :type workers: int
+        :param chunk_size: The maximum number of packets in a chunk. Default 256
+        :type chunk_size: int
+        :param chunk_delay: The maximum time, in seconds, a chunk is kept open. Default 0.05
+        :type chunk_delay: float
+        :param max_chunks: The maximum number of chunks being decoded. Default 64
+        :type max_chunks: int
+        :returns: DecodePipeline instance.
+        :rtype: DecodePipeline
+
+    """
+
+    def __init__(
+        self, decoders, workers=None, chunk_size=256, chunk_delay=0.05, max_chunks=64
+    ):
+        self.decoders = decoders
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.max_chunks = max_chunks
+        self.dropped = 0
+        self.failed = 0
+        self._executor = ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(decoders,)
+        )
+        self._chunk = []
+        self._timer = None
+        self._futures = deque()
+        self._results = deque()
+        self._waiter = None
+        self._closed = False
+
+    def feed(self, packet, timestamp=None):
+        """Queue a raw packet for decoding"""
+        if self._closed:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self._chunk.append((timestamp, bytes(packet)))
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.chunk_delay, self.flush
+            )
+
+    def flush(self):
+        """Send the current chunk to be decoded"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        if len(self._futures) >= self.max_chunks:
+            self.dropped += len(chunk)
+            return
+        loop = asyncio.get_running_loop()
+        self._futures.append(
+            loop.run_in_executor(self._executor, _decode_in_worker, chunk)
+        )
+        self._wakeup()
+
+    def close(self):
+        """Stop accepting packets. Iteration ends once all queued packets are decoded"""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._executor.shutdown(wait=False)
+        self._wakeup()
+
+    def _wakeup(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._results:
+            if self._futures:
+                results, failed = await self._futures.popleft()
+                self.failed += failed
+                self._results.extend(results)
+            elif self._closed:
+                raise StopAsyncIteration
+            else:
+                self._waiter = asyncio.get_running_loop().create_future()
+                try:
+                    await self._waiter
+                finally:
+                    self._waiter = None
+        return self._results.popleft()
@@ -23,6 +23,7 @@
 # AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
 # WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
 # IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+import aioblescan as aios
 
 
 def parse(packet):
@@ -59,6 +60,9 @@ def parse_payload(mac, rssi, payload):
 class ATCMiThermometer(object):
     """Class defining the content of an ATC_MiThermometer advertisement."""
 
+    # Environmental Sensing service data
+    signatures = (aios.Signature(0x16, b"\x1a\x18"),)
+
     def decode(self, packet):
         # Look for ATC_MiThermometer custom firmware advertisements
         result = parse(packet)
@@ -24,6 +24,7 @@
 # WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
 # IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
 
+import struct
 import aioblescan as aios
 from urllib.parse import urlparse
 from enum import Enum
@@ -71,6 +72,9 @@ class EddyStone(object):
 
     """
 
+    # Eddystone service data
+    signatures = (aios.Signature(0x16, EDDY_UUID[::-1]),)
+
     def __init__(self, type=ESType.url, param="https://goo.gl/m9UiEA"):
         self.power = 0
         self.payload = (
@@ -236,157 +240,131 @@ class EddyStone(object):
         """Check a parsed packet and figure out if it is an Eddystone Beacon.
         If it is , return the relevant data as a dictionary.
 
+        The advertising data of each report is read as is, the packet is not
+        modified.
+
         Return None, it is not an Eddystone Beacon advertising packet"""
 
-        ssu = packet.retrieve("Complete uuids")
-        found = False
-        for x in ssu:
-            if EDDY_UUID in x:
-                found = True
-                break
-        if not found:
-            return None
+        for report in _reports(packet):
+            frame = find_frame(report.ad_data)
+            if frame is None:
+                continue
+            result = decode_frame(frame)
+            if result is None:
+                return None
+            peer, rssi = _peer_rssi(report)
+            if rssi is not None:
+                result["rssi"] = rssi
+            result["mac address"] = peer
+            return result
+        return None
+
+
+# Expansion of the URL scheme prefix byte, and of each byte of an encoded URL
+URL_SCHEMES = ("http://www.", "https://www.", "http://", "https://")
+URL_EXPANSION = tuple(
+    [".com/", ".org/", ".edu/", ".net/", ".info/", ".biz/", ".gov/"]
+    + [".com", ".org", ".edu", ".net", ".info", ".biz", ".gov"]
+    + [chr(x) for x in range(14, 256)]
+)
+
+_EDDY_SERVICE = EDDY_UUID[::-1]
+_TLM = struct.Struct(">BHhII")
+
+
+def find_frame(ad_data):
+    """Return the Eddystone frame in advertising data.
+
+    The advertising data must list the Eddystone service UUID, and hold
+    Eddystone service data.
+
+        :param ad_data: The AD structures of an advertising report
+        :type ad_data: bytes/memoryview
+        :returns: The service data, past the UUID, or None
+        :rtype: bytes/memoryview
+    """
+    try:
+        structures = aios.ad_scan(ad_data, 0, len(ad_data))[0]
+    except IndexError:
+        return None
+    listed = False
+    frame = None
+    for ad_type, offset, length in structures:
+        if ad_type == 0x03:
+            uuids = ad_data[offset : offset + length]
+            listed = listed or any(
+                uuids[x : x + 2] == _EDDY_SERVICE for x in range(0, length - 1, 2)
+            )
+        elif ad_type == 0x16 and frame is None and length > 2:
+            if ad_data[offset : offset + 2] == _EDDY_SERVICE:
+                frame = ad_data[offset + 2 : offset + length]
+    return frame if listed else None
 
-        found = False
-        adv = packet.retrieve("Advertised Data")
-        for x in adv:
-            luuid = x.retrieve("Service Data uuid")
-            for uuid in luuid:
-                if EDDY_UUID == uuid:
-                    found = x
-                    break
-            if found:
-                break
-
-        if not found:
-            return None
 
-        try:
-            top = found.retrieve("Adv Payload")[0]
-        except:
+def decode_frame(frame):
+    """Decode an Eddystone frame.
+
+        :param frame: The Eddystone service data, past the UUID
+        :type frame: bytes/memoryview
+        :returns: The decoded frame, or None if it is too short
+        :rtype: dict
+    """
+    if not frame:
+        return None
+    etype = frame[0]
+    if etype == ESType.uid.value:
+        if len(frame) < 18:
             return None
-        # Rebuild that part of the structure
-        found.payload.remove(top)
-        # Now decode
-        result = {}
-        data = top.val
-        etype = aios.EnumByte(
-            "type",
-            self.type.val,
-            {
-                ESType.uid.value: "Eddystone-UID",
-                ESType.url.value: "Eddystone-URL",
-                ESType.tlm.value: "Eddystone-TLM",
-                ESType.eid.value: "Eddystone-EID",
-            },
-        )
-        data = etype.decode(data)
-        found.payload.append(etype)
-        if etype.val == ESType.uid.value:
-            power = aios.IntByte("tx_power")
-            data = power.decode(data)
-            found.payload.append(power)
-            result["tx_power"] = power.val
-
-            nspace = aios.Itself("namespace")
-            xx = nspace.decode(
-                data[:10]
-            )  # According to https://github.com/google/eddystone/tree/master/eddystone-uid
-            data = data[10:]
-            found.payload.append(nspace)
-            result["name space"] = nspace.val
-
-            nspace = aios.Itself("instance")
-            xx = nspace.decode(
-                data[:6]
-            )  # According to https://github.com/google/eddystone/tree/master/eddystone-uid
-            data = data[6:]
-            found.payload.append(nspace)
-            result["instance"] = nspace.val
-
-        elif etype.val == ESType.url.value:
-            power = aios.IntByte("tx_power")
-            data = power.decode(data)
-            found.payload.append(power)
-            result["tx_power"] = power.val
-
-            url = aios.EnumByte(
-                "type",
-                0,
-                {
-                    0x00: "http://www.",
-                    0x01: "https://www.",
-                    0x02: "http://",
-                    0x03: "https://",
-                },
-            )
-            data = url.decode(data)
-            result["url"] = url.strval
-            for x in data:
-                if bytes([x]) == b"\x00":
-                    result["url"] += ".com/"
-                elif bytes([x]) == b"\x01":
-                    result["url"] += ".org/"
-                elif bytes([x]) == b"\x02":
-                    result["url"] += ".edu/"
-                elif bytes([x]) == b"\x03":
-                    result["url"] += ".net/"
-                elif bytes([x]) == b"\x04":
-                    result["url"] += ".info/"
-                elif bytes([x]) == b"\x05":
-                    result["url"] += ".biz/"
-                elif bytes([x]) == b"\x06":
-                    result["url"] += ".gov/"
-                elif bytes([x]) == b"\x07":
-                    result["url"] += ".com"
-                elif bytes([x]) == b"\x08":
-                    result["url"] += ".org"
-                elif bytes([x]) == b"\x09":
-                    result["url"] += ".edu"
-                elif bytes([x]) == b"\x10":
-                    result["url"] += ".net"
-                elif bytes([x]) == b"\x11":
-                    result["url"] += ".info"
-                elif bytes([x]) == b"\x12":
-                    result["url"] += ".biz"
-                elif bytes([x]) == b"\x13":
-                    result["url"] += ".gov"
-                else:
-                    result["url"] += chr(x)  # x.decode("ascii") #Yep ASCII only
-                    url = aios.String("url")
-            url.decode(result["url"])
-            found.payload.append(url)
-        elif etype.val == ESType.tlm.value:
-            myinfo = aios.IntByte("version")
-            data = myinfo.decode(data)
-            found.payload.append(myinfo)
-            myinfo = aios.ShortInt("battery")
-            data = myinfo.decode(data)
-            result["battery"] = myinfo.val
-            found.payload.append(myinfo)
-            myinfo = aios.Float88("temperature")
-            data = myinfo.decode(data)
-            found.payload.append(myinfo)
-            result["temperature"] = myinfo.val
-            myinfo = aios.LongInt("pdu count")
-            data = myinfo.decode(data)
-            found.payload.append(myinfo)
-            result["pdu count"] = myinfo.val
-            myinfo = aios.LongInt("uptime")
-            data = myinfo.decode(data)
-            found.payload.append(myinfo)
-            result["uptime"] = myinfo.val * 100  # in msecs
-        # elif etype.val== ESType.tlm.eid:
-        else:
-            result["data"] = data
-            xx = Itself("data")
-            xx.decode(data)
-            found.payload.append(xx)
-
-        rssi = packet.retrieve("rssi")
-        if rssi:
-            result["rssi"] = rssi[-1].val
-        mac = packet.retrieve("peer")
-        if mac:
-            result["mac address"] = mac[-1].val
-        return result
+        return {
+            "tx_power": _signed(frame[1]),
+            "name space": bytes(frame[2:12]),
+            "instance": bytes(frame[12:18]),
+        }
+    elif etype == ESType.url.value:
+        if len(frame) < 3:
+            return None
+        scheme = frame[2]
+        # An unknown scheme gives its number, as EnumByte.strval does
+        url = URL_SCHEMES[scheme] if scheme < len(URL_SCHEMES) else str(scheme)
+        url += bytes(frame[3:]).decode("latin-1").translate(URL_EXPANSION)
+        return {"tx_power": _signed(frame[1]), "url": url}
+    elif etype == ESType.tlm.value:
+        if len(frame) < 1 + _TLM.size:
+            return None
+        # Battery (mV), PDU count and uptime are unsigned in the specification
+        version, battery, temperature, count, uptime = _TLM.unpack_from(frame, 1)
+        return {
+            "battery": battery,
+            "temperature": temperature / 256.0,
+            "pdu count": count,
+            "uptime": uptime * 100,  # in msecs
+        }
+    elif etype == ESType.eid.value:
+        if len(frame) < 10:
+            return None
+        return {"tx_power": _signed(frame[1]), "eid": bytes(frame[2:10])}
+    return {"data": bytes(frame[1:])}
+
+
+def _signed(byte):
+    return byte - 256 if byte > 127 else byte
+
+
+def _reports(packet):
+    # The advertising reports of a decoded HCI_Event, that are not fragments
+    try:
+        reports = packet.payload[2].payload[1].payload
+    except (IndexError, AttributeError):
+        return ()
+    return [
+        x
+        for x in reports
+        if getattr(x, "data_status", aios.EXT_ADV_COMPLETE) == aios.EXT_ADV_COMPLETE
+    ]
+
+
+def _peer_rssi(report):
+    if isinstance(report, aios.HCI_LEM_Ext_Adv_Report):
+        return report.payload[3].val, report.payload[8].val
+    rssi = report.payload[-1]
+    return report.payload[2].val, rssi.val if rssi.name == "rssi" else None
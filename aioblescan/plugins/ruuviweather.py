@@ -29,6 +29,11 @@ from math import sqrt
 from struct import pack, unpack, calcsize
 from aioblescan.plugins import EddyStone
 
+try:
+    import numpy as np
+except ImportError:  # Only needed by decode_rawv2
+    np = None
+
 # A few convenience functions
 #
 
@@ -45,6 +50,12 @@ def get_temp(int, frac):
 class RuuviWeather(object):
     """Class defining the content of an Ruuvi Tag advertisement."""
 
+    # Ruuvi manufacturer data, or an Eddystone URL
+    signatures = (
+        aios.Signature(0xFF, b"\x99\x04"),
+        aios.Signature(0x16, b"\xaa\xfe"),
+    )
+
     def __init__(self):
         self.temp = 0
         self.humidity = 0
@@ -52,6 +63,7 @@ class RuuviWeather(object):
         self.accel_x = 0
         self.accel_y = 0
         self.accel_z = 0
+        self._eddystone = EddyStone()
 
     def decode(self, packet):
         # Look for Ruuvi tag URL and decode it
@@ -59,7 +71,7 @@ class RuuviWeather(object):
         rssi = packet.retrieve("rssi")
         if rssi:
             result["rssi"] = rssi[-1].val
-        url = EddyStone().decode(packet)
+        url = self._eddystone.decode(packet)
         if url is None:
             data = packet.retrieve("Manufacturer Specific Data")
             if data:
@@ -112,9 +124,8 @@ class RuuviWeather(object):
                 return None
         else:
             # print("URL")
-            power = packet.retrieve("tx_power")
-            if power:
-                result["tx_power"] = power[-1].val
+            if "tx_power" in url:
+                result["tx_power"] = url["tx_power"]
             try:
                 if "//ruu.vi/" in url["url"]:
                     # We got a live one
@@ -156,3 +167,80 @@ class RuuviWeather(object):
                 # print ("\n\nurl oops....")
                 # packet.show()
         return None
+
+
+# Batch decoding of RAWv2 payloads with NumPy
+
+RAWV2_LENGTH = 24
+
+if np is not None:
+    # The manufacturer payload, after the company id, big endian
+    RAWV2_DTYPE = np.dtype(
+        [
+            ("format", "u1"),
+            ("temperature", ">i2"),
+            ("humidity", ">u2"),
+            ("pressure", ">u2"),
+            ("accel_x", ">i2"),
+            ("accel_y", ">i2"),
+            ("accel_z", ">i2"),
+            ("power", ">u2"),
+            ("move count", "u1"),
+            ("sequence", ">u2"),
+            ("mac", "u1", (6,)),
+        ]
+    )
+    # What decode_rawv2 returns, with the units of RuuviWeather.decode
+    RAWV2_COLUMNS = np.dtype(
+        [
+            ("temperature", "f8"),
+            ("humidity", "f8"),
+            ("pressure", "f8"),
+            ("accel_x", "i4"),
+            ("accel_y", "i4"),
+            ("accel_z", "i4"),
+            ("accel", "f8"),
+            ("voltage", "i4"),
+            ("tx_power", "i4"),
+            ("move count", "i4"),
+            ("sequence", "i4"),
+        ]
+    )
+
+
+def decode_rawv2(payloads):
+    """Decode many RAWv2 payloads at once.
+
+    The values are the same as those RuuviWeather.decode returns, the
+    accelerometer tuple being split in accel_x, accel_y, accel_z and accel.
+    NumPy must be installed.
+
+        :param payloads: The manufacturer specific data, after the company id
+        :type payloads: list
+        :returns: One row per payload, with the RAWV2_COLUMNS fields
+        :rtype: numpy.ndarray
+    """
+    if np is None:
+        raise ImportError("decode_rawv2 requires numpy")
+    data = b"".join(payloads)
+    if len(data) != RAWV2_LENGTH * len(payloads):
+        raise ValueError("RAWv2 payloads are {} bytes long".format(RAWV2_LENGTH))
+    raw = np.frombuffer(data, dtype=RAWV2_DTYPE)
+    if (raw["format"] != 0x05).any():
+        raise ValueError("Not a RAWv2 payload")
+    result = np.empty(len(raw), dtype=RAWV2_COLUMNS)
+    result["temperature"] = raw["temperature"] * 0.005
+    result["humidity"] = raw["humidity"] * 0.0025
+    result["pressure"] = (raw["pressure"].astype("i4") + 50000) / 100.0
+    accel = 0
+    for axis in ("accel_x", "accel_y", "accel_z"):
+        value = raw[axis].astype("i8")
+        result[axis] = value
+        accel = accel + value * value
+    result["accel"] = np.sqrt(accel)
+    power = raw["power"].astype("i4")
+    result["voltage"] = (power >> 5) + 1600
+    result["tx_power"] = (power & 0x1F) * 2 - 40
+    result["move count"] = raw["move count"]
+    result["sequence"] = raw["sequence"]
+    return result
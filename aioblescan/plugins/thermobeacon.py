@@ -21,6 +21,7 @@
 # AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
 # WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
 # IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+import aioblescan as aios
 
 
 def parse(packet):
@@ -74,6 +75,9 @@ def parse_payload(mac, rssi, payload):
 class ThermoBeacon(object):
     """Class defining the content of a ThermoBeacon advertisement."""
 
+    # Incomplete list of 16 bits service uuids, starting with 0xFFF0
+    signatures = (aios.Signature(0x02, b"\xf0\xff"),)
+
     def decode(self, packet):
         result = parse(packet)
         if result:
@@ -15,6 +15,9 @@ class Tilt(object):
     Class defining the content of a Tilt advertisement
     """
 
+    # iBeacon manufacturer data, with the Tilt uuid preamble, whatever the company
+    signatures = (aios.Signature(0xFF, bytes.fromhex(TILT), 2),)
+
     def decode(self, packet):
         data = {}
         raw_data = packet.retrieve("Manufacturer Specific Data")
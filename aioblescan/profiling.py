@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with measuring where the time goes when decoding packets
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import sys
+import time
+from collections import Counter
+from .aioblescan import HCI_Event, AD_Structure
+
+
+class StageProfiler:
+    """Class timing the stages packets go through.
+
+    Once enabled, the time spent, and the number of calls, are counted for:
+
+        "process": the process callback of the given requester
+        "HCI_Event.decode"
+        "AD_Structure.decode"
+        "<class name>.decode": each of the given plugin decoders
+
+    Stages are timed inclusively: HCI_Event.decode includes AD_Structure.decode,
+    and process includes whatever it calls. Nothing is changed until enable is
+    called, and disable restores the original methods, so there is no cost when
+    not profiling.
+
+    on_enter and on_exit are called around each stage, they can be overridden to
+    do more than count.
+
+        :param every: Call on_report after that many process calls. Default 0, never
+        :type every: int
+        :returns: StageProfiler instance.
+        :rtype: StageProfiler
+
+    """
+
+    def __init__(self, every=0):
+        self.every = every
+        self.times = Counter()
+        self.calls = Counter()
+        self._restore = []
+        self._processed = 0
+
+    @property
+    def enabled(self):
+        return bool(self._restore)
+
+    def enable(self, requester=None, decoders=()):
+        """Start timing the stages.
+
+            :param requester: The requester whose process callback is timed
+            :type requester: BLEScanRequester
+            :param decoders: The plugin decoders to time
+            :type decoders: list
+        """
+        if self.enabled:
+            return
+        self._wrap(HCI_Event, "decode", "HCI_Event.decode", HCI_Event.decode)
+        # Advertising reports decode their AD structures through _decode_at
+        self._wrap(
+            AD_Structure, "_decode_at", "AD_Structure.decode", AD_Structure._decode_at
+        )
+        for decoder in decoders:
+            name = type(decoder).__name__ + ".decode"
+            self._wrap(decoder, "decode", name, decoder.decode)
+        if requester is not None:
+            self._wrap(requester, "process", "process", requester.process)
+
+    def disable(self):
+        """Stop timing, and restore the original methods"""
+        while self._restore:
+            target, attr, original = self._restore.pop()
+            if original is None:
+                # It was the class method, found through the instance
+                delattr(target, attr)
+            else:
+                setattr(target, attr, original)
+
+    def _wrap(self, target, attr, stage, func):
+        clock = time.perf_counter
+        times = self.times
+        calls = self.calls
+        enter = self.on_enter
+        leave = self.on_exit
+        counted = stage == "process" and self.every
+
+        def timed(*args):
+            enter(stage)
+            start = clock()
+            try:
+                return func(*args)
+            finally:
+                elapsed = clock() - start
+                times[stage] += elapsed
+                calls[stage] += 1
+                leave(stage, elapsed)
+                if counted:
+                    self._processed += 1
+                    if self._processed >= self.every:
+                        self._processed = 0
+                        self.on_report()
+
+        if isinstance(target, type):
+            original = target.__dict__[attr]
+        else:
+            original = target.__dict__.get(attr)
+        self._restore.append((target, attr, original))
+        setattr(target, attr, timed)
+
+    def on_enter(self, stage):
+        pass
+
+    def on_exit(self, stage, elapsed):
+        pass
+
+    def on_report(self):
+        """Called after every process calls. By default, print to stderr and reset"""
+        print(self.report(), file=sys.stderr)
+        self.reset()
+
+    def reset(self):
+        self.times.clear()
+        self.calls.clear()
+
+    def report(self):
+        """Return the time breakdown, by stage, as text"""
+        header = "{:<32}{:>10}{:>12}{:>12}"
+        lines = [header.format("stage", "calls", "total s", "µs/call")]
+        for stage, total in self.times.most_common():
+            calls = self.calls[stage]
+            lines.append(
+                "{:<32}{:>10}{:>12.3f}{:>12.2f}".format(
+                    stage, calls, total, total / calls * 1e6
+                )
+            )
+        return "\n".join(lines)
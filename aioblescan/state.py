@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# This file deals with keeping the last known state of each device, so that
+# only what changed is reported
+#
+# Copyright (c) 2017 François Wautier
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies
+# or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+# IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE
+
+import time
+from array import array
+from collections import OrderedDict
+from .aioblescan import report_source
+
+
+class DeviceTable:
+    """Class keeping the last advertised data of each device.
+
+    A device is reported again only when its advertising data changes, or when
+    heartbeat seconds passed since it was last reported. Devices not seen for
+    ttl seconds are forgotten, as is the least recently seen one when there are
+    max_devices of them already.
+
+    Devices are identified by a key, for filter that of report_source: each
+    advertisement of a device, such as its scan response or each of its
+    advertising sets, is tracked on its own.
+
+    The last decoded plugin result of each device can be kept with it, see
+    set_result. A Dispatcher given the table does so.
+
+    The state is kept in preallocated slots: timestamps in arrays, payloads and
+    decoded results in lists. Set it as the state_table of a BLEScanRequester to
+    only deliver changed reports, to process_batch and reports(). The packets
+    given to process are not filtered.
+
+        :param heartbeat: Report unchanged devices every heartbeat seconds. Default 60
+        :type heartbeat: float
+        :param ttl: Forget devices not seen for that many seconds. Default 600
+        :type ttl: float
+        :param max_devices: How many devices to keep track of. Default 1024
+        :type max_devices: int
+        :returns: DeviceTable instance.
+        :rtype: DeviceTable
+
+    """
+
+    def __init__(self, heartbeat=60.0, ttl=600.0, max_devices=1024):
+        self.heartbeat = heartbeat
+        self.ttl = ttl
+        self.max_devices = max_devices
+        self.emitted = 0
+        self.suppressed = 0
+        self.evicted = 0
+        # Key -> slot, least recently seen first
+        self._slots = OrderedDict()
+        self._free = list(range(max_devices - 1, -1, -1))
+        self._seen = array("d", bytes(8 * max_devices))
+        self._reported = array("d", bytes(8 * max_devices))
+        self._payloads = [None] * max_devices
+        self._results = [None] * max_devices
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def update(self, key, payload, now=None):
+        """Record the advertising data of a device.
+
+            :param key: What identifies the device, such as its MAC address
+            :type key: hashable
+            :param payload: Its advertising data
+            :type payload: bytes
+            :param now: The current time.monotonic(). Default now.
+            :type now: float
+            :returns: True if this should be reported
+            :rtype: bool
+        """
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+        slot = self._slot(key)
+        if (
+            self._payloads[slot] == payload
+            and now - self._reported[slot] < self.heartbeat
+        ):
+            self._seen[slot] = now
+            self.suppressed += 1
+            return False
+        self._seen[slot] = now
+        self._reported[slot] = now
+        self._payloads[slot] = bytes(payload)
+        self.emitted += 1
+        return True
+
+    def filter(self, reports, now=None):
+        """Return the advertising reports that should be reported.
+
+            :param reports: The reports
+            :type reports: list
+            :param now: The current time.monotonic(). Default now.
+            :type now: float
+            :returns: The reports whose data changed, or whose heartbeat is due
+            :rtype: list
+        """
+        if now is None:
+            now = time.monotonic()
+        return [
+            x
+            for x in reports
+            if self.update(report_source(x), bytes(x.ad_data), now=now)
+        ]
+
+    def set_result(self, key, result, now=None):
+        """Keep the last decoded result of a device.
+
+        A device not in the table yet is added, without advertising data.
+
+            :param key: What identifies the device, as for update
+            :type key: hashable
+            :param result: The decoded result, for instance from a plugin
+            :type result: object
+            :param now: The current time.monotonic(). Default now.
+            :type now: float
+        """
+        if now is None:
+            now = time.monotonic()
+        self.expire(now)
+        slot = self._slot(key)
+        self._results[slot] = result
+        self._seen[slot] = now
+
+    def get(self, key):
+        """Return the (payload, result, last seen) of a device, or None"""
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        return self._payloads[slot], self._results[slot], self._seen[slot]
+
+    def expire(self, now=None):
+        """Forget the devices not seen for ttl seconds"""
+        if now is None:
+            now = time.monotonic()
+        limit = now - self.ttl
+        slots = self._slots
+        while slots:
+            key, slot = next(iter(slots.items()))
+            if self._seen[slot] > limit:
+                break
+            self._forget(key)
+
+    def _slot(self, key):
+        # The slot of a device, made the most recently seen, or a new one
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+        if not self._free:
+            self._forget(next(iter(self._slots)))
+        slot = self._free.pop()
+        self._slots[key] = slot
+        self._reported[slot] = 0
+        return slot
+
+    def _forget(self, key):
+        slot = self._slots.pop(key)
+        self._payloads[slot] = None
+        self._results[slot] = None
+        self._free.append(slot)
+        self.evicted += 1
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Helpers shared by the benchmark scripts
+
+import time
+import tracemalloc
+
+# The packets used by the test suite
+from tests.fixtures import EDDY_URL, EDDY_UID, ATCMI
+
+SAMPLE_PACKETS = [EDDY_URL, EDDY_UID, ATCMI]
+
+
+def time_per_call(func, args, number=20000):
+    """Return the average time, in µs, of a call to func(*args)"""
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+def memory_per_call(func, args, number=1000):
+    """Return the number of blocks and bytes allocated, per call, by func(*args)
+
+    The results are kept alive, so this measures what a decoded object
+    costs while it is held, plus whatever leaks from the call.
+    """
+    keep = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(number):
+            keep.append(func(*args))
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(x.count_diff for x in stats)
+    size = sum(x.size_diff for x in stats)
+    return blocks / number, size / number
+
+
+def peak_per_call(func, args, number=1000):
+    """Return the most memory, in bytes, in use at once during a call to func(*args)
+
+    The result is released after each call, so this measures the transient
+    allocations of the call, its result included, not what is kept.
+    """
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func(*args)
+            peak += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return peak / number
+
+
+def report(title, rows):
+    """Print a table of (label, value, ...) rows."""
+    print(title)
+    for row in rows:
+        values = "".join("{:>14.2f}".format(x) for x in row[1:])
+        print("    {:<40}{}".format(row[0], values))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Compare the pure Python and the compiled ad_scan, alone and in HCI_Event.decode.
+# decode_adv_reports walks the AD structures itself, it is shown for reference.
+# Build the compiled version first with:
+#
+#     python3 setup.py build_ext --inplace
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_adscan
+import aioblescan as aiobs
+import aioblescan.aioblescan as core
+from benchmarks._common import EDDY_URL, ATCMI, time_per_call, report
+from benchmarks.traffic import TrafficGenerator
+
+try:
+    from aioblescan._adscan import ad_scan as c_ad_scan
+except ImportError:
+    c_ad_scan = None
+
+
+def decode(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+
+
+def per_packet(func, packets):
+    def run():
+        for args in packets:
+            func(*args)
+
+    # About 20000 calls in all
+    number = max(20, 20000 // len(packets))
+    return time_per_call(run, (), number) / len(packets)
+
+
+def main():
+    if c_ad_scan is None:
+        print("The compiled ad_scan is not built, only the Python one is measured")
+    # Legacy traffic, with a single report, the first AD structure at 14
+    generated = TrafficGenerator(extended=0, multi=0, broken=0).packets(1000)
+    rows = []
+    for label, scan in (("Python", core._py_ad_scan), ("C", c_ad_scan)):
+        if scan is None:
+            continue
+        core._c_ad_scan = None if scan is core._py_ad_scan else scan
+        for name, packets in (
+            ("Eddystone", [EDDY_URL]),
+            ("ATC", [ATCMI]),
+            ("generated traffic", generated),
+        ):
+            rows.append(
+                (
+                    "{}, {}".format(name, label),
+                    per_packet(scan, [(x, 14, x[13]) for x in packets]),
+                    per_packet(aiobs.decode_adv_reports, [(x,) for x in packets]),
+                    per_packet(decode, [(x,) for x in packets]),
+                )
+            )
+    core._c_ad_scan = c_ad_scan
+    report("µs/packet: ad_scan, decode_adv_reports, HCI_Event.decode", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Compare the field tree with the flat parser for legacy advertising reports
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_adv_report
+import aioblescan as aiobs
+from benchmarks._common import SAMPLE_PACKETS, time_per_call, report
+
+
+def tree(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    return ev
+
+
+def main():
+    rows = []
+    for idx, packet in enumerate(SAMPLE_PACKETS):
+        slow = time_per_call(tree, (packet,))
+        fast = time_per_call(aiobs.decode_adv_reports, (packet,))
+        rows.append(("packet {}".format(idx), slow, fast, slow / fast))
+    report("µs/packet: HCI_Event, decode_adv_reports, speedup", rows)
+
+
+if __name__ == "__main__":
+    main()
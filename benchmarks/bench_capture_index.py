@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Compare finding the packets of a few devices in a capture by decoding every
+# packet, and with CaptureIndex. Requires numpy.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_capture_index
+import os
+import tempfile
+import time
+import aioblescan as aiobs
+
+PACKETS = 200000
+DEVICES = 500
+WANTED = 50
+
+
+def packet(device):
+    # An ATC thermometer report, with its MAC changed
+    mac = device.to_bytes(6, "little")
+    body = b"\x02\x01\x00\x00" + mac + b"\x11\x10\x16\x1a\x18" + mac[::-1]
+    body += b"\x00\xf3%U\x0b\x9f\xde\xdb"
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def main():
+    wanted = ["{:012x}".format(x) for x in range(WANTED)]
+    wanted = [":".join(x[i : i + 2] for i in range(0, 12, 2)) for x in wanted]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "capture.btsnoop")
+        with aiobs.CaptureWriter(path) as writer:
+            for x in range(PACKETS):
+                writer.write(packet(x % DEVICES), x * 0.01)
+
+        start = time.perf_counter()
+        found = 0
+        macs = set(wanted)
+        for timestamp, data, received in aiobs.read_capture(path):
+            ev = aiobs.HCI_Event()
+            ev.decode(data)
+            if ev.retrieve("peer")[0].val in macs and timestamp >= 1000:
+                found += 1
+        full = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with aiobs.CaptureIndex(path) as index:
+            indexed = time.perf_counter() - start
+            selection = index.select(macs=wanted, since=1000)
+            decoded = sum(1 for _ in index.decode(selection))
+        total = time.perf_counter() - start
+    assert found == decoded
+    print("{} packets, {} selected".format(PACKETS, found))
+    print("    decode all:       {:8.3f} s".format(full))
+    print("    index:            {:8.3f} s".format(indexed))
+    print("    index and decode: {:8.3f} s".format(total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure decoding HCI events: the time, the memory used at once during the
+# decoding, and what the decoded event keeps
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_decode
+import aioblescan as aiobs
+from benchmarks._common import SAMPLE_PACKETS, time_per_call, report
+from benchmarks._common import memory_per_call, peak_per_call
+
+# An extended report with 200 bytes of manufacturer data
+_EXT_DATA = bytes([199, 0xFF]) + bytes(range(198))
+_EXT_BODY = (
+    b"\x0d\x01\x00\x00\x01\x01\x02\x03\x04\x05\x06\x01\x00\x01\x7f\xc0"
+    + bytes(8)
+    + bytes([len(_EXT_DATA)])
+    + _EXT_DATA
+)
+EXTENDED = b"\x04>" + bytes([len(_EXT_BODY)]) + _EXT_BODY
+
+
+def decode(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    return ev
+
+
+def main():
+    rows = []
+    packets = [("packet {}".format(idx), x) for idx, x in enumerate(SAMPLE_PACKETS)]
+    packets.append(("200 bytes extended", EXTENDED))
+    for name, packet in packets:
+        blocks, size = memory_per_call(decode, (packet,))
+        rows.append(
+            (
+                name,
+                time_per_call(decode, (packet,)),
+                peak_per_call(decode, (packet,)),
+                blocks,
+                size,
+            )
+        )
+    report(
+        "HCI_Event.decode: µs/packet, peak bytes/packet, kept blocks/packet, "
+        "kept bytes/packet",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
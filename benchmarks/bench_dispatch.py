@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Compare trying every plugin on every decoded packet with the Dispatcher, without
+# and with a DecodeCache. The same packet is repeated, so the cache always hits.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_dispatch
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, RuuviWeather, ATCMiThermometer
+from aioblescan.plugins import ThermoBeacon, Tilt
+from benchmarks._common import EDDY_URL, ATCMI, time_per_call, report
+
+DECODERS = [EddyStone(), RuuviWeather(), ATCMiThermometer(), ThermoBeacon(), Tilt()]
+# Some phone advertising manufacturer data, as most of the traffic usually is
+OTHER = b"\x04>\x1f\x02\x01\x00\x01\x11\x22\x33\x44\x55\x66\x13\x02\x01\x1a\x0f\xff\x4c\x00\x10\x05\x03\x1c\x8f\x2a\x6b\x00\x00\x00\x00\x00\xb0"
+
+
+def linear(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    for decoder in DECODERS:
+        if decoder.decode(ev):
+            break
+
+
+def main():
+    dispatcher = aiobs.Dispatcher(DECODERS)
+    cached = aiobs.Dispatcher(DECODERS, aiobs.DecodeCache())
+    rows = []
+    for name, packet in (("Eddystone", EDDY_URL), ("ATC", ATCMI), ("other", OTHER)):
+        slow = time_per_call(linear, (packet,))
+        fast = time_per_call(dispatcher.decode, (packet,))
+        hit = time_per_call(cached.decode, (packet,))
+        rows.append((name, slow, fast, hit, slow / hit))
+    report("µs/packet: every plugin, Dispatcher, with cache, speedup", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure decoding each kind of Eddystone frame: the frame alone, with
+# decode_frame, and a decoded event, with EddyStone.decode.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_eddystone
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone
+from aioblescan.plugins.eddystone import decode_frame
+from benchmarks._common import time_per_call, report
+
+FRAMES = [
+    ("UID", b"\x00\xf6" + bytes(range(16)) + b"\x00\x00"),
+    ("URL", b"\x10\xf6\x03makecode\x00#about"),
+    ("TLM", b"\x20\x00\x0b\xb8\x17\x80\x00\x00\x01\x00\x00\x01\x00\x00"),
+    ("EID", b"\x30\xf6" + bytes(range(8))),
+]
+
+
+def frame_packet(frame):
+    ad = b"\x02\x01\x06\x03\x03\xaa\xfe"
+    ad += bytes([len(frame) + 3, 0x16, 0xAA, 0xFE]) + frame
+    body = b"\x02\x01\x00\x00\x01\x02\x03\x04\x05\x06" + bytes([len(ad)]) + ad
+    body += b"\xc0"
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def decode_packet(decoder, packet):
+    ev = aiobs.HCI_Event()
+    ev.decode(packet)
+    return decoder.decode(ev)
+
+
+def main():
+    decoder = EddyStone()
+    rows = []
+    for name, frame in FRAMES:
+        packet = frame_packet(frame)
+        ev = aiobs.HCI_Event()
+        ev.decode(packet)
+        rows.append(
+            (
+                name,
+                time_per_call(decode_frame, (frame,)),
+                # The event is not modified, so the same one can be decoded again
+                time_per_call(decoder.decode, (ev,)),
+                time_per_call(decode_packet, (decoder, packet)),
+            )
+        )
+    report("µs/frame: decode_frame, EddyStone.decode, with HCI_Event.decode", rows)
+
+
+if __name__ == "__main__":
+    main()
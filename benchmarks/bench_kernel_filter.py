@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# How many times the process is woken up with and without the kernel HCI filter
+#
+# A socketpair stands in for the HCI socket. The sending side only writes the
+# packets that the kernel would let through the filter.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_kernel_filter
+import asyncio
+import socket
+import time
+import aioblescan as aiobs
+from benchmarks._common import SAMPLE_PACKETS, report
+
+ALL = aiobs.hci_filter(range(32), range(64))
+# Traffic seen on a busy adapter: adv reports, ACL data, completed packets...
+OTHERS = [
+    b"\x02\x40\x20\x05\x00\x01\x00\x04\x00\x1b",  # ACL data
+    b"\x04\x13\x05\x01\x40\x00\x01\x00",  # Number Of Completed Packets
+    b"\x04\x0e\x04\x01\x0c\x20\x00",  # Command Complete
+    b"\x04\xff\x03\x01\x02\x03",  # Vendor event
+]
+PACKETS = 20000
+
+
+class Counter(aiobs.BLEScanRequester):
+    def __init__(self, done):
+        super().__init__()
+        self.wakeups = 0
+        self.done = done
+        self._uninitialized = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, packet):
+        self.wakeups += 1
+        if packet == b"\x00":
+            self.done.set_result(None)
+
+
+async def run(flt):
+    loop = asyncio.get_running_loop()
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    left.setblocking(False)
+    right.setblocking(False)
+    done = loop.create_future()
+    transport, counter = await loop._create_connection_transport(
+        right, lambda: Counter(done), None, None
+    )
+    traffic = SAMPLE_PACKETS + OTHERS
+    start = time.perf_counter()
+    for idx in range(PACKETS):
+        packet = traffic[idx % len(traffic)]
+        if aiobs.hci_filter_match(flt, packet):
+            await loop.sock_sendall(left, packet)
+    await loop.sock_sendall(left, b"\x00")
+    await done
+    elapsed = time.perf_counter() - start
+    transport.close()
+    left.close()
+    return counter.wakeups - 1, elapsed
+
+
+def main():
+    scan = aiobs.hci_filter((aiobs.HCI_EVENT,), (aiobs.HCI_EV_LE_META,))
+    command = aiobs.hci_filter(
+        (aiobs.HCI_EVENT,),
+        (aiobs.HCI_EV_LE_META, aiobs.HCI_EV_CMD_COMPLETE, aiobs.HCI_EV_CMD_STATUS),
+    )
+    rows = []
+    for label, flt in (("no filter", ALL), ("commands", command), ("scanning", scan)):
+        wakeups, elapsed = asyncio.run(run(flt))
+        rows.append((label, wakeups, elapsed * 1000))
+    report("{} packets: wakeups, ms".format(PACKETS), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Memory held by a "last packet" cache of decoded events, one per device
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_memory
+import tracemalloc
+import aioblescan as aiobs
+from benchmarks._common import SAMPLE_PACKETS
+
+DEVICES = 20000
+
+
+def main():
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = {}
+    for idx in range(DEVICES):
+        packet = bytearray(SAMPLE_PACKETS[idx % len(SAMPLE_PACKETS)])
+        packet[7:10] = idx.to_bytes(3, "little")  # A different peer for each
+        ev = aiobs.HCI_Event()
+        ev.decode(bytes(packet))
+        cache[ev.retrieve("peer")[0].val] = ev
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(
+        "{} cached events: {:.1f} MB, {:.0f} bytes/event".format(
+            len(cache), size / 2**20, size / len(cache)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
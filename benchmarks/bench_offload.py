@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure the decoding throughput of DecodePipeline with more worker processes
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_offload
+#
+# A capture file, btsnoop or pcap, may be given to decode its received packets
+# instead of the generated traffic.
+import asyncio
+import os
+import sys
+import time
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, RuuviWeather, ATCMiThermometer
+from aioblescan.plugins import ThermoBeacon, Tilt
+from benchmarks._common import EDDY_URL, report
+from benchmarks.traffic import TrafficGenerator
+
+PACKETS = 60000
+DECODERS = [EddyStone(), RuuviWeather(), ATCMiThermometer(), ThermoBeacon(), Tilt()]
+
+
+def traffic():
+    if len(sys.argv) > 1:
+        return [x.packet for x in aiobs.read_capture(sys.argv[1]) if x.received]
+    return TrafficGenerator().packets(PACKETS)
+
+
+def in_process(packets):
+    chunk = [(0, x) for x in packets]
+    failures = []
+    start = time.perf_counter()
+    aiobs.decode_chunk(chunk, DECODERS, failures)
+    return len(packets) / (time.perf_counter() - start), len(failures)
+
+
+async def pipelined(packets, workers):
+    pipeline = aiobs.DecodePipeline(
+        DECODERS, workers=workers, chunk_size=512, max_chunks=len(packets)
+    )
+    # Start the workers before timing, with a packet sure to give a result
+    pipeline.feed(EDDY_URL)
+    pipeline.flush()
+    await pipeline.__anext__()
+    start = time.perf_counter()
+    for packet in packets:
+        pipeline.feed(packet)
+    pipeline.close()
+    async for _ in pipeline:
+        pass
+    return len(packets) / (time.perf_counter() - start), pipeline.failed
+
+
+def main():
+    packets = traffic()
+    speed, failed = in_process(packets)
+    rows = [("in process", speed / 1000, failed)]
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        speed, failed = asyncio.run(pipelined(packets, workers))
+        rows.append(("{} workers".format(workers), speed / 1000, failed))
+        workers *= 2
+    report("kpackets/s decoded with the plugins, plugin failures", rows)
+
+
+if __name__ == "__main__":
+    main()
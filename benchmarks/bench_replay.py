@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure recording, and replaying through BLEScanRequester with the plugins
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_replay
+#
+# A capture file, btsnoop or pcap, may be given to replay instead of the
+# generated traffic.
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, RuuviWeather, ATCMiThermometer
+from aioblescan.plugins import ThermoBeacon, Tilt
+from benchmarks._common import SAMPLE_PACKETS, report
+
+PACKETS = 50000
+DECODERS = [EddyStone(), RuuviWeather(), ATCMiThermometer(), ThermoBeacon(), Tilt()]
+
+
+def record(path, fmt):
+    start = time.perf_counter()
+    with aiobs.CaptureWriter(path, fmt) as writer:
+        for x in range(PACKETS):
+            writer.write(SAMPLE_PACKETS[x % len(SAMPLE_PACKETS)], x * 0.001)
+    return PACKETS / (time.perf_counter() - start)
+
+
+def process(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    for decoder in DECODERS:
+        if decoder.decode(ev):
+            break
+
+
+async def replay(path):
+    btctrl = aiobs.BLEScanRequester()
+    btctrl.process = process
+    records = list(aiobs.read_capture(path))
+    start = time.perf_counter()
+    count = await aiobs.replay(btctrl, records)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    rows = []
+    if len(sys.argv) > 1:
+        rows.append(("replay " + sys.argv[1], asyncio.run(replay(sys.argv[1]))))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in (aiobs.BTSNOOP, aiobs.PCAP):
+                path = os.path.join(tmp, "capture." + fmt)
+                rows.append(("record " + fmt, record(path, fmt)))
+                rows.append(("replay " + fmt, asyncio.run(replay(path))))
+    report("packets/s", rows)
+
+
+if __name__ == "__main__":
+    main()
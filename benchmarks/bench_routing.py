@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure BLEScanRequester.data_received when every packet is decoded by process,
+# and when the packets that are not advertising reports are routed away, on
+# generated traffic where a third of the packets are other events.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_routing
+import asyncio
+import time
+from struct import error
+import aioblescan as aiobs
+from benchmarks.traffic import TrafficGenerator
+from benchmarks._common import report
+
+PACKETS = 20000
+OTHERS = [
+    b"\x04\x0e\x04\x01\x0c\x20\x00",
+    b"\x04\x0f\x04\x00\x01\x0b\x20",
+    b"\x04\x05\x04\x00\x40\x00\x13",
+    b"\x04\xff\x04\x01\x02\x03\x04",
+    b"\x04\x13\x05\x01\x40\x00\x01\x00",
+]
+
+
+class Transport(asyncio.Transport):
+    def write(self, data):
+        pass
+
+
+def process(data):
+    ev = aiobs.HCI_Event()
+    try:
+        ev.decode(data)
+    except (error, IndexError, ValueError):
+        pass
+
+
+def traffic():
+    packets = TrafficGenerator().packets(PACKETS)
+    for x in range(0, PACKETS, 3):
+        packets[x] = OTHERS[x % len(OTHERS)]
+    return packets
+
+
+def run(packets, routed):
+    btctrl = aiobs.BLEScanRequester()
+    btctrl.connection_made(Transport())
+    btctrl._uninitialized = False
+    btctrl.process = process
+    if routed:
+        for category in (aiobs.COMMAND_COMPLETE, aiobs.DISCONNECT, aiobs.VENDOR):
+            btctrl.routes[category] = None
+        btctrl.routes[aiobs.OTHER] = None
+    start = time.perf_counter()
+    for packet in packets:
+        btctrl.data_received(packet)
+    return len(packets) / (time.perf_counter() - start)
+
+
+def main():
+    packets = traffic()
+    rows = [
+        ("everything to process", run(packets, False)),
+        ("only advertising reports", run(packets, True)),
+    ]
+    report("packets/s", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Compare RuuviWeather.decode with decode_rawv2 on RAWv2 payloads. Requires numpy.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_ruuvi
+import time
+import aioblescan as aiobs
+from aioblescan.plugins import RuuviWeather
+from aioblescan.plugins.ruuviweather import decode_rawv2
+from benchmarks._common import report
+
+PAYLOAD = bytes.fromhex("0512FC5394C37C0004FFFC040CAC364200CDCBB8334C884F")
+
+
+def packet(payload):
+    ad = b"\x02\x01\x06" + bytes([len(payload) + 3, 0xFF, 0x99, 0x04]) + payload
+    report = b"\x00\x01\x4f\x88\x4c\x33\xb8\xcb" + bytes([len(ad)]) + ad + b"\xc0"
+    body = b"\x02\x01" + report
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def per_payload(func, args, count, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return (time.perf_counter() - start) / number / count * 1e6
+
+
+def main():
+    ev = aiobs.HCI_Event()
+    ev.decode(packet(PAYLOAD))
+    decoder = RuuviWeather()
+    rows = [("RuuviWeather.decode", per_payload(decoder.decode, (ev,), 1, 20000))]
+    for count in (1, 100, 10000):
+        payloads = [PAYLOAD] * count
+        number = max(20, 200000 // count)
+        rows.append(
+            (
+                "decode_rawv2, {} payloads".format(count),
+                per_payload(decode_rawv2, (payloads,), count, number),
+            )
+        )
+    report("µs/payload", rows)
+
+
+if __name__ == "__main__":
+    main()
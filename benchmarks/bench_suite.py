@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Measure packets/s and allocations/packet of each decoding stage, on the traffic
+# from benchmarks/traffic.py, and save the results as JSON. Given the results of
+# a previous run, the changes are shown, and regressions make the exit status 1.
+#
+# Run from the top of the source tree with: python3 -m benchmarks.bench_suite
+#
+#     python3 -m benchmarks.bench_suite --output before.json
+#     ... change things ...
+#     python3 -m benchmarks.bench_suite --output after.json --baseline before.json
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from struct import error
+import aioblescan as aiobs
+import aioblescan.__main__ as cli
+from aioblescan.plugins import EddyStone, RuuviWeather, ATCMiThermometer
+from aioblescan.plugins import ThermoBeacon, Tilt
+from benchmarks.traffic import TrafficGenerator
+
+DECODERS = [
+    ("Google Beacon", EddyStone()),
+    ("Weather info", RuuviWeather()),
+    ("Temperature info", ATCMiThermometer()),
+    ("Temperature info", ThermoBeacon()),
+    ("Tilt", Tilt()),
+]
+
+
+def decode(packets):
+    # Damaged packets are dropped, as BLEScanRequester does
+    result = []
+    for data in packets:
+        ev = aiobs.HCI_Event()
+        try:
+            ev.decode(data)
+        except (error, IndexError, ValueError):
+            continue
+        result.append(ev)
+    return result
+
+
+def retrieve(events):
+    return [(ev.retrieve("peer"), ev.retrieve("rssi")) for ev in events]
+
+
+def plugin(decoder):
+    def run(events):
+        return [decoder.decode(ev) for ev in events]
+
+    return run
+
+
+def my_process(packets):
+    for data in packets:
+        try:
+            cli.my_process(data)
+        except (error, IndexError, ValueError):
+            pass
+
+
+def stages():
+    """Return (name, function, input) for each stage.
+
+    The input is "packets" or "events", freshly decoded events, since plugins
+    may modify what they decode.
+    """
+    result = [
+        ("HCI_Event.decode", decode, "packets"),
+        ("retrieve", retrieve, "events"),
+    ]
+    for leader, decoder in DECODERS:
+        name = type(decoder).__name__ + ".decode"
+        result.append((name, plugin(decoder), "events"))
+    result.append(("my_process", my_process, "packets"))
+    result.append(("my_process (Dispatcher)", my_process, "packets"))
+    return result
+
+
+def setup_cli(name):
+    cli.opts = argparse.Namespace(mac=None, raw=False, leader=True)
+    cli.decoders = DECODERS
+    cli.dispatcher = None
+    if name.endswith("(Dispatcher)"):
+        cli.dispatcher = aiobs.Dispatcher([decoder for leader, decoder in DECODERS])
+
+
+def measure(func, packets, kind, repeat):
+    """Return packets/s, best of repeat, and allocations per packet"""
+    best = None
+    for _ in range(repeat):
+        data = decode(packets) if kind == "events" else packets
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func(data)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    data = decode(packets) if kind == "events" else packets
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        kept = func(data)
+        after = tracemalloc.take_snapshot()
+        del kept
+        # The most memory used at once while handling each packet on its own
+        data = decode(packets) if kind == "events" else packets
+        peak = 0
+        for item in data:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            func([item])
+            peak += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    count = len(packets)
+    return {
+        "packets_per_s": count / best,
+        # What the stage output holds, while kept alive
+        "blocks_per_packet": sum(x.count_diff for x in stats) / count,
+        "bytes_per_packet": sum(x.size_diff for x in stats) / count,
+        "peak_bytes_per_packet": peak / count,
+    }
+
+
+def run(opts):
+    packets = TrafficGenerator(seed=opts.seed).packets(opts.packets)
+    results = {}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for name, func, kind in stages():
+            if opts.stage and not any(x in name for x in opts.stage):
+                continue
+            setup_cli(name)
+            results[name] = measure(func, packets, kind, opts.repeat)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": opts.seed,
+        "packets": opts.packets,
+        "stages": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Print the results, compared to the baseline. Return the regressions"""
+    regressions = []
+    header = "{:<32}{:>14}{:>10}{:>14}{:>10}{:>14}"
+    print(
+        header.format(
+            "stage", "packets/s", "change", "blocks/pkt", "change", "peak B/pkt"
+        )
+    )
+    for name, now in current["stages"].items():
+        before = (baseline or {}).get("stages", {}).get(name)
+        speed = blocks = ""
+        if before:
+            ratio = now["packets_per_s"] / before["packets_per_s"] - 1
+            speed = "{:+.1%}".format(ratio)
+            grown = now["blocks_per_packet"] - before["blocks_per_packet"]
+            blocks = "{:+.2f}".format(grown)
+            if ratio < -tolerance:
+                regressions.append((name, "packets/s", speed))
+            if grown > tolerance * max(before["blocks_per_packet"], 1):
+                regressions.append((name, "blocks/packet", blocks))
+        print(
+            "{:<32}{:>14.0f}{:>10}{:>14.2f}{:>10}{:>14.0f}".format(
+                name,
+                now["packets_per_s"],
+                speed,
+                now["blocks_per_packet"],
+                blocks,
+                now["peak_bytes_per_packet"],
+            )
+        )
+    for name, what, change in regressions:
+        print("REGRESSION {}: {} {}".format(name, what, change))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark the decoding stages.")
+    parser.add_argument(
+        "--packets", type=int, default=5000, help="Number of generated packets."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Traffic random seed.")
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timing runs, the best is kept."
+    )
+    parser.add_argument(
+        "--stage", action="append", help="Only run the stages with that in the name."
+    )
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare to the results in this file.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative change considered a regression. Default 0.1",
+    )
+    opts = parser.parse_args(args)
+
+    baseline = None
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["seed"], baseline["packets"]) != (opts.seed, opts.packets):
+            print("Warning: the baseline was run on different traffic", file=sys.stderr)
+    current = run(opts)
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if compare(current, baseline, opts.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+#
+# Deterministic generator of HCI LE Meta advertising report events, used by the
+# benchmark suite. The same seed always gives the same packets, so results can be
+# compared from one run to the next. A share of the events is damaged, as when a
+# controller or the socket loses bytes.
+import random
+
+HCI_EVENT = b"\x04"
+LE_META = b"\x3e"
+
+# Relative weight of each kind of advertisement in the generated traffic
+DEFAULT_MIX = {
+    "ruuvi": 3,
+    "eddystone_url": 2,
+    "eddystone_uid": 1,
+    "atcmi": 3,
+    "thermobeacon": 1,
+    "tilt": 1,
+    "garbage": 4,
+}
+
+
+class TrafficGenerator:
+    """Build legacy and extended advertising report events, a few of them damaged.
+
+    Damaged events are cut short, or have an AD structure or a report count
+    larger than the data they hold.
+
+    :param seed: The random seed. Default 0
+    :type seed: int
+    :param mix: Relative weight of each kind of advertisement. Default DEFAULT_MIX
+    :type mix: dict
+    :param devices: How many different devices advertise. Default 200
+    :type devices: int
+    :param extended: Share of extended advertising report events. Default 0.2
+    :type extended: float
+    :param multi: Share of legacy events holding several reports. Default 0.1
+    :type multi: float
+    :param broken: Share of damaged events. Default 0.02
+    :type broken: float
+    """
+
+    def __init__(
+        self, seed=0, mix=None, devices=200, extended=0.2, multi=0.1, broken=0.02
+    ):
+        self.random = random.Random(seed)
+        mix = mix or DEFAULT_MIX
+        self.kinds = list(mix)
+        self.weights = [mix[x] for x in self.kinds]
+        self.extended = extended
+        self.multi = multi
+        self.broken = broken
+        self.macs = [self.randbytes(6) for _ in range(devices)]
+
+    def packets(self, count):
+        """Return count HCI packets"""
+        return [self.packet() for _ in range(count)]
+
+    def packet(self):
+        rnd = self.random
+        if rnd.random() < self.extended:
+            packet = self.extended_event([self.report()])
+        else:
+            number = rnd.randint(2, 3) if rnd.random() < self.multi else 1
+            packet = self.legacy_event([self.report() for _ in range(number)])
+        if self.broken and rnd.random() < self.broken:
+            packet = self.damage(packet)
+        return packet
+
+    def damage(self, packet):
+        """Return the packet cut short, or with lengths past its end"""
+        rnd = self.random
+        how = rnd.randint(0, 2)
+        if how == 0:
+            # The length in the HCI header is left as it was
+            return packet[: rnd.randint(3, len(packet) - 1)]
+        packet = bytearray(packet)
+        if how == 1:
+            # The first AD structure, legacy or extended report
+            at = 14 if packet[3] == 0x02 else 29
+            if at < len(packet):
+                packet[at] = 0xFF
+        else:
+            packet[4] += rnd.randint(1, 3)
+        return bytes(packet)
+
+    def randbytes(self, count):
+        # As random.Random.randbytes, only added in Python 3.9
+        return self.random.getrandbits(8 * count).to_bytes(count, "little")
+
+    def report(self):
+        """Return (kind, peer, AD data) for one advertisement"""
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        peer = self.random.choice(self.macs)
+        return kind, peer, getattr(self, kind)(peer)
+
+    def legacy_event(self, reports):
+        body = bytes([0x02, len(reports)])
+        for kind, peer, ad in reports:
+            body += bytes([0x00, 0x00]) + peer + bytes([len(ad)]) + ad
+            body += bytes([256 - self.random.randint(30, 100)])
+        return HCI_EVENT + LE_META + bytes([len(body)]) + body
+
+    def extended_event(self, reports):
+        body = bytes([0x0D, len(reports)])
+        for kind, peer, ad in reports:
+            rssi = 256 - self.random.randint(30, 100)
+            body += b"\x13\x00\x00" + peer + bytes([0x01, 0x00, 0xFF, 0x7F, rssi])
+            body += b"\x00\x00\x00" + b"\x00" * 6 + bytes([len(ad)]) + ad
+        return HCI_EVENT + LE_META + bytes([len(body)]) + body
+
+    # The advertisements, the peer is given as in the packet, little endian
+
+    def ruuvi(self, peer):
+        rnd = self.random
+        data = bytes([0x05])
+        data += rnd.randint(-8000, 8000).to_bytes(2, "big", signed=True)
+        data += rnd.randint(0, 40000).to_bytes(2, "big")
+        data += rnd.randint(0, 65534).to_bytes(2, "big")
+        for _ in range(3):
+            data += rnd.randint(-1000, 1000).to_bytes(2, "big", signed=True)
+        data += rnd.randint(0, 65534).to_bytes(2, "big")
+        data += bytes([rnd.randint(0, 254)]) + rnd.randint(0, 65534).to_bytes(2, "big")
+        data += peer[::-1]
+        return b"\x02\x01\x06\x1b\xff\x99\x04" + data
+
+    def eddystone_url(self, peer):
+        name = bytes(self.random.choices(b"abcdefghijklmnopqrstuvwxyz", k=8))
+        frame = b"\x10\xf6\x03" + name + b"\x07"
+        return (
+            b"\x02\x01\x06\x03\x03\xaa\xfe"
+            + bytes([len(frame) + 3, 0x16])
+            + b"\xaa\xfe"
+            + frame
+        )
+
+    def eddystone_uid(self, peer):
+        frame = b"\x00\xf6" + self.randbytes(16) + b"\x00\x00"
+        return (
+            b"\x02\x01\x06\x03\x03\xaa\xfe"
+            + bytes([len(frame) + 3, 0x16])
+            + b"\xaa\xfe"
+            + frame
+        )
+
+    def atcmi(self, peer):
+        rnd = self.random
+        data = peer[::-1]
+        data += rnd.randint(-200, 400).to_bytes(2, "big", signed=True)
+        data += bytes([rnd.randint(0, 100), rnd.randint(0, 100)])
+        data += rnd.randint(2000, 3300).to_bytes(2, "big")
+        data += bytes([rnd.randint(0, 255)])
+        return b"\x10\x16\x1a\x18" + data
+
+    def thermobeacon(self, peer):
+        rnd = self.random
+        data = b"\x10\x00\x00\x00" + peer
+        data += rnd.randint(2000, 3300).to_bytes(2, "little")
+        data += rnd.randint(-400, 800).to_bytes(2, "little", signed=True)
+        data += rnd.randint(0, 1600).to_bytes(2, "little", signed=True)
+        data += rnd.randint(0, 2**32 - 1).to_bytes(4, "little")
+        return b"\x03\x02\xf0\xff" + bytes([len(data) + 1, 0xFF]) + data
+
+    def tilt(self, peer):
+        rnd = self.random
+        data = b"\x4c\x00\x02\x15" + bytes.fromhex("a495bb10c5b14b44b5121370f02d74de")
+        data += rnd.randint(30, 90).to_bytes(2, "big")
+        data += rnd.randint(990, 1120).to_bytes(2, "big") + b"\xc5"
+        return bytes([len(data) + 1, 0xFF]) + data
+
+    def garbage(self, peer):
+        # Well formed, but of no interest to any plugin
+        rnd = self.random
+        ad = b""
+        for _ in range(rnd.randint(1, 3)):
+            kind = rnd.choice((0x01, 0x08, 0x09, 0x0A, 0xFF))
+            data = self.randbytes(rnd.randint(1, 8))
+            if kind == 0xFF:
+                data = b"\x06\x00" + data
+            ad += bytes([len(data) + 1, kind]) + data
+        return ad
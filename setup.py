@@ -10,6 +10,12 @@ with open("README.rst", "r") as fh:
 setuptools.setup(
     name="aioblescan",
     packages=["aioblescan", "aioblescan.plugins"],
+    # Optional, when it cannot be built the pure Python version is used
+    ext_modules=[
+        setuptools.Extension(
+            "aioblescan._adscan", ["aioblescan/_adscan.c"], optional=True
+        )
+    ],
     # packages=setuptools.find_packages(),
     version=version,
     author="François Wautier",
@@ -20,15 +26,15 @@ setuptools.setup(
     url="http://github.com/frawau/aioblescan",
     keywords=["bluetooth", "advertising", "hci", "ble"],
     license="MIT",
+    python_requires=">=3.8",
     install_requires=[],
-    extras_require={"dev": ["pytest"]},
+    extras_require={"dev": ["pytest"], "numpy": ["numpy"]},
     # See https://pypi.python.org/pypi?%3Aaction=list_classifiers
     classifiers=[
         # Pick your license as you wish (should match "license" above)
         "License :: OSI Approved :: MIT License",
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
@@ -0,0 +1,121 @@
+import asyncio
+import aioblescan as aiobs
+
+# Packets, as received from the controller
+EDDY_URL = b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x10\xf6\x03makecode\x00#about\xb5"
+EDDY_UID = b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x00\xf6\x00\x00\x00\x00\x00\x00\x00\x00\x00c\x00\x00\x00\x00\x00X\xb6"
+ATCMI = b"\x04>\x1d\x02\x01\x00\x008R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde\xdb"
+CMD_COMPLETE = b"\x04\x0e\x04\x01\x0c\x20\x00"
+
+PEER = b"\x4f\x88\x4c\x33\xb8\xcb"
+
+
+def legacy(ad):
+    """Return an advertising report event from PEER, with AD data ad."""
+    body = b"\x02\x01\x00\x00" + PEER + bytes([len(ad)]) + ad + b"\xc0"
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def extended(ad):
+    """Return an extended advertising report event from PEER, with AD data ad."""
+    report = b"\x13\x00\x00" + PEER + b"\x01\x00\xff\x7f\xc0\x00\x00\x00" + b"\x00" * 6
+    body = b"\x0d\x01" + report + bytes([len(ad)]) + ad
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+ATCMI_AD = b"\x10\x16\x1a\x18" + PEER[::-1] + b"\x00\xf3%U\x0b\x9f\xde"
+RUUVI_AD = b"\x1b\xff\x99\x04" + bytes.fromhex(
+    "0512FC5394C37C0004FFFC040CAC364200CDCBB8334C884F"
+)
+TILT_AD = b"\x1a\xff\x4c\x00\x02\x15" + bytes.fromhex(
+    "a495bb10c5b14b44b5121370f02d74de004403f8c5"
+)
+THERMOBEACON_AD = (
+    b"\x03\x02\xf0\xff\x15\xff\x10\x00\x00\x00"
+    + PEER
+    + b"\x0b\x0c\x70\x01\xd0\x02\x10\x27\x00\x00"
+)
+# One of each kind, and some no plugin decodes
+PACKETS = [
+    EDDY_URL,
+    EDDY_UID,
+    legacy(ATCMI_AD),
+    legacy(b"\x02\x01\x06" + RUUVI_AD),
+    legacy(TILT_AD),
+    legacy(THERMOBEACON_AD),
+    legacy(b"\x02\x01\x06\x05\xff\x06\x00\x01\x02"),
+    extended(b"\x02\x01\x06" + ATCMI_AD),
+    extended(b"\x05\xff\x06\x00\x01\x02"),
+    CMD_COMPLETE,
+]
+
+
+def cmd_complete(opcode, resp):
+    body = b"\x01" + opcode.to_bytes(2, "little") + resp
+    return b"\x04\x0e" + bytes([len(body)]) + body
+
+
+def cmd_status(opcode, status=0, credits=1):
+    body = bytes([status, credits]) + opcode.to_bytes(2, "little")
+    return b"\x04\x0f" + bytes([len(body)]) + body
+
+
+class FakeSocket:
+    def __init__(self):
+        self.filters = []
+
+    def setsockopt(self, level, option, value):
+        self.filters.append(value)
+
+
+class FakeTransport(asyncio.Transport):
+    def __init__(self):
+        super().__init__()
+        self.written = []
+        self.socket = FakeSocket()
+        self.paused = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+    def is_closing(self):
+        return False
+
+    def get_extra_info(self, name, default=None):
+        if name == "socket":
+            return self.socket
+        return default
+
+
+def make_requester():
+    """Return a requester on a fake transport, as if initialisation was done."""
+    btctrl = aiobs.BLEScanRequester()
+    btctrl.connection_made(FakeTransport())
+    btctrl._supported_commands = [0] * 64
+    btctrl._le_features = [0] * 8
+    btctrl._uninitialized = False
+    btctrl._initialized.set()
+    return btctrl
+
+
+def answer_commands(btctrl, statuses=None):
+    """Answer each command written with a Command Complete event.
+
+    statuses maps an opcode to the status it gets, 0 by default.
+    """
+    written = btctrl.transport.written
+    statuses = statuses or {}
+
+    def write(data):
+        written.append(data)
+        opcode = int.from_bytes(data[1:3], "little")
+        answer = cmd_complete(opcode, bytes([statuses.get(opcode, 0)]))
+        asyncio.get_running_loop().call_soon(btctrl.data_received, answer)
+
+    btctrl.transport.write = write
@@ -0,0 +1,50 @@
+import pytest
+import aioblescan as aiobs
+from aioblescan.aioblescan import _py_ad_scan
+from .fixtures import PACKETS
+
+# Legacy reports, one with an AD structure of length 0, one truncated
+EMPTY = b"\x04>\x11\x02\x01\x00\x00\x01\x02\x03\x04\x05\x06\x05\x00\x03\x16\xaa\xfe\xc5"
+TRUNCATED = b"\x04>\x0f\x02\x01\x00\x00\x01\x02\x03\x04\x05\x06\x0a\x03\x16\xaa\xfe"
+
+
+def scanners():
+    yield _py_ad_scan
+    try:
+        from aioblescan._adscan import ad_scan
+    except ImportError:
+        return
+    yield ad_scan
+
+
+@pytest.mark.parametrize("scan", list(scanners()))
+def test_ad_scan(scan):
+    assert scan(EMPTY, 14, 5) == ([(0x16, 17, 2)], 19, -59)
+    assert scan(EMPTY, 14, 5, True) == ([(None, 15, 0), (0x16, 17, 2)], 19, -59)
+    assert scan(memoryview(EMPTY), 14, 5) == ([(0x16, 17, 2)], 19, -59)
+    assert scan(EMPTY, 14, 4) == ([(0x16, 17, 2)], 19, -59)
+    # No RSSI
+    assert scan(EMPTY[:-1], 14, 5) == ([(0x16, 17, 2)], 19, None)
+    with pytest.raises(IndexError):
+        scan(TRUNCATED, 14, 10)
+
+
+@pytest.mark.parametrize("scan", list(scanners())[1:])
+def test_same_as_python(scan):
+    for packet in PACKETS + [EMPTY]:
+        records = aiobs.decode_adv_reports(packet)
+        if not records:
+            continue
+        assert scan(packet, 14, packet[13]) == _py_ad_scan(packet, 14, packet[13])
+        assert scan(packet, 14, packet[13], True) == _py_ad_scan(
+            packet, 14, packet[13], True
+        )
+
+
+def test_empty_ad_structure():
+    ev = aiobs.HCI_Event()
+    ev.decode(EMPTY)
+    report = ev.retrieve(aiobs.HCI_LEM_Adv_Report)[0]
+    assert [x.length for x in report.payload[4:6]] == [1, 4]
+    assert report.payload[4].payload == []
+    assert ev.retrieve("rssi")[0].val == -59
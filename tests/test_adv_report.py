@@ -0,0 +1,98 @@
+import timeit
+import pytest
+import aioblescan as aiobs
+import aioblescan.aioblescan as core
+
+REPORT_1 = b"\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x10\xf6\x03makecode\x00#about\xb5"
+REPORT_2 = b"\x00\x008R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde\xdb"
+
+
+def event(*reports):
+    body = b"\x02" + bytes([len(reports)]) + b"".join(reports)
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+PACKETS = [
+    b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x10\xf6\x03makecode\x00#about\xb5",
+    b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x00\xf6\x00\x00\x00\x00\x00\x00\x00\x00\x00c\x00\x00\x00\x00\x00X\xb6",
+    b"\x04>\x1d\x02\x01\x00\x008R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde\xdb",
+    b"\x04>\x1d\x02\x01\x00\x009R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R9\x01\x08\x1aU\x0b\x9f\xe0\xd5",
+    b"\x04>\x1d\x02\x01\x00\x008S@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@S8\xff\xd3,B\n\xfe\xfb\xce",
+    event(REPORT_1, REPORT_2),
+    event(b"\x04\x01\x01\x02\x03\x04\x05\x06\x04\x00\x02\x01\x06"),
+]
+
+
+def from_tree(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    records = []
+    for report in ev.retrieve(aiobs.HCI_LEM_Adv_Report):
+        rssi = report.retrieve("rssi")
+        ad = []
+        for x in report.payload[4:]:
+            if isinstance(x, aiobs.AD_Structure) and x.payload:
+                ad.append((x.payload[0].val, x.length - 2))
+        records.append(
+            (
+                report.payload[0].val,
+                report.payload[1].val,
+                report.payload[2].val,
+                rssi[0].val if rssi else None,
+                ad,
+            )
+        )
+    return records
+
+
+@pytest.mark.parametrize("data", PACKETS)
+def test_same_as_tree(data):
+    records = aiobs.decode_adv_reports(data)
+    flat = [
+        (x.ev_type, x.addr_type, x.mac, x.rssi, [(t, l) for t, o, l in x.ad])
+        for x in records
+    ]
+    assert flat == from_tree(data)
+
+
+def test_ad_offsets():
+    data = PACKETS[0]
+    record = aiobs.decode_adv_reports(memoryview(data))[0]
+    assert record.mac == "f1:55:90:65:29:dc"
+    assert record.rssi == -75
+    assert [(t, data[o : o + l]) for t, o, l in record.ad] == [
+        (0x01, b"\x06"),
+        (0x03, b"\xaa\xfe"),
+        (0x16, b"\xaa\xfe\x10\xf6\x03makecode\x00#about"),
+    ]
+
+
+def test_not_an_adv_report():
+    assert aiobs.decode_adv_reports(b"\x04\x0e\x04\x01\x02\x10\x00") is None
+
+
+
+
+def decode_tree(data):
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+
+
+def test_faster_than_tree(monkeypatch):
+    # decode_adv_reports must stay at least 10 times faster than HCI_Event.decode,
+    # both in pure Python: the compiled ad_scan, when built, only speeds up the
+    # latter. timeit runs without the garbage collector. Both are timed in turns,
+    # and the best round of each is kept, so that a busy machine does not skew
+    # the ratio.
+    monkeypatch.setattr(core, "_c_ad_scan", None)
+    packets = PACKETS[:5]
+    tree = timeit.Timer(lambda: [decode_tree(x) for x in packets])
+    flat = timeit.Timer(lambda: [aiobs.decode_adv_reports(x) for x in packets])
+    rounds = [(tree.timeit(100), flat.timeit(100)) for _ in range(50)]
+    assert min(x for x, y in rounds) / min(y for x, y in rounds) >= 10
+
+
+def test_short_events():
+    assert aiobs.decode_adv_reports(b"\x04>\x02\x02\x00") == []
+    with pytest.raises(core.error):
+        aiobs.decode_adv_reports(PACKETS[2][:10])
@@ -0,0 +1,63 @@
+import tracemalloc
+import pytest
+import aioblescan as aiobs
+
+LEGACY = b"\x04>\x1d\x02\x01\x00\x008R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde\xdb"
+EXTENDED = b"\x04>.\r\x01\x00\x00\x01\x01\x02\x03\x04\x05\x06\x01\x00\xff\x7f\xc0\x00\x00\x00\x00\x00\x00\x00\x00\x00\x14\x02\x01\x06\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde"
+
+
+def blocks_per_event(data, number=200):
+    """Count the memory blocks held by each decoded event."""
+    keep = []
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(number):
+            ev = aiobs.HCI_Event()
+            ev.decode(data)
+            keep.append(ev)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    return sum(x.count_diff for x in stats) / number
+
+
+# On CPython 3.11, events hold 44 (legacy) and 61 (extended) blocks, against 61 and
+# 99 when each event had its own copy of the lookup tables and fields had no
+# __slots__. The limits sit halfway, leaving room for other Python versions to
+# allocate a few blocks more, while still catching the copies coming back.
+@pytest.mark.parametrize("data, limit", [(LEGACY, 53), (EXTENDED, 80)])
+def test_blocks_per_report(data, limit):
+    assert blocks_per_event(data) < limit
+
+
+def test_tables_are_shared():
+    ev = aiobs.HCI_Event()
+    ev.decode(EXTENDED)
+    report = ev.retrieve(aiobs.HCI_LEM_Ext_Adv_Report)[0]
+    assert report.payload[6].loval is aiobs.EXT_ADV_SIDS
+    for ad in report.retrieve(aiobs.AD_Structure):
+        assert ad.payload[0].type.loval is aiobs.EIR_TYPES
+    assert report.retrieve("flags")[0].loval is aiobs.AD_FLAGS
+
+
+def test_no_instance_dict():
+    ev = aiobs.HCI_Event()
+    ev.decode(EXTENDED)
+    report = ev.retrieve(aiobs.HCI_LEM_Ext_Adv_Report)[0]
+    for field in report.payload[:13]:
+        assert not hasattr(field, "__dict__")
+
+
+def test_lazy_values():
+    ev = aiobs.HCI_Event()
+    ev.decode(EXTENDED)
+    peer = ev.retrieve("peer")[0]
+    assert peer._val is None
+    assert peer.val == "06:05:04:03:02:01"
+    assert peer.val is peer.val
+    evtype = ev.retrieve("ev type")[0]
+    assert evtype.val is evtype.val
+    evtype.decode(b"\x80")
+    assert evtype.val["Connectable"]
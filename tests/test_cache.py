@@ -0,0 +1,93 @@
+import tracemalloc
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, ATCMiThermometer, Tilt
+from .fixtures import EDDY_URL, ATCMI, PACKETS, TILT_AD, legacy, extended
+
+
+def with_rssi(data, rssi):
+    return data[:-1] + rssi.to_bytes(1, "little", signed=True)
+
+
+def test_key():
+    assert aiobs.DecodeCache.key(EDDY_URL) == EDDY_URL[5:-1]
+    assert aiobs.DecodeCache.key(with_rssi(EDDY_URL, -20)) == EDDY_URL[5:-1]
+    assert aiobs.DecodeCache.key(extended(b"\x02\x01\x06")) is None
+    assert aiobs.DecodeCache.key(PACKETS[-1]) is None
+
+
+def test_hit_patches_rssi():
+    cache = aiobs.DecodeCache()
+    dispatcher = aiobs.Dispatcher([EddyStone(), ATCMiThermometer(), Tilt()], cache)
+    first = dispatcher.decode(EDDY_URL)
+    second = dispatcher.decode(with_rssi(EDDY_URL, -20))
+    assert first[1]["rssi"] == -75
+    assert second == (0, dict(first[1], rssi=-20))
+    assert cache.hits == 1 and cache.misses == 1
+    # Results that are not dictionaries are computed again
+    tilt = legacy(TILT_AD)
+    dispatcher.decode(tilt)
+    assert '"rssi": -20' in dispatcher.decode(with_rssi(tilt, -20))[1]
+    assert cache.hits == 2
+
+
+def test_same_as_uncached():
+    cache = aiobs.DecodeCache()
+    cached = aiobs.Dispatcher([EddyStone(), ATCMiThermometer(), Tilt()], cache)
+    plain = aiobs.Dispatcher([EddyStone(), ATCMiThermometer(), Tilt()])
+    for rssi in (-40, -50, -60):
+        for data in PACKETS:
+            data = with_rssi(data, rssi) if cache.key(data) else data
+            assert cached.decode(data) == plain.decode(data)
+    assert cache.hits > 0
+
+
+def test_bounded():
+    cache = aiobs.DecodeCache(max_entries=10)
+    for idx in range(20):
+        data = bytearray(ATCMI)
+        data[7] = idx
+        data = bytes(data)
+        ev = aiobs.HCI_Event()
+        ev.decode(data)
+        cache.put(cache.key(data), ev)
+    assert len(cache) == 10
+    cache.max_bytes = cache.size // 2
+    data = with_rssi(ATCMI, -20)
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    cache.put(cache.key(data), ev)
+    assert len(cache) < 6
+    assert cache.evictions == 21 - len(cache)
+    assert cache.size <= cache.max_bytes
+
+
+def test_budget_holds():
+    max_bytes = 200000
+    cache = aiobs.DecodeCache(max_entries=100000, max_bytes=max_bytes)
+    dispatcher = aiobs.Dispatcher([EddyStone(), ATCMiThermometer(), Tilt()], cache)
+    tracemalloc.start()
+    try:
+        for idx in range(400):
+            data = bytearray(ATCMI)
+            data[7:9] = idx.to_bytes(2, "little")
+            dispatcher.decode(bytes(data))
+        # What the cache holds
+        used = tracemalloc.get_traced_memory()[0]
+        cache.clear()
+        used -= tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert cache.evictions > 0
+    assert used <= max_bytes
+
+
+def test_rssi_not_shared():
+    cache = aiobs.DecodeCache()
+    ev = aiobs.HCI_Event()
+    ev.decode(ATCMI)
+    rssi = ev.retrieve("rssi")[-1].val
+    cache.put(cache.key(ATCMI), ev)
+    first = cache.get(cache.key(ATCMI), with_rssi(ATCMI, -20))[0]
+    second = cache.get(cache.key(ATCMI), with_rssi(ATCMI, -30))[0]
+    assert [x.retrieve("rssi")[-1].val for x in (ev, first, second)] == [rssi, -20, -30]
+    assert first.retrieve("peer")[0] is second.retrieve("peer")[0]
@@ -0,0 +1,110 @@
+import asyncio
+import io
+import pytest
+import aioblescan as aiobs
+from .fixtures import EDDY_URL, ATCMI, FakeTransport, cmd_complete, make_requester
+
+SCAN_ENABLE = aiobs.HCI_Cmd_LE_Scan_Enable(True, False).encode()
+
+
+@pytest.mark.parametrize("fmt", [aiobs.BTSNOOP, aiobs.PCAP])
+def test_round_trip(fmt):
+    f = io.BytesIO()
+    writer = aiobs.CaptureWriter(f, fmt, buffer_size=100)
+    writer.write(SCAN_ENABLE, 1600000000.25, received=False)
+    writer.write(EDDY_URL, 1600000000.5)
+    writer.write(ATCMI, 1600000001.75)
+    writer.flush()
+    f.seek(0)
+    assert list(aiobs.read_capture(f)) == [
+        (1600000000.25, SCAN_ENABLE, False),
+        (1600000000.5, EDDY_URL, True),
+        (1600000001.75, ATCMI, True),
+    ]
+
+
+def test_btsnoop_header():
+    f = io.BytesIO()
+    aiobs.CaptureWriter(f).flush()
+    assert f.getvalue() == b"btsnoop\x00\x00\x00\x00\x01\x00\x00\x03\xea"
+
+
+def test_not_a_capture():
+    with pytest.raises(ValueError):
+        list(aiobs.read_capture(io.BytesIO(b"\x00" * 32)))
+
+
+def test_requester_records():
+    async def run():
+        btctrl = make_requester()
+        btctrl.process = lambda data: None
+        btctrl.recorder = aiobs.CaptureWriter(f)
+        btctrl.data_received(EDDY_URL)
+        await btctrl.send_scan_request()
+        btctrl.recorder.flush()
+
+    f = io.BytesIO()
+    asyncio.run(run())
+    f.seek(0)
+    records = list(aiobs.read_capture(f))
+    assert [(x.packet, x.received) for x in records[:2]] == [
+        (EDDY_URL, True),
+        (aiobs.HCI_Cmd_LE_Set_Scan_Params(scan_type=0).encode(), False),
+    ]
+    assert records[2].packet == SCAN_ENABLE
+
+
+def test_requester_records_init(tmp_path):
+    path = str(tmp_path / "init.log")
+    btctrl = aiobs.BLEScanRequester()
+    btctrl.recorder = aiobs.CaptureWriter(path)
+    btctrl.connection_made(FakeTransport())
+    btctrl.data_received(cmd_complete(0x1002, b"\x00" + bytes(64)))
+    btctrl.connection_lost(None)
+    assert btctrl.recorder._file.closed
+    records = list(aiobs.read_capture(path))
+    assert [(x.packet, x.received) for x in records] == [
+        (aiobs.HCI_Cmd_Read_Local_Supported_Commands().encode(), False),
+        (cmd_complete(0x1002, b"\x00" + bytes(64)), True),
+        (aiobs.HCI_Cmd_LE_Read_Local_Supported_Features().encode(), False),
+    ]
+
+
+@pytest.mark.parametrize("realtime", [False, True])
+def test_replay(realtime):
+    records = [
+        aiobs.CaptureRecord(10.0, EDDY_URL, True),
+        aiobs.CaptureRecord(10.01, SCAN_ENABLE, False),
+        aiobs.CaptureRecord(10.02, ATCMI, True),
+    ]
+
+    async def run():
+        btctrl = aiobs.BLEScanRequester()
+        queue = btctrl.reports()
+        count = await aiobs.replay(btctrl, records, realtime=realtime)
+        return count, [x.retrieve("peer")[0].val async for x in queue]
+
+    count, macs = asyncio.run(run())
+    assert count == 2
+    assert macs == ["f1:55:90:65:29:dc", "a4:c1:38:40:52:38"]
+
+
+@pytest.mark.parametrize("fmt", [aiobs.BTSNOOP, aiobs.PCAP])
+def test_index(fmt, tmp_path):
+    pytest.importorskip("numpy")
+    path = str(tmp_path / "capture")
+    with aiobs.CaptureWriter(path, fmt) as writer:
+        writer.write(SCAN_ENABLE, 1.0, received=False)
+        for x in range(10):
+            writer.write(EDDY_URL if x % 3 else ATCMI, 2.0 + x)
+    with aiobs.CaptureIndex(path) as index:
+        assert len(index) == 11
+        assert list(index.event) == [0] + [0x3E] * 10
+        assert index.mac[1] == aiobs.CaptureIndex.mac_to_int("a4:c1:38:40:52:38")
+        selection = index.select(macs=["a4:c1:38:40:52:38"], since=3.0)
+        assert list(selection) == [4, 7, 10]
+        decoded = list(index.decode(selection))
+        assert [t for t, _ in decoded] == [5.0, 8.0, 11.0]
+        assert decoded[0][1].retrieve("peer")[0].val == "a4:c1:38:40:52:38"
+        assert list(index.select(subevents=[0x0D])) == []
+        assert bytes(index.packet(2)) == EDDY_URL
@@ -0,0 +1,76 @@
+import pytest
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, RuuviWeather, ATCMiThermometer
+from aioblescan.plugins import ThermoBeacon, Tilt
+from .fixtures import PACKETS
+
+
+def decoders():
+    return [EddyStone(), RuuviWeather(), ATCMiThermometer(), ThermoBeacon(), Tilt()]
+
+
+def linear(data):
+    # What __main__ does without a dispatcher
+    ev = aiobs.HCI_Event()
+    ev.decode(data)
+    for idx, decoder in enumerate(decoders()):
+        result = decoder.decode(ev)
+        if result:
+            return idx, result
+    return None
+
+
+@pytest.mark.parametrize("data", PACKETS)
+def test_same_as_linear(data):
+    assert aiobs.Dispatcher(decoders()).decode(data) == linear(data)
+
+
+def test_every_plugin_matches():
+    dispatcher = aiobs.Dispatcher(decoders())
+    found = [dispatcher.decode(data) for data in PACKETS]
+    assert [x[0] for x in found if x] == [0, 0, 2, 1, 4, 3, 2]
+
+
+def test_skipped():
+    dispatcher = aiobs.Dispatcher(decoders())
+    for data in PACKETS[-4:]:
+        dispatcher.decode(data)
+    assert dispatcher.skipped == 3
+    assert dispatcher.candidates(PACKETS[-3]) == [2]
+
+
+def test_no_signature_always_tried():
+    class Everything:
+        def decode(self, packet):
+            return "yes"
+
+    dispatcher = aiobs.Dispatcher([ATCMiThermometer(), Everything()])
+    assert dispatcher.decode(PACKETS[-1]) == (1, "yes")
+    assert dispatcher.skipped == 0
+
+
+@pytest.mark.parametrize("data", PACKETS)
+def test_ad_structures(data):
+    records = aiobs.decode_adv_reports(data)
+    if records is not None:
+        assert aiobs.ad_structures(data) == [x for y in records for x in y.ad]
+    elif data[1] != 0x3E:
+        assert aiobs.ad_structures(data) is None
+
+
+def test_indexed_after_first():
+    class Recorder:
+        signatures = (aiobs.Signature(0x16, b"\x1a\x18"),)
+
+        def __init__(self):
+            self.indexed = []
+
+        def decode(self, ev):
+            self.indexed.append(ev._index is not None)
+            return None
+
+    first, second = Recorder(), Recorder()
+    aiobs.Dispatcher([first, second]).decode(PACKETS[2])
+    # The event is only indexed once the first candidate gave nothing
+    assert first.indexed == [False]
+    assert second.indexed == [True]
@@ -1,6 +1,7 @@
 import unittest
 import aioblescan
 from aioblescan.plugins import EddyStone
+from aioblescan.plugins.eddystone import decode_frame
 
 
 class EddystoneURL(unittest.TestCase):
@@ -40,5 +41,70 @@ class EddystoneEID(unittest.TestCase):
         )
 
 
+def frame_event(frame):
+    ad = b"\x02\x01\x06\x03\x03\xaa\xfe"
+    ad += bytes([len(frame) + 3, 0x16, 0xAA, 0xFE]) + frame
+    body = b"\x02\x01\x00\x00\xdc)e\x90U\xf1" + bytes([len(ad)]) + ad + b"\xc0"
+    pckt = aioblescan.HCI_Event()
+    pckt.decode(b"\x04>" + bytes([len(body)]) + body)
+    return pckt
+
+
+class EddystoneFrames(unittest.TestCase):
+    def test_tlm(self):
+        frame = b"\x20\x00\x0b\xb8\x17\x80\xff\xff\xff\xff\x00\x00\x01\x00"
+        result = EddyStone().decode(frame_event(frame))
+        self.assertDictEqual(
+            result,
+            {
+                "battery": 3000,
+                "temperature": 23.5,
+                "pdu count": 0xFFFFFFFF,
+                "uptime": 25600,
+                "rssi": -64,
+                "mac address": "f1:55:90:65:29:dc",
+            },
+        )
+
+    def test_eid(self):
+        result = EddyStone().decode(frame_event(b"\x30\xf6" + bytes(range(8))))
+        self.assertEqual(result["eid"], bytes(range(8)))
+        self.assertEqual(result["tx_power"], -10)
+
+    def test_url_expansion(self):
+        frame = b"\x10\x00\x02a\x0bb\x0dc"
+        self.assertEqual(decode_frame(frame)["url"], "http://a.infob.govc")
+        # Unknown schemes give their number
+        self.assertEqual(decode_frame(b"\x10\x00\x07abc")["url"], "7abc")
+
+    def test_tlm_unsigned(self):
+        frame = b"\x20\x00\xff\xff\xff\x80" + b"\xff" * 8
+        result = decode_frame(frame)
+        self.assertEqual(result["battery"], 0xFFFF)
+        self.assertEqual(result["temperature"], -0.5)
+        self.assertEqual(result["uptime"], 0xFFFFFFFF * 100)
+
+    def test_short_frames(self):
+        for frame in [b"", b"\x00\xf6\x00", b"\x10\xf6", b"\x20\x00", b"\x30"]:
+            self.assertIsNone(decode_frame(frame), frame)
+        self.assertIsNone(EddyStone().decode(frame_event(b"\x00\xf6\x00")))
+
+    def test_not_eddystone(self):
+        # Service data without the service UUID listed
+        pckt = aioblescan.HCI_Event()
+        pckt.decode(
+            b"\x04>\x18\x02\x01\x00\x00\xdc)e\x90U\xf1\x0b\x02\x01\x06\x07\x16\xaa\xfe\x10\xf6\x03a\xc0"
+        )
+        self.assertIsNone(EddyStone().decode(pckt))
+        self.assertIsNone(EddyStone().decode(aioblescan.HCI_Event()))
+
+    def test_unmodified(self):
+        pckt = frame_event(b"\x10\xf6\x03makecode\x00#about")
+        before = [x.val for x in pckt.retrieve("Adv Payload")]
+        first = EddyStone().decode(pckt)
+        self.assertEqual(first, EddyStone().decode(pckt))
+        self.assertEqual(before, [x.val for x in pckt.retrieve("Adv Payload")])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, ATCMiThermometer
+from .fixtures import make_requester, EDDY_URL, ATCMI, CMD_COMPLETE
+
+
+def test_requester_metrics():
+    async def run():
+        btctrl = make_requester()
+        metrics = aiobs.Metrics()
+        metrics.attach(btctrl)
+        btctrl.process_batch = lambda reports: None
+        btctrl.process = lambda data: None
+        btctrl.batch_size = 4
+        for packet in [EDDY_URL, ATCMI, CMD_COMPLETE, b"\x04>\x05\x02\x01"]:
+            btctrl.data_received(packet)
+        return metrics.snapshot()
+
+    snapshot = asyncio.run(run())
+    assert snapshot["packets"] == {0x3E: 3, 0x0E: 1}
+    assert snapshot["reports"] == {0x02: 3}
+    assert snapshot["decode_time"]["count"] == 3
+    assert snapshot["callback_time"]["count"] == 2
+    assert snapshot["dropped"] == 1
+
+
+def test_dropped_after_close():
+    btctrl = make_requester()
+    metrics = aiobs.Metrics()
+    metrics.attach(btctrl)
+    queue = btctrl.reports(maxsize=1, overflow=aiobs.DROP_NEWEST)
+    for packet in [EDDY_URL, ATCMI, ATCMI]:
+        btctrl.data_received(packet)
+    assert metrics.dropped() == 2
+    queue.close()
+    assert metrics.dropped() == 2
+    assert "aioblescan_dropped_total 2" in metrics.prometheus()
+
+
+def test_dispatcher_metrics():
+    metrics = aiobs.Metrics()
+    dispatcher = aiobs.Dispatcher([EddyStone(), ATCMiThermometer()], metrics=metrics)
+    for packet in [EDDY_URL, ATCMI, ATCMI]:
+        dispatcher.decode(packet)
+    plugins = metrics.snapshot()["plugins"]
+    assert plugins["EddyStone"]["calls"] == 1
+    assert plugins["ATCMiThermometer"]["hits"] == 2
+    assert metrics.decode_time.count == 3
+
+
+def test_prometheus():
+    metrics = aiobs.Metrics()
+    metrics.packet(EDDY_URL)
+    metrics.plugin("Tilt", 2e-5, True)
+    text = metrics.prometheus()
+    assert 'aioblescan_packets_total{event="0x3e"} 1' in text
+    assert 'aioblescan_reports_total{subevent="0x02"} 1' in text
+    assert 'aioblescan_plugin_decode_seconds_bucket{plugin="Tilt",le="1e-05"} 0' in text
+    assert 'aioblescan_plugin_decode_seconds_bucket{plugin="Tilt",le="+Inf"} 1' in text
+    assert 'aioblescan_plugin_calls_total{plugin="Tilt"} 1' in text
+    assert 'aioblescan_plugin_hits_total{plugin="Tilt"} 1' in text
+    assert "# TYPE aioblescan_decode_seconds histogram" in text
+
+
+def test_serve():
+    async def run():
+        metrics = aiobs.Metrics()
+        metrics.packet(EDDY_URL)
+        server = await metrics.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.0\r\n\r\n")
+        answer = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return answer
+
+    answer = asyncio.run(run())
+    assert answer.startswith(b"HTTP/1.0 200 OK")
+    assert b'aioblescan_packets_total{event="0x3e"} 1' in answer
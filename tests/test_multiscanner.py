@@ -0,0 +1,50 @@
+import asyncio
+import aioblescan as aiobs
+from .fixtures import make_requester, EDDY_URL, ATCMI
+
+# Same device and data, another RSSI
+EDDY_URL_2 = EDDY_URL[:-1] + b"\xc0"
+
+
+def scan(window, feed):
+    async def run():
+        scanner = aiobs.MultiScanner(window=window)
+        requesters = [make_requester(), make_requester()]
+        for idx, btctrl in enumerate(requesters):
+            scanner.add_requester(idx, btctrl)
+        await feed(requesters)
+        for btctrl in requesters:
+            btctrl.connection_lost(None)
+        return scanner, [
+            (idx, report.retrieve("peer")[0].val) async for idx, report in scanner
+        ]
+
+    return asyncio.run(run())
+
+
+def test_merge_and_deduplicate():
+    async def feed(requesters):
+        requesters[0].data_received(EDDY_URL)
+        requesters[1].data_received(EDDY_URL_2)
+        requesters[1].data_received(ATCMI)
+        requesters[0].data_received(EDDY_URL)
+
+    scanner, reports = scan(1.0, feed)
+    assert reports == [
+        (0, "f1:55:90:65:29:dc"),
+        (1, "a4:c1:38:40:52:38"),
+        (0, "f1:55:90:65:29:dc"),
+    ]
+    assert scanner.duplicates == 1
+
+
+def test_window_expires():
+    async def feed(requesters):
+        requesters[0].data_received(EDDY_URL)
+        await asyncio.sleep(0.05)
+        requesters[1].data_received(EDDY_URL)
+
+    scanner, reports = scan(0.01, feed)
+    assert [idx for idx, _ in reports] == [0, 1]
+    assert scanner.duplicates == 0
+    assert len(scanner._seen) == 1
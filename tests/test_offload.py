@@ -0,0 +1,61 @@
+import asyncio
+import aioblescan as aiobs
+from .fixtures import make_requester, EDDY_URL, ATCMI, CMD_COMPLETE
+from aioblescan.plugins import EddyStone, ATCMiThermometer, RuuviWeather, Tilt
+
+# Truncated Ruuvi RAWv2 and Tilt data, the plugins raise
+BAD_RUUVI = b"\x04>\x16\x02\x01\x00\x00O\x88L3\xb8\xcb\n\t\xff\x99\x04\x05\x00\x00\x00\x00\x00\xc0"
+BAD_TILT = b"\x04>\x18\x02\x01\x00\x00O\x88L3\xb8\xcb\x0c\x0b\xffL\x00\x02\x15\xa4\x95\x00\x00\x00\x00\xc0"
+
+
+def test_decode_chunk():
+    decoders = [EddyStone(), ATCMiThermometer()]
+    chunk = [(1, EDDY_URL), (2, CMD_COMPLETE), (3, b"\x04>\x05\x02\x01"), (4, ATCMI)]
+    results = aiobs.decode_chunk(chunk, decoders)
+    assert [(t, idx) for t, idx, _ in results] == [(1, 0), (4, 1)]
+    assert results[0][2]["url"] == "https://makecode.com/#about"
+    assert results[1][2]["mac address"] == "a4:c1:38:40:52:38"
+
+
+def test_decoder_failures():
+    decoders = [RuuviWeather(), Tilt(), EddyStone()]
+    chunk = [(1, BAD_RUUVI), (2, EDDY_URL), (3, BAD_TILT), (4, EDDY_URL)]
+    failures = []
+    results = aiobs.decode_chunk(chunk, decoders, failures)
+    assert [(t, idx) for t, idx, _ in results] == [(2, 2), (4, 2)]
+    assert failures == [(1, 0), (3, 1)]
+
+    async def run():
+        pipeline = aiobs.DecodePipeline(decoders, workers=1)
+        for timestamp, packet in chunk:
+            pipeline.feed(packet, timestamp)
+        pipeline.close()
+        results = [t async for t, _, _ in pipeline]
+        return results, pipeline.failed
+
+    assert asyncio.run(run()) == ([2, 4], 2)
+
+
+def test_pipeline_in_order():
+    async def run():
+        pipeline = aiobs.DecodePipeline(
+            [EddyStone(), ATCMiThermometer()], workers=2, chunk_size=3
+        )
+        for idx in range(20):
+            pipeline.feed(EDDY_URL if idx % 2 else ATCMI, timestamp=idx)
+        pipeline.close()
+        return [(t, idx) async for t, idx, _ in pipeline]
+
+    assert asyncio.run(run()) == [(t, 1 - t % 2) for t in range(20)]
+
+
+def test_requester_pipeline():
+    async def run():
+        btctrl = make_requester()
+        btctrl.pipeline = aiobs.DecodePipeline([EddyStone()], workers=1)
+        for packet in [EDDY_URL, ATCMI, EDDY_URL]:
+            btctrl.data_received(packet)
+        btctrl.connection_lost(None)
+        return [result["url"] async for _, _, result in btctrl.pipeline]
+
+    assert asyncio.run(run()) == ["https://makecode.com/#about"] * 2
@@ -19,5 +19,79 @@ class MacAddr(unittest.TestCase):
         self.assertEqual(b"\x1f\x02\x01\x00", new_data)
 
 
+class MemoryviewDecode(unittest.TestCase):
+    def test_decode(self):
+        data = b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x10\xf6\x03makecode\x00#about\xb5"
+        from_bytes = aioblescan.HCI_Event()
+        from_bytes.decode(data)
+        from_view = aioblescan.HCI_Event()
+        from_view.decode(memoryview(data))
+        self.assertEqual(data, from_view.raw_data)
+        for name in ["peer", "rssi", "Service Data uuid", "Adv Payload"]:
+            self.assertEqual(
+                [x.val for x in from_bytes.retrieve(name)],
+                [x.val for x in from_view.retrieve(name)],
+            )
+        self.assertIsInstance(from_view.retrieve("Adv Payload")[0].val, bytes)
+
+
+class IndexedRetrieve(unittest.TestCase):
+    data = b"\x04>)\x02\x01\x03\x01\xdc)e\x90U\xf1\x1d\x02\x01\x06\x03\x03\xaa\xfe\x15\x16\xaa\xfe\x10\xf6\x03makecode\x00#about\xb5"
+
+    def test_same_as_walk(self):
+        ev = aioblescan.HCI_Event()
+        ev.decode(self.data)
+        with ev.indexed():
+            for what in [
+                "peer",
+                "rssi",
+                "type",
+                "Adv Payload",
+                "nothing",
+                aioblescan.AD_Structure,
+                aioblescan.Itself,
+                aioblescan.Packet,
+            ]:
+                self.assertEqual(
+                    aioblescan.Packet.retrieve(ev, what), ev.retrieve(what), what
+                )
+
+    def test_dropped(self):
+        ev = aioblescan.HCI_Event()
+        ev.decode(self.data)
+        with ev.indexed():
+            self.assertIsNotNone(ev._index)
+            with ev.indexed():
+                pass
+            self.assertIsNotNone(ev._index)
+        self.assertIsNone(ev._index)
+
+    def test_modified(self):
+        ev = aioblescan.HCI_Event()
+        ev.decode(self.data)
+        with ev.indexed():
+            top = ev.retrieve("Adv Payload")[0]
+            found = ev.retrieve("Advertised Data")[0]
+            found.payload.remove(top)
+            self.assertEqual([], ev.retrieve("Adv Payload"))
+            found.payload.append(aioblescan.Itself("Adv Payload"))
+            self.assertEqual(1, len(ev.retrieve("Adv Payload")))
+            self.assertNotEqual([top], ev.retrieve("Adv Payload"))
+        self.assertEqual(1, len(ev.retrieve("Adv Payload")))
+
+    def test_invalidate(self):
+        ev = aioblescan.HCI_Event()
+        ev.decode(self.data)
+        with ev.indexed():
+            found = ev.retrieve("Advertised Data")[0]
+            top = ev.retrieve("Adv Payload")[0]
+            idx = found.payload.index(top)
+            found.payload[idx] = aioblescan.Itself("Other Payload")
+            # Replaced in place, the size is the same
+            self.assertEqual([top], ev.retrieve("Adv Payload"))
+            ev.invalidate_index()
+            self.assertEqual([], ev.retrieve("Adv Payload"))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,50 @@
+import aioblescan as aiobs
+from aioblescan.plugins import EddyStone, ATCMiThermometer
+from .fixtures import make_requester, EDDY_URL, ATCMI
+
+
+class Recorder(aiobs.StageProfiler):
+    def __init__(self, every=0):
+        super().__init__(every)
+        self.stages = []
+        self.reports = 0
+
+    def on_enter(self, stage):
+        self.stages.append(stage)
+
+    def on_report(self):
+        self.reports += 1
+
+
+def test_stages():
+    decoders = [EddyStone(), ATCMiThermometer()]
+    btctrl = make_requester()
+    dispatcher = aiobs.Dispatcher(decoders)
+    btctrl.process = dispatcher.decode
+    profiler = Recorder(every=2)
+    profiler.enable(btctrl, decoders)
+    for packet in [EDDY_URL, ATCMI, ATCMI]:
+        btctrl.data_received(packet)
+    profiler.disable()
+    assert profiler.calls["process"] == 3
+    assert profiler.calls["HCI_Event.decode"] == 3
+    assert profiler.calls["AD_Structure.decode"] == 5
+    assert profiler.calls["EddyStone.decode"] == 1
+    assert profiler.calls["ATCMiThermometer.decode"] == 2
+    assert profiler.stages[:2] == ["process", "HCI_Event.decode"]
+    assert profiler.reports == 1
+    assert "HCI_Event.decode" in profiler.report()
+
+
+def test_disable_restores():
+    decoder = EddyStone()
+    btctrl = make_requester()
+    process = btctrl.process
+    decode = aiobs.HCI_Event.decode
+    profiler = aiobs.StageProfiler()
+    profiler.enable(btctrl, [decoder])
+    assert aiobs.HCI_Event.decode is not decode
+    profiler.disable()
+    assert aiobs.HCI_Event.decode is decode
+    assert btctrl.process == process
+    assert "decode" not in vars(decoder)
@@ -0,0 +1,117 @@
+import aioblescan as aiobs
+from .fixtures import make_requester
+
+PEER = b"\x01\x02\x03\x04\x05\x06"
+NAME = b"\x18\x09" + b"a-rather-long-name-here"
+SVC_DATA = b"\x10\x16\x1a\x18\xa4\xc18@R8\x00\xf3%U\x0b\x9f\xde"
+ADV_DATA = b"\x02\x01\x06" + NAME + SVC_DATA
+
+
+def ext_packet(data, status=aiobs.EXT_ADV_COMPLETE, sid=1, peer=PEER):
+    raw = (
+        bytes([status << 5, 0, 1])
+        + peer
+        + bytes([1, 0, sid, 0x7F, 0xC0, 0, 0, 0])
+        + b"\x00" * 6
+        + bytes([len(data)])
+        + data
+    )
+    body = b"\x0d\x01" + raw
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def ext_report(data, status=aiobs.EXT_ADV_COMPLETE, sid=1, peer=PEER):
+    ev = aiobs.HCI_Event()
+    ev.decode(ext_packet(data, status, sid, peer))
+    return ev.retrieve(aiobs.HCI_LEM_Ext_Adv_Report)[0]
+
+
+def fragments(data, sizes, **kwargs):
+    result = []
+    for idx, size in enumerate(sizes):
+        last = idx == len(sizes) - 1
+        status = aiobs.EXT_ADV_COMPLETE if last else aiobs.EXT_ADV_INCOMPLETE
+        result.append(ext_report(data[:size], status, **kwargs))
+        data = data[size:]
+    return result
+
+
+def test_complete_report_passes_through():
+    reassembler = aiobs.ExtAdvReassembler()
+    report = ext_report(ADV_DATA)
+    assert report.retrieve("Complete Name")[0].val == b"a-rather-long-name-here"
+    assert reassembler.feed(report) is report
+
+
+def test_reassemble():
+    reassembler = aiobs.ExtAdvReassembler()
+    first, second, last = fragments(ADV_DATA, [10, 15, 100])
+    assert first.retrieve("Adv Data Fragment")[0].val == ADV_DATA[:10]
+    assert reassembler.feed(first, now=0) is None
+    assert reassembler.feed(second, now=0.1) is None
+    result = reassembler.feed(last, now=0.2)
+    assert result.ad_data == ADV_DATA
+    assert result.data_status == aiobs.EXT_ADV_COMPLETE
+    assert result.retrieve("peer")[0].val == "06:05:04:03:02:01"
+    assert result.retrieve("Complete Name")[0].val == b"a-rather-long-name-here"
+    assert result.retrieve("Service Data uuid")[0].val == b"\x18\x1a"
+    assert len(reassembler) == 0
+
+
+def test_interleaved_chains():
+    reassembler = aiobs.ExtAdvReassembler()
+    chain_a = fragments(ADV_DATA, [20, 100], sid=1)
+    chain_b = fragments(ADV_DATA, [5, 100], sid=2)
+    assert reassembler.feed(chain_a[0], now=0) is None
+    assert reassembler.feed(chain_b[0], now=0) is None
+    assert reassembler.feed(chain_b[1], now=0).ad_data == ADV_DATA
+    assert reassembler.feed(chain_a[1], now=0).ad_data == ADV_DATA
+
+
+def test_timeout():
+    reassembler = aiobs.ExtAdvReassembler(timeout=1)
+    first, last = fragments(ADV_DATA, [20, 100])
+    assert reassembler.feed(first, now=0) is None
+    # Too late, the chain was dropped, the last fragment is passed as is
+    assert reassembler.feed(last, now=5) is last
+    assert reassembler.evicted == 1
+
+
+def test_bounded():
+    reassembler = aiobs.ExtAdvReassembler(max_chains=4)
+    for sid in range(10):
+        reassembler.feed(fragments(ADV_DATA, [20, 100], sid=sid)[0], now=0)
+    assert len(reassembler) == 4
+    assert reassembler.evicted == 6
+    assert len(reassembler._buffers) + len(reassembler._chains) <= 4
+
+
+def test_truncated():
+    reassembler = aiobs.ExtAdvReassembler()
+    first = ext_report(ADV_DATA[:10], aiobs.EXT_ADV_INCOMPLETE)
+    last = ext_report(ADV_DATA[10:20], aiobs.EXT_ADV_TRUNCATED)
+    assert reassembler.feed(first) is None
+    result = reassembler.feed(last)
+    assert result.data_status == aiobs.EXT_ADV_TRUNCATED
+    assert result.ad_data == ADV_DATA[:20]
+    assert result.retrieve("flags")
+
+
+def test_requester_paths():
+    packets = [
+        ext_packet(ADV_DATA[:10], aiobs.EXT_ADV_INCOMPLETE),
+        ext_packet(ADV_DATA[10:]),
+    ]
+    btctrl = make_requester()
+    btctrl.reassembler = aiobs.ExtAdvReassembler()
+    batches = []
+    btctrl.process_batch = batches.append
+    btctrl._handle_packets(packets)
+    assert [x.ad_data for x in batches[0]] == [ADV_DATA]
+    # process gets the raw packets, fragments included
+    btctrl.process_batch = None
+    received = []
+    btctrl.process = received.append
+    for packet in packets:
+        btctrl.data_received(packet)
+    assert received == packets
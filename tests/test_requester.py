@@ -0,0 +1,391 @@
+import asyncio
+import platform
+import pytest
+import aioblescan as aiobs
+from .fixtures import EDDY_URL, ATCMI, CMD_COMPLETE, FakeTransport, cmd_complete
+from .fixtures import cmd_status, make_requester, answer_commands
+
+
+def test_batch():
+    async def run():
+        btctrl = make_requester()
+        batches = []
+        others = []
+        btctrl.process_batch = batches.append
+        btctrl.process = others.append
+        btctrl.batch_delay = 0.01
+        for packet in [EDDY_URL, CMD_COMPLETE, ATCMI, b"\x04>\x05\x02\x01"]:
+            btctrl.data_received(packet)
+        assert batches == []
+        await asyncio.sleep(0.05)
+        return btctrl, batches, others
+
+    btctrl, batches, others = asyncio.run(run())
+    assert len(batches) == 1
+    assert [x.retrieve("peer")[0].val for x in batches[0]] == [
+        "f1:55:90:65:29:dc",
+        "a4:c1:38:40:52:38",
+    ]
+    assert others == [CMD_COMPLETE]
+    assert btctrl.decode_errors == 1
+
+
+def test_batch_size():
+    async def run():
+        btctrl = make_requester()
+        batches = []
+        btctrl.process_batch = batches.append
+        btctrl.batch_size = 2
+        for packet in [EDDY_URL, ATCMI, EDDY_URL]:
+            btctrl.data_received(packet)
+        assert [len(x) for x in batches] == [2]
+        await asyncio.sleep(0.05)
+        return batches
+
+    assert [len(x) for x in asyncio.run(run())] == [2, 1]
+
+
+def test_hci_filter():
+    flt = aiobs.hci_filter((aiobs.HCI_EVENT,), (0x0E, 0x3E))
+    assert aiobs.hci_filter_match(flt, EDDY_URL)
+    assert aiobs.hci_filter_match(flt, CMD_COMPLETE)
+    assert not aiobs.hci_filter_match(flt, b"\x04\x13\x05\x01\x40\x00\x01\x00")
+    assert not aiobs.hci_filter_match(flt, b"\x02\x40\x20\x00\x00")
+    flt = aiobs.hci_filter((aiobs.HCI_EVENT,), (0x0E,), 0x200C)
+    assert aiobs.hci_filter_match(flt, CMD_COMPLETE)
+    assert not aiobs.hci_filter_match(flt, cmd_complete(0x1002, b"\x00"))
+
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="Linux socket filter")
+def test_kernel_filter():
+    async def run():
+        btctrl = aiobs.BLEScanRequester()
+        btctrl.kernel_filter = True
+        transport = FakeTransport()
+        btctrl.connection_made(transport)
+        btctrl.data_received(cmd_complete(0x1002, b"\x00" * 65))
+        btctrl.data_received(cmd_complete(0x2003, b"\x00" * 9))
+        assert btctrl._initialized.is_set()
+        scan_filter = aiobs.hci_filter((aiobs.HCI_EVENT,), (0x3E,))
+        assert transport.socket.filters == [scan_filter]
+        await btctrl.send_command(aiobs.HCI_Cmd_LE_Scan_Enable(False, False))
+        assert aiobs.hci_filter_match(transport.socket.filters[-1], EDDY_URL)
+        assert aiobs.hci_filter_match(transport.socket.filters[-1], CMD_COMPLETE)
+        btctrl.data_received(CMD_COMPLETE)
+        assert transport.socket.filters[-1] == scan_filter
+        assert len(transport.socket.filters) == 3
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="Linux socket filter")
+def test_kernel_filter_lost_answer():
+    async def run():
+        btctrl = make_requester()
+        btctrl.kernel_filter = True
+        btctrl.command_timeout = 0.01
+        transport = btctrl.transport
+        await btctrl.send_command(aiobs.HCI_Cmd_LE_Scan_Enable(False, False))
+        assert aiobs.hci_filter_match(transport.socket.filters[-1], CMD_COMPLETE)
+        # The answer never comes
+        await asyncio.sleep(0.05)
+        assert btctrl._pending_commands == 0
+        assert not aiobs.hci_filter_match(transport.socket.filters[-1], CMD_COMPLETE)
+
+    asyncio.run(run())
+
+
+def test_short_packets():
+    for btctrl in [make_requester(), aiobs.BLEScanRequester()]:
+        if btctrl.transport is None:
+            btctrl.connection_made(FakeTransport())
+        processed = []
+        btctrl.process = processed.append
+        for packet in [b"", b"\x04"]:
+            btctrl.data_received(packet)
+        assert processed == []
+        assert btctrl.decode_errors == 2
+
+
+@pytest.mark.parametrize(
+    "overflow, expected",
+    [
+        (aiobs.DROP_OLDEST, ["a4:c1:38:40:52:38", "f1:55:90:65:29:dc"]),
+        (aiobs.DROP_NEWEST, ["f1:55:90:65:29:dc", "a4:c1:38:40:52:38"]),
+    ],
+)
+def test_reports_drop(overflow, expected):
+    async def run():
+        btctrl = make_requester()
+        queue = btctrl.reports(maxsize=2, overflow=overflow)
+        for packet in [EDDY_URL, ATCMI, EDDY_URL]:
+            btctrl.data_received(packet)
+        btctrl.connection_lost(None)
+        return queue, [x.retrieve("peer")[0].val async for x in queue]
+
+    queue, macs = asyncio.run(run())
+    assert macs == expected
+    assert queue.dropped == 1
+
+
+def test_reports_pause():
+    async def run():
+        btctrl = make_requester()
+        received = []
+        queue = btctrl.reports(maxsize=4, overflow=aiobs.PAUSE)
+
+        async def consumer():
+            async for report in queue:
+                received.append(report)
+                if len(received) == 3:
+                    assert not btctrl.transport.paused
+
+        task = asyncio.ensure_future(consumer())
+        for packet in [EDDY_URL] * 5:
+            btctrl.data_received(packet)
+        assert btctrl.transport.paused
+        await asyncio.sleep(0)
+        btctrl.connection_lost(None)
+        await task
+        return received
+
+    assert len(asyncio.run(run())) == 5
+
+
+def test_reports_pause_shared():
+    async def run():
+        btctrl = make_requester()
+        first = btctrl.reports(maxsize=2, overflow=aiobs.PAUSE)
+        second = btctrl.reports(maxsize=2, overflow=aiobs.PAUSE)
+        for packet in [EDDY_URL] * 3:
+            btctrl.data_received(packet)
+        assert btctrl.transport.paused
+        # The other queue is still full
+        for _ in range(3):
+            await first.__anext__()
+        assert btctrl.transport.paused
+        for _ in range(2):
+            await second.__anext__()
+        assert not btctrl.transport.paused
+        # Closing a paused queue resumes too
+        for packet in [EDDY_URL] * 3:
+            btctrl.data_received(packet)
+        first.close()
+        assert btctrl.transport.paused
+        second.close()
+        assert not btctrl.transport.paused
+
+    asyncio.run(run())
+
+
+def test_accept_list_commands():
+    mac = b"\x38\x52\x40\x38\xc1\xa4"
+    command = aiobs.HCI_Cmd_LE_Add_Device_To_Accept_List("a4:c1:38:40:52:38", 1)
+    assert command.encode() == b"\x01\x11\x20\x07\x01" + mac
+    command = aiobs.HCI_Cmd_LE_Remove_Device_From_Accept_List("a4:c1:38:40:52:38")
+    assert command.encode() == b"\x01\x12\x20\x07\x00" + mac
+    assert aiobs.HCI_Cmd_LE_Clear_Accept_List().encode() == b"\x01\x10\x20\x00"
+    assert aiobs.HCI_Cmd_LE_Read_Accept_List_Size().encode() == b"\x01\x0f\x20\x00"
+
+
+def test_accept_list_scan():
+    async def answered(btctrl, coro, opcode):
+        task = asyncio.ensure_future(coro)
+        await asyncio.sleep(0)
+        btctrl.data_received(cmd_complete(opcode, b"\x00"))
+        return await task
+
+    async def run():
+        btctrl = make_requester()
+        btctrl.transport.written.clear()
+        await answered(btctrl, btctrl.clear_accept_list(), 0x2010)
+        await answered(btctrl, btctrl.add_to_accept_list("a4:c1:38:40:52:38"), 0x2011)
+        ev = await answered(
+            btctrl, btctrl.remove_from_accept_list("a4:c1:38:40:52:38", 1), 0x2012
+        )
+        assert ev.retrieve("resp code")[0].val == b"\x00"
+        await btctrl.send_scan_request(accept_list=True, filter_dups=True)
+        return btctrl.transport.written
+
+    written = asyncio.run(run())
+    assert [x[1:3] for x in written] == [
+        b"\x10\x20",
+        b"\x11\x20",
+        b"\x12\x20",
+        b"\x0b\x20",
+        b"\x0c\x20",
+    ]
+    # Filter policy, and duplicate filtering
+    assert written[3][-1] == 1
+    assert written[4][-2:] == b"\x01\x01"
+
+
+def test_fill_accept_list():
+    from aioblescan.__main__ import fill_accept_list
+
+    async def run(status):
+        btctrl = make_requester()
+        written = btctrl.transport.written
+        written.clear()
+        answer_commands(btctrl, {0x2011: status})
+        macs = ["a4:c1:38:40:52:38", "f1:55:90:65:29:dc", "a4:c1:38:40:52:38"]
+        failed = await fill_accept_list(btctrl, macs)
+        return failed, written
+
+    failed, written = asyncio.run(run(0))
+    assert failed is None
+    # Cleared, then each device once as public and once as random
+    assert [x[1:3] for x in written] == [b"\x10\x20"] + [b"\x11\x20"] * 4
+    assert [x[4] for x in written[1:]] == [0, 1, 0, 1]
+    failed, written = asyncio.run(run(7))
+    assert failed == "Could not add a4:c1:38:40:52:38 to the accept list, error 0x07"
+    assert len(written) == 2
+
+
+def test_dups_reset():
+    async def run():
+        btctrl = make_requester()
+        btctrl._supported_commands[37] = 0x60
+        btctrl.transport.written.clear()
+        # The resets wait for the answer to each command
+        answer_commands(btctrl)
+        await btctrl.send_scan_request(filter_dups=True, dups_reset=0.02)
+        await asyncio.sleep(0.05)
+        await btctrl.stop_scan_request()
+        count = len(btctrl.transport.written)
+        await asyncio.sleep(0.05)
+        assert len(btctrl.transport.written) == count
+        return btctrl.transport.written
+
+    written = asyncio.run(run())
+    enable = [x for x in written if x[1:3] == b"\x42\x20"]
+    assert [x[4:6] for x in enable] == [
+        b"\x01\x01",
+        b"\x00\x00",
+        b"\x01\x01",
+        b"\x00\x00",
+        b"\x01\x01",
+        b"\x00\x00",
+    ]
+
+
+def test_dups_reset_waits():
+    async def run():
+        btctrl = make_requester()
+        written = btctrl.transport.written
+        await btctrl.send_scan_request(filter_dups=True, dups_reset=0.05)
+        written.clear()
+        await asyncio.sleep(0.08)
+        # Scanning is only enabled again once disabling it was answered
+        assert [x[4:6] for x in written] == [b"\x00\x00"]
+        btctrl.data_received(cmd_complete(0x200C, b"\x00"))
+        await asyncio.sleep(0.01)
+        assert [x[4:6] for x in written] == [b"\x00\x00", b"\x01\x01"]
+        await btctrl.stop_scan_request()
+
+    asyncio.run(run())
+
+
+def test_execute():
+    async def run():
+        btctrl = make_requester()
+        written = btctrl.transport.written
+        written.clear()
+        first = asyncio.ensure_future(btctrl.execute(aiobs.HCI_Cmd_Reset()))
+        second = asyncio.ensure_future(
+            btctrl.execute(aiobs.HCI_Cmd_LE_Scan_Enable(True, False))
+        )
+        await asyncio.sleep(0)
+        # A single credit, the second command waits
+        assert len(written) == 1
+        btctrl.data_received(cmd_complete(0x0C03, b"\x00"))
+        ev = await first
+        assert ev.retrieve("resp code")[0].val == b"\x00"
+        assert len(written) == 2
+        btctrl.data_received(cmd_status(0x200C, status=0x0C))
+        ev = await second
+        assert ev.retrieve("status")[0].val == 0x0C
+        return written
+
+    written = asyncio.run(run())
+    assert [x[1:3] for x in written] == [b"\x03\x0c", b"\x0c\x20"]
+
+
+def test_execute_credits():
+    async def run():
+        btctrl = make_requester()
+        written = btctrl.transport.written
+        # The controller tells it can take 3 commands
+        btctrl.data_received(b"\x04\x0e\x03\x03\x00\x00")
+        written.clear()
+        tasks = [
+            asyncio.ensure_future(btctrl.execute(aiobs.HCI_Cmd_LE_Advertise(False)))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        assert len(written) == 3
+        for _ in range(5):
+            btctrl.data_received(cmd_complete(0x200A, b"\x00"))
+        await asyncio.gather(*tasks)
+        return written
+
+    assert len(asyncio.run(run())) == 5
+
+
+def test_execute_timeout():
+    async def run():
+        btctrl = make_requester()
+        written = btctrl.transport.written
+        written.clear()
+        first = asyncio.ensure_future(btctrl.execute(aiobs.HCI_Cmd_Reset(), 0.02))
+        second = asyncio.ensure_future(btctrl.execute(aiobs.HCI_Cmd_Reset(), 1))
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        # The unanswered command does not block the next one
+        assert len(written) == 2
+        btctrl.data_received(cmd_complete(0x0C03, b"\x00"))
+        await second
+        third = asyncio.ensure_future(btctrl.execute(aiobs.HCI_Cmd_Reset()))
+        await asyncio.sleep(0)
+        btctrl.connection_lost(None)
+        with pytest.raises(ConnectionError):
+            await third
+        return btctrl
+
+    btctrl = asyncio.run(run())
+    assert not btctrl._commands and not btctrl._executing
+
+
+@pytest.mark.parametrize(
+    "packet, category",
+    [
+        (EDDY_URL, aiobs.ADV_REPORT),
+        (b"\x04>\x05\x0d\x00", aiobs.ADV_REPORT),
+        (CMD_COMPLETE, aiobs.COMMAND_COMPLETE),
+        (b"\x04\x0f\x04\x00\x01\x0c\x20", aiobs.COMMAND_COMPLETE),
+        (b"\x04\x05\x04\x00\x40\x00\x13", aiobs.DISCONNECT),
+        (b"\x04\xff\x02\x01\x02", aiobs.VENDOR),
+        (b"\x05\x01\x02", aiobs.VENDOR),
+        (b"\x04>\x13\x01\x00", aiobs.OTHER),
+        (b"\x04\x13\x05\x01\x40\x00\x01\x00", aiobs.OTHER),
+        (b"\x04", aiobs.OTHER),
+    ],
+)
+def test_packet_category(packet, category):
+    assert aiobs.packet_category(packet) == category
+
+
+def test_routes():
+    btctrl = make_requester()
+    processed = []
+    disconnected = []
+    btctrl.process = processed.append
+    btctrl.routes[aiobs.COMMAND_COMPLETE] = None
+    btctrl.routes[aiobs.DISCONNECT] = disconnected.append
+    btctrl._pending_commands = 1
+    for packet in [EDDY_URL, CMD_COMPLETE, b"\x04\x05\x04\x00\x40\x00\x13", ATCMI]:
+        btctrl.data_received(packet)
+    assert processed == [EDDY_URL, ATCMI]
+    assert disconnected == [b"\x04\x05\x04\x00\x40\x00\x13"]
+    # Dropped, but still counted as an answer
+    assert btctrl._pending_commands == 0
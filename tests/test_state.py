@@ -0,0 +1,108 @@
+import aioblescan as aiobs
+from .fixtures import make_requester, EDDY_URL, ATCMI
+from .test_reassembly import ext_report
+from aioblescan.plugins import ATCMiThermometer, EddyStone
+
+# Same device, another temperature
+ATCMI_2 = b"\x04>\x1d\x02\x01\x00\x008R@8\xc1\xa4\x11\x10\x16\x1a\x18\xa4\xc18@R8\x01\x08\x1aU\x0b\x9f\xe0\xd5"
+MAC = "a4:c1:38:40:52:38"
+
+
+def test_changes_only():
+    table = aiobs.DeviceTable(heartbeat=10)
+    assert table.update(MAC, b"\x01", now=0)
+    assert not table.update(MAC, b"\x01", now=1)
+    assert table.update(MAC, b"\x02", now=2)
+    assert not table.update(MAC, b"\x02", now=11)
+    # Heartbeat
+    assert table.update(MAC, b"\x02", now=12)
+    assert (table.emitted, table.suppressed) == (3, 2)
+    table.set_result(MAC, {"temperature": 24.3}, now=13)
+    assert table.get(MAC) == (b"\x02", {"temperature": 24.3}, 13)
+    # A device only known from its result
+    table.set_result("00:00:00:00:00:01", 1, now=14)
+    assert table.get("00:00:00:00:00:01") == (None, 1, 14)
+    assert table.update("00:00:00:00:00:01", b"\x01", now=15)
+
+
+def test_ttl():
+    table = aiobs.DeviceTable(ttl=5)
+    table.update(MAC, b"\x01", now=0)
+    table.update("00:00:00:00:00:01", b"\x01", now=3)
+    table.expire(now=6)
+    assert MAC not in table
+    assert len(table) == 1
+    assert table.evicted == 1
+
+
+def test_lru():
+    table = aiobs.DeviceTable(max_devices=2)
+    table.update("00:00:00:00:00:01", b"\x01", now=0)
+    table.update("00:00:00:00:00:02", b"\x01", now=1)
+    table.update("00:00:00:00:00:01", b"\x01", now=2)
+    table.update("00:00:00:00:00:03", b"\x01", now=3)
+    assert "00:00:00:00:00:02" not in table
+    assert "00:00:00:00:00:01" in table
+    assert table.evicted == 1
+
+
+def test_requester_state_table():
+    btctrl = make_requester()
+    batches = []
+    btctrl.process_batch = batches.append
+    btctrl.state_table = aiobs.DeviceTable()
+    btctrl._handle_packets([ATCMI, EDDY_URL, ATCMI[:-1] + b"\xc0", ATCMI_2])
+    assert [x.retrieve("peer")[0].val for x in batches[0]] == [
+        MAC,
+        "f1:55:90:65:29:dc",
+        MAC,
+    ]
+    assert btctrl.state_table.suppressed == 1
+
+
+def legacy(ev_type, data, rssi=b"\xc0"):
+    body = b"\x02\x01" + bytes([ev_type]) + b"\x00\x01\x02\x03\x04\x05\x06"
+    body += bytes([len(data)]) + data + rssi
+    return b"\x04>" + bytes([len(body)]) + body
+
+
+def test_scan_response():
+    adv = legacy(0, b"\x02\x01\x06\x03\x03\xaa\xfe")
+    rsp = legacy(4, b"\x05\x09test")
+    btctrl = make_requester()
+    batches = []
+    btctrl.process_batch = batches.append
+    btctrl.state_table = aiobs.DeviceTable()
+    btctrl._handle_packets([adv, rsp, adv, rsp, adv[:-1] + b"\xb0", rsp])
+    assert [x.payload[0].val for x in batches[0]] == [0, 4]
+    assert btctrl.state_table.suppressed == 4
+    assert len(btctrl.state_table) == 2
+    assert ("06:05:04:03:02:01", 4) in btctrl.state_table
+
+
+def test_report_source():
+    adv = aiobs.adv_reports(legacy(0, b"\x02\x01\x06"))[0]
+    assert aiobs.report_source(adv) == ("06:05:04:03:02:01", 0)
+
+
+def test_advertising_sets():
+    table = aiobs.DeviceTable()
+    reports = [ext_report(b"\x02\x01\x06", sid=1), ext_report(b"\x03\x09ab", sid=2)]
+    assert table.filter(reports * 3, now=0) == reports
+    assert aiobs.report_source(reports[1]) == ("06:05:04:03:02:01", 0, 2)
+
+
+def test_dispatcher_results():
+    table = aiobs.DeviceTable()
+    cache = aiobs.DecodeCache()
+    dispatcher = aiobs.Dispatcher(
+        [EddyStone(), ATCMiThermometer()], cache=cache, state_table=table
+    )
+    dispatcher.decode(ATCMI)
+    assert table.get((MAC, 0))[1]["temperature"] == 24.3
+    # From the cache too
+    dispatcher.decode(ATCMI_2)
+    dispatcher.decode(ATCMI)
+    assert cache.hits == 1
+    assert table.get((MAC, 0))[1]["temperature"] == 24.3
+    assert table.get((MAC, 0))[0] is None
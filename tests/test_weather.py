@@ -1,5 +1,26 @@
 import unittest
-from aioblescan.plugins.ruuviweather import get_temp
+import aioblescan as aios
+from aioblescan.plugins import RuuviWeather
+from aioblescan.plugins.ruuviweather import get_temp, decode_rawv2
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# From the RuuviTag data format 5 specification: valid, maximum and minimum values
+RAWV2_VECTORS = [
+    "0512FC5394C37C0004FFFC040CAC364200CDCBB8334C884F",
+    "057FFFFFFEFFFE7FFF7FFF7FFFFFDEFEFFFECBB8334C884F",
+    "058001000000008001800180010000000000CBB8334C884F",
+]
+
+
+def rawv2_packet(payload):
+    ad = b"\x02\x01\x06" + bytes([len(payload) + 3, 0xFF, 0x99, 0x04]) + payload
+    report = b"\x00\x01\x4f\x88\x4c\x33\xb8\xcb" + bytes([len(ad)]) + ad + b"\xc0"
+    body = b"\x02\x01" + report
+    return b"\x04>" + bytes([len(body)]) + body
 
 
 class Weather(unittest.TestCase):
@@ -9,5 +30,33 @@ class Weather(unittest.TestCase):
             self.assertEqual(result, get_temp(inter, fract))
 
 
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class WeatherBatch(unittest.TestCase):
+    def test_same_as_decode(self):
+        payloads = [bytes.fromhex(x) for x in RAWV2_VECTORS]
+        columns = decode_rawv2(payloads)
+        for payload, row in zip(payloads, columns):
+            ev = aios.HCI_Event()
+            ev.decode(rawv2_packet(payload))
+            expected = RuuviWeather().decode(ev)
+            self.assertEqual(row["temperature"], expected["temperature"])
+            self.assertEqual(row["humidity"], expected["humidity"])
+            self.assertEqual(row["pressure"], expected["pressure"])
+            accel = (row["accel_x"], row["accel_y"], row["accel_z"], row["accel"])
+            self.assertEqual(accel, expected["accelerometer"])
+            self.assertEqual(row["voltage"], expected["voltage"])
+            self.assertEqual(row["tx_power"], expected["tx_power"])
+            self.assertEqual(row["move count"], expected["move count"])
+            self.assertEqual(row["sequence"], expected["sequence"])
+        self.assertAlmostEqual(columns["temperature"][0], 24.3)
+        self.assertEqual(columns["voltage"][0], 2977)
+
+    def test_not_rawv2(self):
+        with self.assertRaises(ValueError):
+            decode_rawv2([bytes.fromhex(RAWV2_VECTORS[0])[:20]])
+        with self.assertRaises(ValueError):
+            decode_rawv2([b"\x03" + bytes.fromhex(RAWV2_VECTORS[0])[1:]])
+
+
 if __name__ == "__main__":
     unittest.main()